@@ -0,0 +1,274 @@
+"""
+Incremental analytics over stored selection results.
+
+`StudyAnalytics` folds the records of a study's results log (see
+`StorageBackend.read_results`) into running aggregates:
+
+- per-(case, item) selection counts and the reviewers who selected the item,
+- per-case inter-reviewer agreement (mean pairwise Jaccard similarity of the
+  item sets that reviewers selected for the case),
+- per-user totals (records, distinct cases, items selected).
+
+Only records after the saved cursor (a byte offset into
+`stored_results.txt` for the JSON backend) are read on each `refresh`, so a
+refresh costs only what was appended since the previous one, and reviewer
+counts, per-user totals, and the study-wide agreement are updated as
+records are folded rather than recomputed for each `summary`. The
+aggregates and cursor are checkpointed to `stored_results.analytics.json`
+in the study folder once `checkpoint_records` records or
+`checkpoint_interval` seconds have accumulated, so a restarted process
+resumes close to where the last one stopped and refolds the rest. Records
+written with the older `selected_ids` field are accepted alongside
+`selected_items`.
+"""
+
+import logging
+import os
+import threading
+import time
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional
+
+from . import jsoncodec
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FILENAME = 'stored_results.analytics.json'
+
+#: Records folded per `read_results` call while catching up.
+REFRESH_BATCH = 10000
+
+#: Default records folded, or seconds elapsed, before the checkpoint is rewritten.
+CHECKPOINT_RECORDS = 1000
+CHECKPOINT_INTERVAL = 60.0
+
+
+def record_items(record: Dict) -> List[str]:
+    """Return a result record's selected items under either field name."""
+    items = record.get('selected_items')
+    if items is None:
+        items = record.get('selected_ids')
+    return [item for item in items or [] if isinstance(item, str)]
+
+
+def jaccard(a: set, b: set) -> float:
+    """Jaccard similarity of two sets (1.0 when both are empty)."""
+    union = a | b
+    return len(a & b) / len(union) if union else 1.0
+
+
+class StudyAnalytics:
+    """Running selection aggregates for one study, refreshed incrementally.
+
+    Parameters
+    ----------
+    study_id: str
+    study_dir: str
+        Folder where the checkpoint file is kept.
+    read_results: callable
+        `read_results(study_id, cursor, limit) -> (records, cursor)`, usually
+        the storage backend's method.
+    backend_name: str
+        Recorded in the checkpoint; a checkpoint from another backend (whose
+        cursors mean something else) is discarded.
+    checkpoint_records, checkpoint_interval: int, float
+        A refresh rewrites the checkpoint once at least this many records
+        were folded, or this many seconds passed, since it was last written.
+    """
+
+    def __init__(self, study_id: str, study_dir: str, read_results, backend_name: str = 'json',
+                 checkpoint_records: int = CHECKPOINT_RECORDS, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.study_id = study_id
+        self.checkpoint_path = os.path.join(study_dir, CHECKPOINT_FILENAME)
+        self._read_results = read_results
+        self.backend_name = backend_name
+        self.checkpoint_records = checkpoint_records
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._reset()
+        self._load_checkpoint()
+        self._checkpointed_records = self.records
+        self._checkpointed_at = time.monotonic()
+
+    def _reset(self) -> None:
+        self.cursor = 0
+        self.records = 0
+        self.item_counts: Dict[str, Dict[str, int]] = {}
+        self.user_items: Dict[str, Dict[str, set]] = {}  # case_id -> user_id -> items
+        self.user_records: Dict[str, int] = {}
+        self.item_reviewers: Dict[str, Dict[str, int]] = {}  # case_id -> item -> distinct users
+        self.user_totals: Dict[str, Dict[str, int]] = {}  # user_id -> records, cases, items
+        self._agreement: Dict[str, Dict] = {}
+        self._dirty_cases: set = set()
+        self._jaccard_sum = 0.0
+        self._jaccard_cases = 0
+
+    # -- folding -----------------------------------------------------------------
+
+    def _fold(self, records: Iterable[Dict]) -> None:
+        for record in records:
+            user_id, case_id = record.get('user_id'), record.get('case_id')
+            if not isinstance(user_id, str) or not isinstance(case_id, str):
+                continue
+            self.records += 1
+            self.user_records[user_id] = self.user_records.get(user_id, 0) + 1
+            self._fold_items(case_id, user_id, record_items(record))
+            self.user_totals[user_id]['records'] += 1
+
+    def _fold_items(self, case_id: str, user_id: str, items: List[str]) -> None:
+        """Count `items` as selected by `user_id` in `case_id` once more."""
+        counts = self.item_counts.setdefault(case_id, {})
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+        reviewers = self.user_items.setdefault(case_id, {})
+        totals = self.user_totals.setdefault(user_id, {'records': 0, 'cases': 0, 'items': 0})
+        selected = reviewers.get(user_id)
+        if selected is None:
+            selected = reviewers[user_id] = set()
+            totals['cases'] += 1
+        item_reviewers = self.item_reviewers.setdefault(case_id, {})
+        for item in items:
+            if item not in selected:
+                selected.add(item)
+                item_reviewers[item] = item_reviewers.get(item, 0) + 1
+                totals['items'] += 1
+        self._dirty_cases.add(case_id)
+
+    def refresh(self) -> int:
+        """Fold newly stored results into the aggregates; returns how many."""
+        with self._lock:
+            folded = 0
+            while True:
+                records, cursor = self._read_results(self.study_id, self.cursor, REFRESH_BATCH)
+                if cursor < self.cursor:
+                    logger.info("Results for '%s' were replaced; recomputing analytics", self.study_id)
+                    self._reset()
+                    continue
+                self._fold(records)
+                folded += len(records)
+                moved = cursor != self.cursor
+                self.cursor = cursor
+                if not records or not moved:
+                    break
+            if self._checkpoint_due():
+                self._save_checkpoint()
+            return folded
+
+    def _checkpoint_due(self) -> bool:
+        pending = abs(self.records - self._checkpointed_records)
+        if not pending:
+            return False
+        return (pending >= self.checkpoint_records
+                or time.monotonic() - self._checkpointed_at >= self.checkpoint_interval)
+
+    # -- reporting ---------------------------------------------------------------
+
+    def _case_agreement(self, case_id: str) -> Dict:
+        if case_id in self._dirty_cases or case_id not in self._agreement:
+            reviewers = self.user_items.get(case_id, {})
+            scores = [jaccard(a, b) for a, b in combinations(reviewers.values(), 2)]
+            previous = self._agreement.get(case_id, {}).get('mean_jaccard')
+            if previous is not None:
+                self._jaccard_sum -= previous
+                self._jaccard_cases -= 1
+            if scores:
+                self._jaccard_sum += sum(scores) / len(scores)
+                self._jaccard_cases += 1
+            self._agreement[case_id] = {
+                'reviewers': len(reviewers),
+                'pairs': len(scores),
+                'mean_jaccard': sum(scores) / len(scores) if scores else None,
+            }
+            self._dirty_cases.discard(case_id)
+        return self._agreement[case_id]
+
+    def summary(self, case_ids: Optional[Iterable[str]] = None) -> Dict:
+        """Return the aggregates, optionally limited to `case_ids`.
+
+        Item entries carry `selections` (records that included the item) and
+        `reviewers` (distinct users who selected it). Agreement is only
+        defined for cases with at least two reviewers; `mean_jaccard` at the
+        top level averages those cases.
+        """
+        with self._lock:
+            cases = sorted(self.item_counts) if case_ids is None else [c for c in case_ids if c in self.item_counts]
+            per_case = {}
+            for case_id in cases:
+                reviewers = self.item_reviewers.get(case_id, {})
+                per_case[case_id] = {
+                    'items': {
+                        item: {'selections': count, 'reviewers': reviewers.get(item, 0)}
+                        for item, count in sorted(self.item_counts[case_id].items())
+                    },
+                    'agreement': self._case_agreement(case_id),
+                }
+            for case_id in list(self._dirty_cases):
+                self._case_agreement(case_id)
+            return {
+                'study_id': self.study_id,
+                'records': self.records,
+                'cursor': self.cursor,
+                'cases': per_case,
+                'mean_jaccard': self._jaccard_sum / self._jaccard_cases if self._jaccard_cases else None,
+                'users': {user_id: dict(totals) for user_id, totals in sorted(self.user_totals.items())},
+            }
+
+    # -- checkpointing -----------------------------------------------------------
+
+    def _save_checkpoint(self) -> None:
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'backend': self.backend_name,
+            'cursor': self.cursor,
+            'records': self.records,
+            'item_counts': self.item_counts,
+            'user_items': {case_id: {user_id: sorted(items) for user_id, items in reviewers.items()}
+                           for case_id, reviewers in self.user_items.items()},
+            'user_records': self.user_records,
+        }
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                file.write(jsoncodec.dumps(state))
+            os.replace(tmp_path, self.checkpoint_path)
+        except OSError:
+            logger.warning("Could not write analytics checkpoint %s", self.checkpoint_path)
+            return
+        self._checkpointed_records = self.records
+        self._checkpointed_at = time.monotonic()
+
+    def _load_checkpoint(self) -> None:
+        try:
+            with open(self.checkpoint_path, 'rb') as file:
+                state = jsoncodec.loads(file.read())
+        except (OSError, ValueError):
+            return
+        if state.get('version') != CHECKPOINT_VERSION or state.get('backend') != self.backend_name:
+            return
+        self.cursor = state['cursor']
+        self.records = state['records']
+        self.user_records = state['user_records']
+        for case_id, reviewers in state['user_items'].items():
+            for user_id, items in reviewers.items():
+                self._fold_items(case_id, user_id, items)
+        self.item_counts = state['item_counts']
+        for user_id, count in self.user_records.items():
+            self.user_totals.setdefault(user_id, {'records': 0, 'cases': 0, 'items': 0})['records'] = count
+
+
+_analytics: Dict[tuple, StudyAnalytics] = {}
+_analytics_lock = threading.Lock()
+
+
+def get_study_analytics(study_id: str, study_dir: str, backend,
+                        checkpoint_records: int = CHECKPOINT_RECORDS,
+                        checkpoint_interval: float = CHECKPOINT_INTERVAL) -> StudyAnalytics:
+    """Return the process-wide `StudyAnalytics` for a study and storage backend."""
+    key = (backend.name, os.path.abspath(study_dir))
+    with _analytics_lock:
+        analytics = _analytics.get(key)
+        if analytics is None:
+            analytics = _analytics[key] = StudyAnalytics(study_id, study_dir, backend.read_results, backend.name,
+                                                         checkpoint_records, checkpoint_interval)
+        return analytics
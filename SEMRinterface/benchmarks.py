@@ -0,0 +1,285 @@
+"""
+Microbenchmarks for the service layer and the views that wrap it.
+
+`run_benchmarks` generates a synthetic study (see `SEMRinterface.synthetic`)
+for each requested size in a temporary resources directory, never the one
+the server reads, then times the hot service functions
+(`load_json`, `get_case_files`, `load_case_details`, `mark_case_complete`,
+`save_selected_items`) and the JSON views (through Django's test client)
+against it. For every benchmark it records:
+
+- time per call (mean, median, min, p95, standard deviation) over as many
+  calls as fit in `min_time` seconds,
+- throughput in calls per second, and in MB/s for benchmarks that read or
+  return a known number of bytes,
+- allocations of one extra traced call: the peak traced memory during the
+  call and the memory and block count still held after it (`tracemalloc`).
+
+The views read `services.RESOURCES_DIR`, which is fixed when the service
+layer is imported, so `manage.py benchmark` sets `SEMR_RESOURCES_DIR` to its
+temporary directory before importing it; this module therefore imports the
+service layer only when a benchmark runs.
+
+Results are plain dicts that `write_results` stores as JSON, and
+`compare_results` checks them against a stored baseline: a benchmark whose
+median time grew by more than `threshold` (a fraction) is a regression.
+`manage.py benchmark` drives all of this.
+"""
+
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from .journal import get_journal
+from .manifest import refresh_manifests
+from .results_writer import close_all as close_results_writers
+from .synthetic import case_id, generate_study
+
+RESULTS_VERSION = 1
+
+#: Study size presets: cases, users, variables per case, points per series.
+SIZES = {
+    'small': {'cases': 10, 'users': 5, 'variables': 20, 'points': 50},
+    'medium': {'cases': 50, 'users': 20, 'variables': 80, 'points': 200},
+    'large': {'cases': 200, 'users': 50, 'variables': 150, 'points': 400},
+}
+
+
+def measure(func: Callable[[int], Optional[int]], min_time: float = 0.5, min_calls: int = 5,
+            max_calls: int = 10000) -> Dict:
+    """Time `func(call_index)` and trace the allocations of one more call.
+
+    `func` may return the number of bytes it read or produced, which is
+    used for the MB/s figure.
+    """
+    func(0)  # warm-up
+    timings = []
+    processed = 0
+    started = time.perf_counter()
+    while len(timings) < max_calls and (len(timings) < min_calls or time.perf_counter() - started < min_time):
+        call_start = time.perf_counter()
+        nbytes = func(len(timings) + 1)
+        timings.append(time.perf_counter() - call_start)
+        processed += nbytes or 0
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(len(timings) + 1)
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    total = sum(timings)
+    ordered = sorted(timings)
+    return {
+        'calls': len(timings),
+        'mean_s': total / len(timings),
+        'median_s': statistics.median(timings),
+        'min_s': ordered[0],
+        'p95_s': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'calls_per_s': len(timings) / total if total else None,
+        'bytes_per_call': processed / len(timings) if processed else None,
+        'mb_per_s': processed / total / 1e6 if processed and total else None,
+        'alloc_peak_bytes': peak - base_current,
+        'alloc_retained_bytes': current - base_current,
+        'alloc_retained_blocks': retained_blocks,
+    }
+
+
+def _service_benchmarks(study_id: str, resources_dir: str, params: Dict) -> Dict[str, Callable]:
+    from . import services
+
+    study_dir = os.path.join(resources_dir, study_id)
+    cases = [case_id(i) for i in range(params['cases'])]
+    users = [f"user{u}" for u in range(params['users'])]
+    paths = [os.path.join(study_dir, 'cases_all', c, 'observations.json') for c in cases]
+    sizes = [os.path.getsize(p) for p in paths]
+
+    def load_json_cold(i):
+        services.load_json(paths[i % len(paths)], use_cache=False)
+        return sizes[i % len(paths)]
+
+    def load_json_cached(i):
+        services.load_json(paths[i % len(paths)])
+        return sizes[i % len(paths)]
+
+    def get_case_files_cold(i):
+        services.clear_caches()
+        services.get_case_files(study_id, cases[i % len(cases)], resources_dir)
+
+    def get_case_files_cached(i):
+        services.get_case_files(study_id, cases[i % len(cases)], resources_dir)
+
+    def get_case_files_time_step(i):
+        services.get_case_files(study_id, cases[i % len(cases)], resources_dir, time_step=0)
+
+    def get_case_files_panels(i):
+        services.get_case_files(study_id, cases[i % len(cases)], resources_dir, panels=True)
+
+    def load_case_details(i):
+        services.load_case_details(study_id, cases[i % len(cases)], resources_dir)
+
+    def mark_case_complete(i):
+        services.mark_case_complete(study_id, users[i % len(users)], cases[(i // len(users)) % len(cases)],
+                                    resources_dir)
+
+    def save_selected_items(i):
+        services.save_selected_items(study_id, users[i % len(users)], cases[i % len(cases)],
+                                     ['VAR1', 'VAR2', 'medidx0'], resources_dir)
+
+    return {
+        'load_json[cold]': load_json_cold,
+        'load_json[cached]': load_json_cached,
+        'get_case_files[cold]': get_case_files_cold,
+        'get_case_files[cached]': get_case_files_cached,
+        'get_case_files[time_step]': get_case_files_time_step,
+        'get_case_files[panels]': get_case_files_panels,
+        'load_case_details': load_case_details,
+        'mark_case_complete': mark_case_complete,
+        'save_selected_items': save_selected_items,
+    }
+
+
+def _view_benchmarks(study_id: str, params: Dict) -> Dict[str, Callable]:
+    from django.test import Client
+
+    client = Client()
+    cases = [case_id(i) for i in range(params['cases'])]
+    batch = json.dumps({'study_id': study_id, 'cases': cases[:10]})
+
+    def get(path, data, **headers):
+        response = client.get(path, data, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return len(response.content)
+
+    def case_data(query, **headers):
+        return lambda i: get('/api/get_case_data/', dict(query, study_id=study_id, case_id=cases[i % len(cases)]),
+                             **headers)
+
+    def batch_view(i):
+        response = client.post('/api/get_case_data/batch/', batch, content_type='application/json')
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def fetch_cases(i):
+        response = client.post('/select/', {'type': 'fetch_cases', 'study_id': study_id, 'user_id': 'user0'})
+        return len(response.content)
+
+    return {
+        'view:get_case_data': case_data({}),
+        'view:get_case_data[gzip]': case_data({}, accept_encoding='gzip'),
+        'view:get_case_data[time_step]': case_data({'time_step': 1}),
+        'view:get_case_data[panels]': case_data({'panels': 1}),
+        'view:get_case_data_batch[10]': batch_view,
+        'view:select[fetch_cases]': fetch_cases,
+        'view:analytics': lambda i: get('/api/analytics/', {'study_id': study_id}),
+    }
+
+
+def run_benchmarks(sizes: Dict[str, Dict], resources_dir: Optional[str] = None, min_time: float = 0.5,
+                   only: Optional[List[str]] = None, views: bool = True, keep: bool = False,
+                   log: Callable[[str], None] = lambda message: None) -> List[Dict]:
+    """Generate one study per size, benchmark it, and return the result rows.
+
+    Studies are generated in `resources_dir`, by default a new temporary
+    directory. Views read `services.RESOURCES_DIR`, so they are only
+    benchmarked when `resources_dir` is that directory. The generated
+    `benchmark_<size>` studies, and a default temporary directory, are
+    removed afterwards unless `keep` is set.
+    """
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    temporary = resources_dir is None
+    if temporary:
+        resources_dir = tempfile.mkdtemp(prefix='semr-benchmark-')
+    results = []
+    try:
+        # The test client's 'testserver' host must pass the host check.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for size, params in sizes.items():
+                results.extend(_run_size(size, params, resources_dir, min_time, only, views, keep, log))
+    finally:
+        if temporary and not keep:
+            shutil.rmtree(resources_dir, ignore_errors=True)
+    return results
+
+
+def _run_size(size: str, params: Dict, resources_dir: str, min_time: float, only: Optional[List[str]],
+              views: bool, keep: bool, log: Callable[[str], None]) -> List[Dict]:
+    """Generate, benchmark, and (unless `keep`) remove the study for one size."""
+    from . import services
+
+    results = []
+    study_id = f"benchmark_{size}"
+    study_dir = os.path.join(resources_dir, study_id)
+    shutil.rmtree(study_dir, ignore_errors=True)
+    log(f"Generating {study_id}: {params}")
+    generate_study(study_dir, **params)
+    try:
+        benchmarks = _service_benchmarks(study_id, resources_dir, params)
+        if views and os.path.abspath(resources_dir) == os.path.abspath(services.RESOURCES_DIR):
+            benchmarks.update(_view_benchmarks(study_id, params))
+        for name, func in benchmarks.items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            row = dict(measure(func, min_time), name=name, size=size, params=params)
+            log(f"  {name:<32} {row['median_s'] * 1e3:10.3f} ms  {row['calls_per_s'] or 0:10.1f}/s")
+            results.append(row)
+    finally:
+        close_results_writers()
+        journal = get_journal(study_dir)
+        if journal is not None:
+            journal.flush()
+        services.clear_caches()
+        if not keep:
+            shutil.rmtree(study_dir, ignore_errors=True)
+            refresh_manifests(resources_dir)
+    return results
+
+
+def write_results(results: List[Dict], path: str) -> Dict:
+    """Write benchmark rows with environment metadata to `path` as JSON."""
+    document = {
+        'version': RESULTS_VERSION,
+        'created_at': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=2)
+    return document
+
+
+def compare_results(results: List[Dict], baseline: Dict, threshold: float = 0.25) -> List[Dict]:
+    """Return the benchmarks whose median time regressed against `baseline`.
+
+    Rows are matched by `(name, size)`; each regression reports both
+    medians and the relative `change`.
+    """
+    previous = {(row['name'], row['size']): row for row in baseline.get('results', [])}
+    regressions = []
+    for row in results:
+        base = previous.get((row['name'], row['size']))
+        if base is None or not base.get('median_s'):
+            continue
+        change = row['median_s'] / base['median_s'] - 1
+        if change > threshold:
+            regressions.append({'name': row['name'], 'size': row['size'], 'baseline_median_s': base['median_s'],
+                                'median_s': row['median_s'], 'change': change})
+    return regressions
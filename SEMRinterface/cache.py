@@ -0,0 +1,171 @@
+"""
+In-process caches used by the SEMR service layer.
+
+`BoundedLRUCache` is a small, thread-safe LRU map whose capacity is a byte
+budget rather than an entry count. Each entry carries a caller-supplied
+weight (usually the on-disk size of the file it was parsed from) and the
+least recently used entries are evicted once the budget is exceeded. On-disk
+size is a cheap proxy, not a measurement: a parsed JSON object typically
+occupies several times its file size in memory, so size budgets accordingly.
+
+`FileCache` builds on it to memoize values derived from files on disk. An
+entry is keyed by absolute path and is only served while the file's
+`(st_mtime_ns, st_size)` signature is unchanged, so edits made by other
+processes or by hand are picked up on the next access.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class BoundedLRUCache:
+    """Thread-safe LRU cache bounded by the total weight of its entries.
+
+    Parameters
+    ----------
+    max_bytes: int
+        Budget for the summed entry weights. Entries heavier than the whole
+        budget are never stored. A budget of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None,
+            validate: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the value for `key` and mark it most recently used.
+
+        When `validate` is given and returns False for the stored value, the
+        entry is dropped and the lookup counts as a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and validate is not None and not validate(entry[0]):
+                self._discard(key)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, weight: int) -> bool:
+        """Store `value` under `key`; returns False when it does not fit."""
+        weight = max(0, int(weight))
+        with self._lock:
+            self._discard(key)
+            if weight > self.max_bytes:
+                return False
+            self._entries[key] = (value, weight)
+            self.current_bytes += weight
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, old_weight) = self._entries.popitem(last=False)
+                self.current_bytes -= old_weight
+                self.evictions += 1
+            return True
+
+    def pop(self, key: Hashable) -> None:
+        """Drop `key` if present."""
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self.current_bytes -= entry[1]
+
+
+def file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    """Return `(st_mtime_ns, st_size)` for `file_path`, or None if missing."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class FileCache:
+    """Memoize `loader(path)` results, invalidated by file mtime and size.
+
+    Values are shared between callers and must be treated as read-only;
+    code that needs to mutate a cached structure should reload it from disk
+    or copy it first. Entries are weighted by the file's size on disk.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._lru = BoundedLRUCache(max_bytes)
+
+    def get(self, file_path: str, loader: Callable[[str], Any]) -> Any:
+        """Return the cached value for `file_path`, loading it on a miss.
+
+        Returns None without consulting `loader` when the file is missing.
+        Loader results of None are not cached.
+        """
+        signature = file_signature(file_path)
+        if signature is None:
+            self._lru.pop(file_path)
+            return None
+        entry = self._lru.get(file_path, validate=lambda e: e[0] == signature)
+        if entry is not None:
+            return entry[1]
+        value = loader(file_path)
+        if value is not None:
+            self._lru.put(file_path, (signature, value), signature[1])
+        return value
+
+    def refresh(self, file_path: str, value: Any) -> None:
+        """Replace the entry for `file_path` after the caller rewrote it.
+
+        `value` is stored as is, so pass an object the caller will not
+        mutate afterwards (e.g. one decoded from the bytes just written).
+        """
+        signature = file_signature(file_path)
+        if signature is None or value is None:
+            self._lru.pop(file_path)
+            return
+        self._lru.put(file_path, (signature, value), signature[1])
+
+    def invalidate(self, file_path: str) -> None:
+        """Forget any cached value for `file_path`."""
+        self._lru.pop(file_path)
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._lru.stats()
@@ -0,0 +1,252 @@
+"""
+Compiled columnar store for case time series.
+
+`compile_case` converts a case's `observations.json` and `medications.json`
+into two files under `resources/<study_id>/compiled/<case_id>/`:
+
+- `series.f64`: every numeric series laid out as a contiguous block of
+  little-endian float64 timestamps followed by an equally long block of
+  float64 values.
+- `index.json`: the variable dicts with each series' `data` list replaced by
+  an `offset`/`length` pointer into `series.f64`.
+- `sources.json`: the `(mtime_ns, size)` signature of every case file that
+  was validated when the store was built. It is written last and is small,
+  so checking freshness never requires decoding the index.
+
+`compile_case` also summarizes each variable's points; `compile_study`
+inverts those summaries into the study's `compiled/variable_index.json`
+(see `SEMRinterface.variable_index`).
+
+`load_compiled_case` memory-maps `series.f64` and hands each series
+read-only `memoryview` slices of the mapping as its timestamps and values,
+in the compact form of `SEMRinterface.series`, so no point is copied or
+decoded (on big-endian hosts the blocks are copied and byte-swapped). The
+mapping stays open for as long as any series references it and is unmapped
+when the last one is garbage collected; `compile_case` replaces files
+atomically, so a live mapping never sees them change. The service layer
+caches the unpacked case per `series.f64` signature, so a case is unpacked
+once, not on every request. A store is only used while the recorded source
+signatures still match the files in `cases_all`, so editing a case's JSON
+transparently falls back to it.
+"""
+
+import mmap
+import os
+import sys
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from . import jsoncodec
+from .cache import file_signature
+from .series import compact_series, compact_variable, make_series
+from .timeseries import SERIES_KEYS
+from .variable_index import case_variable_stats
+
+STORE_VERSION = 1
+COMPILED_DIRNAME = 'compiled'
+INDEX_FILENAME = 'index.json'
+SOURCES_FILENAME = 'sources.json'
+SERIES_FILENAME = 'series.f64'
+VARIABLE_INDEX_FILENAME = 'variable_index.json'
+
+#: Case files whose signatures are recorded (and validated) at compile time.
+CASE_FILENAMES = {
+    'demographics': 'demographics.json',
+    'medications': 'medications.json',
+    'notes': 'note_panel_data.json',
+    'observations': 'observations.json',
+}
+
+#: Case files whose series are moved into `series.f64`.
+COLUMNAR_KEYS = ('observations', 'medications')
+
+
+class CaseValidationError(ValueError):
+    """Raised when a case file cannot be decoded while compiling."""
+
+
+def compiled_case_dir(study_dir: str, case_id: str) -> str:
+    """Return the compiled-store directory for `case_id` within `study_dir`."""
+    return os.path.join(study_dir, COMPILED_DIRNAME, case_id)
+
+
+def variable_index_path(study_dir: str) -> str:
+    """Return the path of the study-wide variable index (see `SEMRinterface.variable_index`)."""
+    return os.path.join(study_dir, COMPILED_DIRNAME, VARIABLE_INDEX_FILENAME)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _pack_series(series: Dict, columns: array) -> Dict:
+    """Move `series['data']` into `columns` and return the pointer record."""
+    data = series.get('data') or []
+    if not all(len(p) == 2 and _is_number(p[0]) and _is_number(p[1]) for p in data):
+        # Leave irregular series inline; they round-trip through the index.
+        return dict(series)
+    # `data` keeps its slot (as None) so key order survives the round trip.
+    record = {k: (None if k == 'data' else v) for k, v in series.items()}
+    record['offset'] = len(columns)
+    record['length'] = len(data)
+    record['int_values'] = bool(data) and all(isinstance(p[1], int) for p in data)
+    columns.extend(p[0] for p in data)
+    columns.extend(p[1] for p in data)
+    return record
+
+
+def _pack_variables(variables: Dict, columns: array) -> Dict:
+    packed = {}
+    for var_id, details in variables.items():
+        details = dict(details)
+        for key in SERIES_KEYS:
+            if key in details:
+                details[key] = [_pack_series(s, columns) for s in details[key]]
+        packed[var_id] = details
+    return packed
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def compile_case(case_dir: str, out_dir: str, steps: Optional[List[Dict]] = None) -> Dict:
+    """Validate a case's JSON files and write its compiled store to `out_dir`.
+
+    Returns a small summary with variable and point counts, plus the case's
+    `variable_stats` for the study's variable index, per time step of
+    `steps` (its `case_details.json` entry). Raises CaseValidationError if
+    any case file is not valid JSON.
+    """
+    sources = {}
+    parsed = {}
+    for key, filename in CASE_FILENAMES.items():
+        path = os.path.join(case_dir, filename)
+        signature = file_signature(path)
+        if signature is None:
+            sources[filename] = None
+            continue
+        try:
+            with open(path, 'rb') as file:
+                parsed[key] = jsoncodec.loads(file.read())
+        except ValueError as exc:
+            raise CaseValidationError(f"{path}: {exc}") from exc
+        sources[filename] = list(signature)
+
+    columns = array('d')
+    index = {'version': STORE_VERSION}
+    for key in COLUMNAR_KEYS:
+        if parsed.get(key) is not None:
+            index[key] = _pack_variables(parsed[key], columns)
+
+    if sys.byteorder != 'little':
+        columns.byteswap()
+    os.makedirs(out_dir, exist_ok=True)
+    _write_atomic(os.path.join(out_dir, SERIES_FILENAME), columns.tobytes())
+    _write_atomic(os.path.join(out_dir, INDEX_FILENAME), jsoncodec.dumps(index))
+    # Sources are written last: until they match, readers ignore the store.
+    _write_atomic(os.path.join(out_dir, SOURCES_FILENAME),
+                  jsoncodec.dumps({'version': STORE_VERSION, 'sources': sources}))
+    return {'variables': sum(len(index.get(k, {})) for k in COLUMNAR_KEYS),
+            'points': len(columns) // 2,
+            'variable_stats': case_variable_stats(parsed, steps)}
+
+
+def _read_index(index_path: str) -> Optional[Dict]:
+    try:
+        with open(index_path, 'rb') as file:
+            return jsoncodec.loads(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def is_case_validated(case_dir: str, out_dir: str,
+                      load_index: Callable[[str], Optional[Dict]] = _read_index) -> bool:
+    """Return True if every case file is unchanged since `compile_case` validated it.
+
+    Compares the signatures in `sources.json` with a `stat` of each file.
+    `load_index` reads `sources.json` (see `load_store_index`).
+    """
+    recorded = load_index(os.path.join(out_dir, SOURCES_FILENAME))
+    if not recorded or recorded.get('version') != STORE_VERSION:
+        return False
+    for filename, signature in recorded.get('sources', {}).items():
+        current = file_signature(os.path.join(case_dir, filename))
+        if (list(current) if current else None) != signature:
+            return False
+    return True
+
+
+def load_store_index(case_dir: str, out_dir: str,
+                     load_index: Callable[[str], Optional[Dict]] = _read_index) -> Optional[Dict]:
+    """Return the compiled index for a case if it is present and fresh.
+
+    Returns None unless `is_case_validated` holds. `load_index` lets callers
+    route the read through a cache; its result is not mutated.
+    """
+    if not is_case_validated(case_dir, out_dir, load_index):
+        return None
+    index = load_index(os.path.join(out_dir, INDEX_FILENAME))
+    if not index or index.get('version') != STORE_VERSION:
+        return None
+    return index
+
+
+def _open_columns(out_dir: str) -> memoryview:
+    path = os.path.join(out_dir, SERIES_FILENAME)
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return memoryview(b'').cast('d')
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    # The view (and every slice of it) keeps the mapping alive; it is
+    # unmapped once the last series referencing it is collected.
+    return memoryview(mapped).cast('d')
+
+
+def _column(columns: memoryview, start: int, stop: int):
+    block = columns[start:stop]
+    if sys.byteorder == 'little':
+        return block
+    copied = array('d', block.cast('B').tobytes())
+    copied.byteswap()
+    return copied
+
+
+def _unpack_series(record: Dict, columns: memoryview):
+    if 'offset' not in record:
+        return compact_series(record)
+    offset, length = record['offset'], record['length']
+    times = _column(columns, offset, offset + length)
+    values = _column(columns, offset + length, offset + 2 * length)
+    meta = {k: v for k, v in record.items() if k not in ('offset', 'length', 'int_values')}
+    return make_series(meta, times, values, int_values=bool(record.get('int_values')))
+
+
+def _unpack_variables(variables: Dict, columns) -> Dict:
+    strings: Dict[str, str] = {}
+    return {var_id: compact_variable(details, lambda record: _unpack_series(record, columns), strings)
+            for var_id, details in variables.items()}
+
+
+def load_compiled_case(case_dir: str, out_dir: str,
+                       load_index: Callable[[str], Optional[Dict]] = _read_index) -> Optional[Dict]:
+    """Return `{'observations': ..., 'medications': ...}` from a fresh store.
+
+    Variables and series are `CompactVariable`/`CompactSeries` objects
+    whose points are views into the memory-mapped `series.f64`.
+
+    Returns None when no usable compiled store exists so the caller can fall
+    back to decoding the JSON files.
+    """
+    index = load_store_index(case_dir, out_dir, load_index)
+    if index is None:
+        return None
+    try:
+        columns = _open_columns(out_dir)
+    except (OSError, ValueError):
+        return None
+    return {key: _unpack_variables(index[key], columns) if key in index else None
+            for key in COLUMNAR_KEYS}
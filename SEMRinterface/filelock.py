@@ -0,0 +1,48 @@
+"""
+Advisory inter-process file locking.
+
+Wraps `fcntl.flock` so several gunicorn workers can coordinate writes to the
+same study files. On platforms without `fcntl` (Windows) the lock degrades
+to a no-op and only in-process locking applies.
+"""
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+@contextmanager
+def flocked(file, exclusive: bool = True):
+    """Hold an advisory lock on the open `file` for the duration of the block."""
+    if fcntl is None:
+        yield file
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield file
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def try_flocked(file):
+    """Try to take an exclusive lock on `file` without blocking.
+
+    Yields True if the lock is held for the duration of the block, False if
+    another process holds it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
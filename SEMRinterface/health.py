@@ -0,0 +1,232 @@
+"""
+Health checks refreshed in the background.
+
+Each check (database, resources, static files, disk space, memory,
+configuration) is a plain function returning a result dict with a `status`
+of `ok`, `warning`, `info`, or `error`. A `HealthMonitor` daemon thread runs
+every check on its own interval (`settings.SEMR_HEALTH_CHECK_INTERVALS`,
+seconds per check name) and keeps the latest result, when it was taken, and
+how long it took. The readiness endpoint only copies that snapshot, so load
+balancer probes cost no queries or file-system walks however often they
+arrive; the first request in a process runs the checks once inline.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+from .services import get_study_index
+
+logger = logging.getLogger(__name__)
+
+#: Seconds between runs of each check; override per check with
+#: `settings.SEMR_HEALTH_CHECK_INTERVALS`.
+DEFAULT_INTERVALS = {
+    'database': 10,
+    'resources': 30,
+    'static_files': 300,
+    'disk_space': 60,
+    'memory': 15,
+    'configuration': 300,
+}
+
+
+def uptime() -> float:
+    """Seconds since this process started."""
+    return time.time() - metrics.PROCESS_START
+
+
+def check_database() -> Dict:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        result = cursor.fetchone()
+    if not result:
+        return {'status': 'error', 'message': 'Database query returned no results'}
+    return {'status': 'ok'}
+
+
+def check_resources() -> Dict:
+    study_index = get_study_index()
+    studies = study_index['studies']
+    result = {
+        'status': 'ok' if studies else 'warning',
+        'studies_count': len(studies),
+        'studies': list(studies),
+        'cases_count': sum(study.get('case_count') or 0 for study in studies.values()),
+        'manifest_built_at': study_index.get('built_at'),
+    }
+    if study_index.get('built_at') is None:
+        result['message'] = 'Study manifest not built yet'
+    elif not studies:
+        result['message'] = 'No studies found'
+    return result
+
+
+def check_static_files() -> Dict:
+    static_dirs = getattr(settings, 'STATICFILES_DIRS', [])
+    static_root = getattr(settings, 'STATIC_ROOT', None)
+    if static_root and not os.path.exists(static_root):
+        return {'status': 'warning', 'message': 'Static files not collected'}
+    if not static_dirs and not static_root:
+        return {'status': 'warning', 'message': 'No static files configuration found'}
+    return {'status': 'ok', 'message': 'Static files available'}
+
+
+def check_disk_space() -> Dict:
+    total, used, free = shutil.disk_usage(settings.BASE_DIR)
+    result = {
+        'status': 'ok',
+        'total_gb': round(total / (1024**3), 2),
+        'used_gb': round(used / (1024**3), 2),
+        'free_gb': round(free / (1024**3), 2),
+        'free_percent': round((free / total) * 100, 2)
+    }
+    # Warning if less than 1GB free
+    if free < 1024**3:
+        result['status'] = 'warning'
+        result['message'] = 'Low disk space'
+    return result
+
+
+def check_memory() -> Dict:
+    try:
+        import psutil
+    except ImportError:
+        return {'status': 'info', 'message': 'psutil not available for memory monitoring'}
+    memory = psutil.virtual_memory()
+    result = {
+        'status': 'ok',
+        'total_gb': round(memory.total / (1024**3), 2),
+        'used_gb': round(memory.used / (1024**3), 2),
+        'available_gb': round(memory.available / (1024**3), 2),
+        'percent_used': memory.percent
+    }
+    if memory.percent > 90:
+        result['status'] = 'warning'
+        result['message'] = 'High memory usage'
+    return result
+
+
+def check_configuration() -> Dict:
+    issues = []
+    if settings.SECRET_KEY == '$$$$$ENTER SECRET KEY$$$$$':
+        issues.append('Default secret key in use')
+    if settings.DEBUG:
+        issues.append('Debug mode enabled')
+    if not settings.ALLOWED_HOSTS:
+        issues.append('ALLOWED_HOSTS not configured')
+    return {'status': 'warning' if issues else 'ok', 'issues': issues}
+
+
+CHECKS: Dict[str, Callable[[], Dict]] = {
+    'database': check_database,
+    'resources': check_resources,
+    'static_files': check_static_files,
+    'disk_space': check_disk_space,
+    'memory': check_memory,
+    'configuration': check_configuration,
+}
+
+
+def run_check(name: str) -> Dict:
+    """Run one check; returns its result with `checked_at` and `duration_ms`."""
+    started = time.perf_counter()
+    try:
+        result = CHECKS[name]()
+    except Exception as e:
+        result = {'status': 'error', 'message': str(e)}
+    result['checked_at'] = time.time()
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+class HealthMonitor:
+    """Daemon thread that re-runs each check when its interval has elapsed."""
+
+    def __init__(self, intervals: Dict[str, float]):
+        # At most one run per second per check, however small the setting.
+        self.intervals = {name: max(float(interval), 1.0) for name, interval in intervals.items()}
+        self._results: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='semr-health-checks', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def refresh(self, names=None) -> None:
+        """Run `names` (all checks by default) now and store their results."""
+        for name in names or CHECKS:
+            result = run_check(name)
+            with self._lock:
+                self._results[name] = result
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Latest result of every check, running any that never ran."""
+        with self._lock:
+            missing = [name for name in CHECKS if name not in self._results]
+        if missing:
+            self.refresh(missing)
+        with self._lock:
+            return {name: dict(self._results[name]) for name in CHECKS}
+
+    def _due_in(self, now: float) -> Dict[str, float]:
+        with self._lock:
+            return {name: self._results[name]['checked_at'] + self.intervals[name] - now
+                    if name in self._results else 0.0 for name in CHECKS}
+
+    def _run(self) -> None:
+        while True:
+            due = self._due_in(time.time())
+            ready = [name for name, wait in due.items() if wait <= 0]
+            if ready:
+                try:
+                    self.refresh(ready)
+                except Exception:
+                    logger.exception("Health check refresh failed")
+                finally:
+                    # Connections are per thread; do not leave one open in the monitor
+                    # thread. Inline runs use the request's, which Django closes.
+                    connection.close()
+                continue
+            if self._stop.wait(min(due.values())):
+                return
+
+
+_monitor: Optional[HealthMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor() -> HealthMonitor:
+    """Return the process-wide monitor, starting its thread on first use."""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            intervals = dict(DEFAULT_INTERVALS, **getattr(settings, 'SEMR_HEALTH_CHECK_INTERVALS', {}))
+            _monitor = HealthMonitor(intervals)
+            _monitor.refresh()
+            _monitor.start()
+        return _monitor
+
+
+def _reset_after_fork() -> None:
+    # Threads do not survive fork; children start their own monitor.
+    global _monitor, _monitor_lock
+    _monitor = None
+    _monitor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,175 @@
+"""
+Health check system for Simple EMR System
+Provides system status and diagnostics
+"""
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+from django.conf import settings
+from django.utils import timezone
+import sys
+import time
+
+from . import health
+from .views import JsonResponse
+from . import metrics as semr_metrics
+
+@require_http_methods(["GET"])
+def liveness(request):
+    """
+    Liveness probe: constant time, touches no database or files
+
+    Returns:
+        JsonResponse: Process status and uptime
+    """
+    return JsonResponse({
+        'status': 'alive',
+        'timestamp': timezone.now().isoformat(),
+        'uptime': health.uptime(),
+    })
+
+@require_http_methods(["GET"])
+def health_check(request):
+    """
+    Readiness endpoint: system health status and diagnostics
+
+    Served from the snapshot kept by the background `HealthMonitor`
+    (see SEMRinterface/health.py); no check runs in the request except on
+    the first one in a process.
+
+    Returns:
+        JsonResponse: System health status, per-check results with their
+        `checked_at` and `duration_ms`, and the snapshot age
+    """
+    start_time = time.time()
+    checks = health.get_monitor().snapshot()
+    oldest = min(check['checked_at'] for check in checks.values())
+    
+    health_status = {
+        'status': 'healthy',
+        'timestamp': timezone.now().isoformat(),
+        'version': '2024.2',
+        'uptime': health.uptime(),
+        'snapshot_age_s': round(max(0.0, time.time() - oldest), 3),
+        'checks': checks
+    }
+    
+    # Overall status determination
+    error_count = sum(1 for check in checks.values() 
+                     if check.get('status') == 'error')
+    warning_count = sum(1 for check in checks.values() 
+                       if check.get('status') == 'warning')
+    
+    if error_count > 0:
+        health_status['status'] = 'unhealthy'
+    elif warning_count > 0:
+        health_status['status'] = 'degraded'
+    
+    # Add summary
+    health_status['summary'] = {
+        'total_checks': len(checks),
+        'errors': error_count,
+        'warnings': warning_count,
+        'checks_duration_ms': round(sum(check['duration_ms'] for check in checks.values()), 3),
+        'response_time_ms': round((time.time() - start_time) * 1000, 2)
+    }
+    
+    # Set appropriate HTTP status code
+    status_code = 200
+    if health_status['status'] == 'unhealthy':
+        status_code = 503
+    elif health_status['status'] == 'degraded':
+        status_code = 200  # Still functional but with warnings
+    
+    return JsonResponse(health_status, status=status_code)
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Metrics endpoint in the Prometheus text exposition format
+
+    Returns:
+        HttpResponse: Per-view latency histograms, request counts, bytes read,
+        JSON decode and serialization times, and cache hit ratios of this
+        process (see SEMRinterface/metrics.py)
+    """
+    return HttpResponse(semr_metrics.REGISTRY.render(), content_type=semr_metrics.CONTENT_TYPE)
+
+@require_http_methods(["GET"])
+def system_info(request):
+    """
+    System information endpoint
+    
+    Returns:
+        JsonResponse: Detailed system information
+    """
+    info = {
+        'application': {
+            'name': 'Simple EMR System',
+            'version': '2024.2',
+            'django_version': settings.DJANGO_VERSION,
+            'python_version': f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
+        },
+        'environment': {
+            'debug': settings.DEBUG,
+            'timezone': str(settings.TIME_ZONE),
+            'language': settings.LANGUAGE_CODE,
+            'allowed_hosts': settings.ALLOWED_HOSTS,
+        },
+        'database': {
+            'engine': settings.DATABASES['default']['ENGINE'],
+            'name': settings.DATABASES['default'].get('NAME', 'N/A'),
+        },
+        'paths': {
+            'base_dir': str(settings.BASE_DIR),
+            'static_root': str(getattr(settings, 'STATIC_ROOT', 'Not set')),
+            'media_root': str(getattr(settings, 'MEDIA_ROOT', 'Not set')),
+        }
+    }
+    
+    return JsonResponse(info)
+
+@require_http_methods(["GET"])
+def quick_start(request):
+    """
+    Quick start information endpoint
+    
+    Returns:
+        JsonResponse: Quick start instructions
+    """
+    quick_start_info = {
+        'title': 'Simple EMR System Quick Start',
+        'steps': [
+            {
+                'step': 1,
+                'title': 'Access the System',
+                'description': 'Open your web browser and navigate to the application URL',
+                'url': request.build_absolute_uri('/')
+            },
+            {
+                'step': 2,
+                'title': 'Select a Study',
+                'description': 'Choose a research study from the dropdown menu',
+                'url': request.build_absolute_uri('/')
+            },
+            {
+                'step': 3,
+                'title': 'Choose a User',
+                'description': 'Select your user profile from the list',
+                'url': request.build_absolute_uri('/')
+            },
+            {
+                'step': 4,
+                'title': 'Review Cases',
+                'description': 'Click on a case to view patient data and complete tasks',
+                'url': request.build_absolute_uri('/case_viewer/')
+            }
+        ],
+        'help': {
+            'documentation': request.build_absolute_uri('/docs/'),
+            'api_reference': request.build_absolute_uri('/api/'),
+            'health_check': request.build_absolute_uri('/health/'),
+        }
+    }
+    
+    return JsonResponse(quick_start_info)
@@ -0,0 +1,274 @@
+"""
+Append-only journal of case-assignment events for a study.
+
+`user_details.json` remains the authoritative snapshot format, but updates
+are no longer made by rewriting it. Each change (a case completed, a case
+reset, a record merged) is appended as one JSON line to
+`user_details.journal` next to it, under an exclusive `flock`, so completing
+a case costs O(1) I/O regardless of study size and concurrent workers cannot
+overwrite each other's changes.
+
+Every process keeps a materialized view (snapshot plus replayed events) and
+only reads journal bytes appended since its last refresh. Once the journal
+holds `compact_events` events it is folded into a new snapshot and
+truncated. Journal writes are flushed immediately; `fsync` is batched and
+issued by a background thread at most every `fsync_interval` seconds (0
+means fsync on every append).
+
+Replaying events is idempotent (completion is set membership, updates are
+last-writer-wins merges), so a reader that races a compaction and applies
+some events twice still converges on the same state.
+"""
+
+import atexit
+import copy
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from . import jsoncodec
+from .cache import file_signature
+from .filelock import flocked
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = 'user_details.json'
+JOURNAL_FILENAME = 'user_details.journal'
+
+
+def apply_event(state: Dict, event: Dict) -> bool:
+    """Apply one journal `event` to `state` in place; returns True if it changed."""
+    record = state.get(event.get('user_id'))
+    if record is None:
+        return False
+    op = event.get('op')
+    if op == 'complete':
+        completed = record.get('cases_completed')
+        if completed is None:
+            completed = record['cases_completed'] = []
+        if event['case_id'] not in completed:
+            completed.append(event['case_id'])
+            return True
+    elif op == 'reset':
+        completed = record.get('cases_completed') or []
+        if event['case_id'] in completed:
+            completed.remove(event['case_id'])
+            return True
+    elif op == 'update':
+        record.update(event.get('details', {}))
+        return True
+    return False
+
+
+class AssignmentJournal:
+    """Journaled, materialized view of one study's `user_details.json`."""
+
+    def __init__(self, study_dir: str, fsync_interval: float = 0.1, compact_events: int = 500):
+        self.snapshot_path = os.path.join(study_dir, SNAPSHOT_FILENAME)
+        self.journal_path = os.path.join(study_dir, JOURNAL_FILENAME)
+        self.fsync_interval = fsync_interval
+        self.compact_events = compact_events
+        self._lock = threading.RLock()
+        self._state: Optional[Dict] = None
+        self._view: Optional[Dict] = None
+        self._snapshot_sig = None
+        self._offset = 0
+        self._events = 0
+        self._journal_file = None
+        self._dirty = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    # -- reading -----------------------------------------------------------------
+
+    def _load_snapshot(self) -> None:
+        self._snapshot_sig = file_signature(self.snapshot_path)
+        self._offset = 0
+        self._events = 0
+        self._view = None
+        if self._snapshot_sig is None:
+            self._state = None
+            return
+        try:
+            with open(self.snapshot_path, 'rb') as file:
+                self._state = jsoncodec.loads(file.read())
+        except ValueError:
+            logger.warning("Failed to decode JSON at %s", self.snapshot_path)
+            self._state = None
+
+    def _replay_tail(self) -> None:
+        try:
+            with open(self.journal_path, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                if size < self._offset:
+                    # Truncated by a compaction we have not seen the snapshot of yet.
+                    self._load_snapshot()
+                file.seek(self._offset)
+                tail = file.read()
+        except FileNotFoundError:
+            return
+        end = tail.rfind(b'\n') + 1  # ignore a partially written last line
+        for line in tail[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                event = jsoncodec.loads(line)
+            except ValueError:
+                logger.warning("Skipping corrupt journal line in %s", self.journal_path)
+                continue
+            if self._state is not None and apply_event(self._state, event):
+                self._view = None
+            self._events += 1
+        self._offset += end
+
+    def _refresh(self) -> None:
+        if self._state is None or file_signature(self.snapshot_path) != self._snapshot_sig:
+            self._load_snapshot()
+        self._replay_tail()
+
+    def read(self) -> Optional[Dict]:
+        """Return the current `user_id -> record` mapping (treat as read-only).
+
+        The mapping is a snapshot: later events are applied to a private
+        copy, so callers may keep iterating it while other threads append.
+        It is shared by every reader until the state next changes.
+        """
+        with self._lock:
+            self._refresh()
+            if self._view is None and self._state is not None:
+                self._view = copy.deepcopy(self._state)
+            return self._view
+
+    # -- writing -----------------------------------------------------------------
+
+    def _open_journal(self):
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'ab')
+        return self._journal_file
+
+    def append(self, event: Dict, require_change: bool = False) -> bool:
+        """Durably record `event` and apply it to the view.
+
+        Returns False without writing when the study has no snapshot, when
+        the user is unknown, or when `require_change` is set and the event
+        would not alter the state.
+        """
+        if not os.path.isfile(self.snapshot_path):
+            return False
+        with self._lock:
+            journal = self._open_journal()
+            with flocked(journal):
+                self._refresh()
+                if self._state is None or event.get('user_id') not in self._state:
+                    return False
+                if require_change:
+                    trial = copy.deepcopy(self._state[event['user_id']])
+                    if not apply_event({event['user_id']: trial}, event):
+                        return False
+                line = jsoncodec.dumps(event) + b'\n'
+                journal.write(line)
+                journal.flush()
+                self._sync()
+                # Apply the decoded line, not `event`, so the state never
+                # shares objects with the caller.
+                if apply_event(self._state, jsoncodec.loads(line)):
+                    self._view = None
+                self._offset += len(line)
+                self._events += 1
+                if self._events >= self.compact_events:
+                    self._compact_locked()
+            return True
+
+    def compact(self) -> None:
+        """Fold the journal into a fresh `user_details.json` snapshot."""
+        if not os.path.isfile(self.snapshot_path):
+            return
+        with self._lock:
+            journal = self._open_journal()
+            with flocked(journal):
+                self._refresh()
+                self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        if self._state is None:
+            return
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(jsoncodec.dumps(self._state))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._journal_file.truncate(0)
+        os.fsync(self._journal_file.fileno())
+        self._snapshot_sig = file_signature(self.snapshot_path)
+        self._offset = 0
+        self._events = 0
+
+    # -- durability --------------------------------------------------------------
+
+    def _sync(self) -> None:
+        if self.fsync_interval <= 0:
+            os.fsync(self._journal_file.fileno())
+            return
+        self._dirty.set()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='semr-journal-fsync', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            time.sleep(self.fsync_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """fsync any appended but not yet synced events."""
+        with self._lock:
+            if self._dirty.is_set() and self._journal_file is not None:
+                self._dirty.clear()
+                os.fsync(self._journal_file.fileno())
+
+
+_journals: Dict[str, AssignmentJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(study_dir: str, **options) -> Optional[AssignmentJournal]:
+    """Return the process-wide journal for `study_dir`, creating it on first use.
+
+    Returns None, and caches nothing, when `study_dir` has no snapshot
+    (an unknown study).
+    """
+    key = os.path.abspath(study_dir)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            if not os.path.isfile(os.path.join(key, SNAPSHOT_FILENAME)):
+                return None
+            journal = _journals[key] = AssignmentJournal(key, **options)
+        return journal
+
+
+def _reset_after_fork() -> None:
+    # flock is tied to the open file description, which a forked child shares
+    # with its parent, so children must reopen the journal; threads and locks
+    # do not survive fork either.
+    for journal in _journals.values():
+        journal._lock = threading.RLock()
+        journal._dirty = threading.Event()
+        journal._journal_file = None
+        journal._flusher = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def _flush_all() -> None:
+    for journal in list(_journals.values()):
+        try:
+            journal.flush()
+        except OSError:
+            pass
@@ -0,0 +1,86 @@
+"""
+JSON codec used for every file the service layer reads or writes and for
+every JSON response.
+
+The codec is chosen once at import time from `settings.SEMR_JSON_CODEC`:
+'auto' (default) uses orjson when it is installed and the standard library
+otherwise, 'orjson' requires it, and 'json' forces the standard library.
+Both paths take bytes (or str) in and give compact UTF-8 bytes out, so
+callers read files in binary mode and write the result as-is. orjson parses
+and serializes the large `observations.json` payloads several times faster
+than `json`.
+
+Outputs are equivalent JSON for the data this project stores. Differences
+only show for values JSON cannot represent: orjson writes NaN and infinity
+as `null` where `json` writes the non-standard `NaN`/`Infinity`.
+
+The module does not need Django: without it (or without configured
+settings) the codec is 'auto', and Django's encoder for dates, decimals,
+and UUIDs is imported on first use. The `JsonResponse` built on the codec
+lives in `SEMRinterface.views`.
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _configured_codec() -> str:
+    try:
+        from django.conf import settings
+        from django.core.exceptions import ImproperlyConfigured
+    except ImportError:  # pragma: no cover - used outside Django
+        return 'auto'
+    try:
+        return getattr(settings, 'SEMR_JSON_CODEC', 'auto')
+    except ImproperlyConfigured:
+        return 'auto'
+
+
+CODEC = _configured_codec()
+if CODEC not in ('auto', 'orjson', 'json'):
+    raise ValueError(f"Unknown JSON codec '{CODEC}'")
+if CODEC == 'orjson' and orjson is None:
+    raise ValueError("SEMR_JSON_CODEC is 'orjson' but orjson is not installed")
+
+#: Name of the active implementation, 'orjson' or 'json'.
+BACKEND = 'orjson' if orjson is not None and CODEC != 'json' else 'json'
+
+_django_default = None
+
+
+def _default(obj):
+    # Objects with `to_wire()` (the compact series types) serialize as what it
+    # returns; dates, decimals, UUIDs, and lazy strings as in Django's JsonResponse.
+    global _django_default
+    to_wire = getattr(obj, 'to_wire', None)
+    if to_wire is not None:
+        return to_wire()
+    if _django_default is None:
+        try:
+            from django.core.serializers.json import DjangoJSONEncoder
+        except ImportError:  # pragma: no cover - used outside Django
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable") from None
+        _django_default = DjangoJSONEncoder().default
+    return _django_default(obj)
+
+
+def loads(data) -> Any:
+    """Parse JSON from bytes or str; raises ValueError on invalid input."""
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize `obj` to compact UTF-8 JSON bytes."""
+    if BACKEND == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
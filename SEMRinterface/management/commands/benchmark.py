@@ -0,0 +1,99 @@
+"""
+manage.py benchmark [--size small] [--baseline results.json]
+
+Run the service and view microbenchmarks (see `SEMRinterface.benchmarks`)
+against synthetic studies generated in a temporary resources directory,
+write the results as JSON, and optionally fail when a benchmark is slower
+than a stored baseline by more than `--threshold`. A results file can be
+used as the next run's baseline.
+
+The temporary directory becomes this process's `SEMR_RESOURCES_DIR` before
+the service layer is imported, so the views are benchmarked against it and
+the server's studies and manifests are never touched.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from SEMRinterface.benchmarks import SIZES, compare_results, run_benchmarks, write_results
+
+
+class Command(BaseCommand):
+    help = "Benchmark SEMRinterface services and views against synthetic studies."
+    # The URL checks import the views, and with them the service layer,
+    # before handle() can point it at the temporary resources directory.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='append', dest='sizes', choices=sorted(SIZES),
+                            help='Study size preset (repeatable; default: small).')
+        parser.add_argument('--cases', type=int, help='Benchmark a custom study with this many cases.')
+        parser.add_argument('--users', type=int, help='Users in the custom study.')
+        parser.add_argument('--variables', type=int, help='Observation variables per case in the custom study.')
+        parser.add_argument('--points', type=int, help='Points per series in the custom study.')
+        parser.add_argument('--only', action='append',
+                            help='Only run benchmarks whose name contains this text (repeatable).')
+        parser.add_argument('--no-views', action='store_true', help='Skip the view benchmarks.')
+        parser.add_argument('--min-time', type=float, default=0.5,
+                            help='Seconds spent timing each benchmark (default: %(default)s).')
+        parser.add_argument('--output', default='benchmark_results.json',
+                            help='Results file (default: %(default)s).')
+        parser.add_argument('--baseline', help='Results file to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed median slowdown before a regression is reported, '
+                                 'as a fraction (default: %(default)s).')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated studies.')
+        parser.add_argument('--resources-dir',
+                            help='Generate the studies here instead of in a temporary directory; views are '
+                                 'only benchmarked when this is the server\'s resources directory.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+
+        sizes = {name: SIZES[name] for name in options['sizes'] or []}
+        custom = {key: options[key] for key in ('cases', 'users', 'variables', 'points') if options[key] is not None}
+        if custom:
+            sizes['custom'] = dict(SIZES['small'], **custom)
+        if not sizes:
+            sizes = {'small': SIZES['small']}
+
+        resources_dir = options['resources_dir']
+        temporary = resources_dir is None
+        if temporary:
+            resources_dir = tempfile.mkdtemp(prefix='semr-benchmark-')
+        try:
+            with override_settings(SEMR_RESOURCES_DIR=resources_dir):
+                from SEMRinterface import services
+            views = not options['no_views']
+            if views and os.path.abspath(services.RESOURCES_DIR) != os.path.abspath(resources_dir):
+                self.stderr.write(self.style.WARNING(
+                    f"Views serve {services.RESOURCES_DIR}, not {resources_dir}; skipping the view benchmarks"))
+            results = run_benchmarks(sizes, resources_dir, options['min_time'], options['only'],
+                                     views=views, keep=options['keep'], log=self.stdout.write)
+        finally:
+            if temporary and not options['keep']:
+                shutil.rmtree(resources_dir, ignore_errors=True)
+        if temporary and options['keep']:
+            self.stdout.write(f"Kept the generated studies in {resources_dir}")
+        write_results(results, options['output'])
+        self.stdout.write(f"Wrote {len(results)} results to {options['output']}")
+
+        if baseline is not None:
+            regressions = compare_results(results, baseline, options['threshold'])
+            for row in regressions:
+                self.stderr.write(f"{row['name']} [{row['size']}]: {row['baseline_median_s'] * 1e3:.3f} ms -> "
+                                  f"{row['median_s'] * 1e3:.3f} ms ({row['change']:+.0%})")
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmark(s) regressed by more than {options['threshold']:.0%}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
@@ -0,0 +1,38 @@
+"""
+manage.py build_manifest [study_id ...]
+
+Rebuild the precomputed study manifests (`resources/<study_id>/manifest.json`)
+and the `resources/studies_manifest.json` index that `get_study_ids` and the
+health check read. Only studies whose files changed are rebuilt unless
+`--force` is given.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface.manifest import list_study_dirs, refresh_manifests
+from SEMRinterface.services import RESOURCES_DIR
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-study manifests and the studies index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('study_ids', nargs='*', help='Limit the rebuild to these studies.')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild even if the recorded signature still matches.')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        study_ids = options['study_ids'] or None
+        if study_ids:
+            unknown = set(study_ids) - set(list_study_dirs(options['resources_dir']))
+            if unknown:
+                raise CommandError(f"Unknown study id(s): {', '.join(sorted(unknown))}")
+
+        index = refresh_manifests(options['resources_dir'], force=options['force'], study_ids=study_ids)
+        for study_id, summary in index['studies'].items():
+            if options['verbosity'] > 1 or (study_ids and study_id in study_ids):
+                self.stdout.write(f"{study_id}: {summary['case_count']} cases, "
+                                  f"{summary['total_points']} points, {summary['total_bytes']} bytes")
+        self.stdout.write(self.style.SUCCESS(f"Manifest covers {len(index['studies'])} studies"))
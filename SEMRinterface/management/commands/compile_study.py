@@ -0,0 +1,75 @@
+"""
+manage.py compile_study <study_id>
+
+Validate every case of a study and write its compiled columnar store
+(`resources/<study_id>/compiled/<case_id>/`), which `get_case_files` then
+reads with memory-mapping instead of decoding `observations.json` and
+`medications.json`. Validated cases are also eligible for the raw
+passthrough path of `/api/get_case_data/`.
+
+The study's variable index (`compiled/variable_index.json`, queried by
+`manage.py query_variables` and `/api/variable_index/`) is rebuilt from the
+compiled cases; with `--case`, the other cases' entries are kept.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface.case_store import CaseValidationError, compile_case, compiled_case_dir, variable_index_path
+from SEMRinterface.manifest import list_case_dirs
+from SEMRinterface.services import RESOURCES_DIR, load_json
+from SEMRinterface.variable_index import build_variable_index, read_case_stats, write_variable_index
+
+
+class Command(BaseCommand):
+    help = "Compile a study's case time series into memory-mappable columnar files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('study_id', help='Folder name under the resources directory.')
+        parser.add_argument('--case', action='append', dest='case_ids', default=None,
+                            help='Compile only this case id (repeatable).')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        study_dir = os.path.join(options['resources_dir'], options['study_id'])
+        cases_dir = os.path.join(study_dir, 'cases_all')
+        if not os.path.isdir(cases_dir):
+            raise CommandError(f"No cases_all directory at {cases_dir}")
+
+        case_ids = options['case_ids'] or sorted(
+            d for d in os.listdir(cases_dir) if os.path.isdir(os.path.join(cases_dir, d))
+        )
+        case_details = load_json(os.path.join(study_dir, 'case_details.json'), use_cache=False) or {}
+        index_path = variable_index_path(study_dir)
+        # Cases not compiled this run keep their entries from the previous index.
+        case_stats = read_case_stats(index_path) if options['case_ids'] else {}
+        failures = 0
+        total_points = 0
+        for case_id in case_ids:
+            case_stats.pop(case_id, None)
+            try:
+                summary = compile_case(os.path.join(cases_dir, case_id), compiled_case_dir(study_dir, case_id),
+                                       case_details.get(case_id))
+            except (CaseValidationError, OSError) as exc:
+                failures += 1
+                self.stderr.write(f"{case_id}: {exc}")
+                continue
+            total_points += summary['points']
+            case_stats[case_id] = summary['variable_stats']
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{case_id}: {summary['variables']} variables, {summary['points']} points")
+
+        existing = set(list_case_dirs(study_dir))
+        index, points = build_variable_index(
+            options['study_id'], {case_id: stats for case_id, stats in case_stats.items() if case_id in existing},
+            case_details)
+        write_variable_index(index_path, index, points)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {len(case_ids) - failures}/{len(case_ids)} cases ({total_points} points) for {options['study_id']}"
+        ))
+        self.stdout.write(f"Indexed {len(index['variables'])} variables across {index['case_count']} cases")
+        if failures:
+            raise CommandError(f"{failures} case(s) failed validation")
@@ -0,0 +1,86 @@
+"""
+manage.py generate_study <study_id> [--cases N] [--users N] [--variables N] [--points N] ...
+
+Write a reproducible synthetic study of any size to `resources/<study_id>/`
+for benchmarks and load tests (see `SEMRinterface.synthetic`). Case folders
+are written in parallel and the same `--seed` and options always produce the
+same files.
+"""
+
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface.manifest import refresh_manifests
+from SEMRinterface.payloads import is_safe_id
+from SEMRinterface.services import RESOURCES_DIR
+from SEMRinterface.synthetic import estimate_case_bytes, generate_study
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic study with configurable numbers of cases, users, variables, points, and notes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('study_id', help='Folder name under the resources directory.')
+        parser.add_argument('--cases', type=int, default=100, help='Number of cases (default: %(default)s).')
+        parser.add_argument('--users', type=int, default=10, help='Number of users (default: %(default)s).')
+        parser.add_argument('--cases-per-user', type=int, default=None,
+                            help='Cases assigned to each user (default: all).')
+        parser.add_argument('--completed-fraction', type=float, default=0.0,
+                            help="Fraction of each user's cases already completed (default: %(default)s).")
+        parser.add_argument('--variables', type=int, default=50,
+                            help='Observation variables per case (default: %(default)s).')
+        parser.add_argument('--medications', type=int, default=10,
+                            help='Medications per case (default: %(default)s).')
+        parser.add_argument('--points', type=int, default=100,
+                            help='Points per observation series (default: %(default)s).')
+        parser.add_argument('--notes', type=int, default=10, help='Notes per case (default: %(default)s).')
+        parser.add_argument('--note-words', type=int, default=60, help='Words per note (default: %(default)s).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes writing cases (default: %(default)s).')
+        parser.add_argument('--force', action='store_true', help='Replace an existing study folder.')
+        parser.add_argument('--skip-manifest', action='store_true',
+                            help='Do not build the study manifest afterwards (it reads every case).')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        if not is_safe_id(options['study_id']):
+            raise CommandError(f"Invalid study id: {options['study_id']!r}")
+        for name in ('cases', 'users', 'workers'):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1")
+        if not 0 <= options['completed_fraction'] <= 1:
+            raise CommandError('--completed-fraction must be between 0 and 1')
+        study_dir = os.path.join(options['resources_dir'], options['study_id'])
+        if os.path.exists(study_dir):
+            if not options['force']:
+                raise CommandError(f"{study_dir} already exists; use --force to replace it")
+            shutil.rmtree(study_dir)
+
+        estimate = options['cases'] * estimate_case_bytes(
+            options['variables'], options['medications'], options['points'], options['notes'], options['note_words'])
+        self.stdout.write(f"Writing {options['cases']} cases (about {estimate / 1e6:.1f} MB) to {study_dir}")
+        summary = generate_study(
+            study_dir,
+            cases=options['cases'],
+            users=options['users'],
+            variables=options['variables'],
+            medications=options['medications'],
+            points=options['points'],
+            notes=options['notes'],
+            note_words=options['note_words'],
+            seed=options['seed'],
+            workers=options['workers'],
+            cases_per_user=options['cases_per_user'],
+            completed_fraction=options['completed_fraction'],
+            log=self.stdout.write,
+        )
+        if not options['skip_manifest']:
+            refresh_manifests(options['resources_dir'], study_ids=[options['study_id']])
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary['cases']} cases ({summary['case_bytes'] / 1e6:.1f} MB) and "
+            f"{summary['users']} users in {study_dir}"
+        ))
@@ -0,0 +1,51 @@
+"""
+manage.py import_storage <study_id>
+
+One-shot import of a study's mutable state from its JSON files
+(`user_details.json` plus any journal events, `case_selections.json`, and
+`stored_results.txt`) into the SQLite storage backend at
+`settings.SEMR_SQLITE_PATH`. Set `SEMR_STORAGE_BACKEND = 'sqlite'` afterwards
+to serve the study from the database.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface.services import RESOURCES_DIR, SQLITE_PATH, results_writer_options
+from SEMRinterface.storage import JsonStorageBackend
+from SEMRinterface.storage_sqlite import SQLiteStorageBackend, StudyExistsError, import_json_study
+
+
+class Command(BaseCommand):
+    help = "Import a study's assignments, selections, and results into the SQLite storage backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('study_id', help='Folder name under the resources directory.')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete rows already stored for the study before importing.')
+        parser.add_argument('--database', default=SQLITE_PATH,
+                            help='SQLite database file (default: %(default)s).')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        study_id = options['study_id']
+        if not os.path.isdir(os.path.join(options['resources_dir'], study_id)):
+            raise CommandError(f"No study directory for '{study_id}' in {options['resources_dir']}")
+
+        source = JsonStorageBackend(options['resources_dir'])
+        target = SQLiteStorageBackend(options['database'], results_options=results_writer_options())
+        try:
+            counts = import_json_study(source, target, study_id, replace=options['replace'])
+        except StudyExistsError as exc:
+            raise CommandError(f"{exc}; use --replace") from exc
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['users']} users, {counts['selections']} selections and "
+            f"{counts['results']} results for {study_id} into {options['database']}"
+        ))
+        if counts['invalid_selections'] or counts['invalid_results']:
+            self.stderr.write(self.style.WARNING(
+                f"Skipped {counts['invalid_selections']} selections and {counts['invalid_results']} results "
+                f"without a valid user id, case id, or item list"
+            ))
@@ -0,0 +1,72 @@
+"""
+manage.py import_synthea <csv_dir> <study_id>
+
+Convert a Synthea CSV export (`encounters.csv`, `patients.csv`,
+`observations.csv`, `medications.csv`, and the note tables) into the study
+folder `resources/<study_id>/`, one case per selected encounter. Tables are
+streamed in chunks and partitioned by encounter, and shards of encounters are
+converted in parallel (see `SEMRinterface.synthea`). Importing into an
+existing study adds the cases to its `case_details.json` and
+`list_case_dicts.json`; re-imported encounters replace their earlier cases.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface.manifest import refresh_manifests
+from SEMRinterface.services import RESOURCES_DIR
+from SEMRinterface.synthea import import_study
+
+
+class Command(BaseCommand):
+    help = "Import a Synthea CSV export as a study, one case per encounter."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_dir', help='Folder holding the Synthea CSV files.')
+        parser.add_argument('study_id', help='Folder name under the resources directory.')
+        parser.add_argument('--encounter-class', action='append', dest='encounter_classes',
+                            help="ENCOUNTERCLASS to import; repeatable (default: inpatient). Use 'all' for every class.")
+        parser.add_argument('--reason', help='Only import encounters whose reason or description contains this text.')
+        parser.add_argument('--limit', type=int, help='Import at most this many encounters.')
+        parser.add_argument('--time-steps', type=int, default=2,
+                            help='Time steps per case in case_details.json (default: %(default)s).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: one per CPU).')
+        parser.add_argument('--shard-size', type=int, default=500,
+                            help='Encounters per worker task (default: %(default)s).')
+        parser.add_argument('--chunk-rows', type=int, default=50000,
+                            help='Rows buffered per table before spooling to disk (default: %(default)s).')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        csv_dir = options['csv_dir']
+        for filename in ('encounters.csv', 'patients.csv'):
+            if not os.path.isfile(os.path.join(csv_dir, filename)):
+                raise CommandError(f"{filename} not found in {csv_dir}")
+        if options['time_steps'] < 1:
+            raise CommandError('--time-steps must be at least 1')
+        classes = options['encounter_classes'] or ['inpatient']
+        if 'all' in classes:
+            classes = []
+
+        study_dir = os.path.join(options['resources_dir'], options['study_id'])
+        os.makedirs(study_dir, exist_ok=True)
+        counts = import_study(
+            csv_dir, study_dir,
+            workers=options['workers'],
+            shard_size=options['shard_size'],
+            chunk_rows=options['chunk_rows'],
+            encounter_classes=tuple(classes),
+            reason=options['reason'],
+            limit=options['limit'],
+            time_steps=options['time_steps'],
+            log=self.stdout.write,
+        )
+        if not counts['cases']:
+            raise CommandError('No encounters matched; nothing was imported')
+        refresh_manifests(options['resources_dir'], study_ids=[options['study_id']])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['cases']} cases into {study_dir}"
+        ))
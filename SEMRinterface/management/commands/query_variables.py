@@ -0,0 +1,67 @@
+"""
+manage.py query_variables <study_id> [variable] [--min-value X] [--max-value Y] [--time-step N]
+
+Query a study's variable index (built by `manage.py compile_study`) for
+cohort discovery. Without a variable, lists every indexed observation and
+medication with its case and point counts and value range; with one, lists
+the cases that have a point of it in the value range, optionally within a
+`case_details.json` time step:
+
+    manage.py query_variables demo_study LAC --min-value 4 --time-step 0
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SEMRinterface import jsoncodec
+from SEMRinterface.services import RESOURCES_DIR, get_study_variable_index, query_variable_index
+
+
+class Command(BaseCommand):
+    help = "List indexed variables of a study, or the cases with a variable in a value range."
+
+    def add_arguments(self, parser):
+        parser.add_argument('study_id', help='Folder name under the resources directory.')
+        parser.add_argument('variable', nargs='?', help='Observation or medication id to query.')
+        parser.add_argument('--min-value', type=float, default=None, help='Inclusive lower value bound.')
+        parser.add_argument('--max-value', type=float, default=None, help='Inclusive upper value bound.')
+        parser.add_argument('--time-step', type=int, default=None,
+                            help="Only count points in this case_details.json time step.")
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON.')
+        parser.add_argument('--resources-dir', default=RESOURCES_DIR,
+                            help='Root resources directory (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        study_id = options['study_id']
+        resources_dir = options['resources_dir']
+        if not os.path.isdir(os.path.join(resources_dir, study_id)):
+            raise CommandError(f"Unknown study id: {study_id}")
+        index = get_study_variable_index(study_id, resources_dir)
+        if index is None:
+            raise CommandError(f"No variable index for {study_id}; run manage.py compile_study {study_id}")
+
+        if not options['variable']:
+            variables = index.variables()
+            if options['json']:
+                self.stdout.write(jsoncodec.dumps(variables).decode('utf-8'))
+                return
+            for var_id, summary in variables.items():
+                self.stdout.write(f"{var_id} ({summary['kind']}): {summary['case_count']} cases, "
+                                  f"{summary['points']} points, values {summary['min_v']}..{summary['max_v']}")
+            self.stdout.write(self.style.SUCCESS(f"{len(variables)} variables indexed for {study_id}"))
+            return
+
+        try:
+            result = query_variable_index(study_id, options['variable'], options['min_value'],
+                                          options['max_value'], options['time_step'], resources_dir)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['json']:
+            self.stdout.write(jsoncodec.dumps(result).decode('utf-8'))
+            return
+        for row in result['cases']:
+            self.stdout.write(f"{row['case_id']}: {row['count']} points, values {row['min_v']}..{row['max_v']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['case_count']} cases match ({result['scanned_cases']} checked point by point)"
+        ))
@@ -0,0 +1,318 @@
+"""
+Precomputed manifests describing the studies under `resources/`.
+
+Each study gets a `manifest.json` listing its cases with per-case file sizes,
+series/point counts, time ranges, and variable counts (a superset of the
+Synthea `list_case_dicts.json` fields), and the resources directory gets a
+`studies_manifest.json` index summarising every study. Request handlers read
+these two small files (through the parsed-JSON cache) instead of listing
+directories.
+
+Manifests are never built on the request path. They are written by
+`manage.py build_manifest` and the importers, and by the `ManifestRefresher`
+thread, which refreshes once at startup and then every `interval` seconds;
+until the first index exists, requests see an empty one. Each worker process
+runs a refresher, but a non-blocking `flock` on `REFRESH_LOCK_FILENAME`
+elects one of them per pass, so the others skip it.
+
+Manifests record a `signature` of the folders they were built from. A
+refresh recomputes signatures (one listing of `cases_all` and one `stat` per
+case folder, no parsing) and rebuilds the manifests of studies that changed,
+re-reading only the case folders whose mtime differs from the one recorded
+in the previous manifest. Case files are expected to be replaced (written
+and renamed, as the importers and most tools do), which updates their
+folder's mtime; after editing a file in place, run
+`manage.py build_manifest --force`, which re-reads every case.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import jsoncodec
+from .cache import file_signature
+from .case_store import CASE_FILENAMES
+from .filelock import try_flocked
+from .timeseries import SERIES_KEYS
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = 'manifest.json'
+INDEX_FILENAME = 'studies_manifest.json'
+REFRESH_LOCK_FILENAME = '.studies_manifest.lock'
+
+#: Study-level files whose changes invalidate the manifest.
+STUDY_FILENAMES = ('case_details.json',)
+
+
+def _write_json_atomic(data: Dict, path: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(jsoncodec.dumps(data))
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'rb') as file:
+            return jsoncodec.loads(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def list_study_dirs(resources_dir: str) -> List[str]:
+    """Return the study folder names in `resources_dir` (directory scan)."""
+    if not os.path.isdir(resources_dir):
+        return []
+    return sorted(item for item in os.listdir(resources_dir)
+                  if os.path.isdir(os.path.join(resources_dir, item)))
+
+
+def list_case_dirs(study_dir: str) -> List[str]:
+    """Return the case folder names in `study_dir/cases_all` (directory scan)."""
+    cases_dir = os.path.join(study_dir, 'cases_all')
+    if not os.path.isdir(cases_dir):
+        return []
+    return sorted(item for item in os.listdir(cases_dir)
+                  if os.path.isdir(os.path.join(cases_dir, item)))
+
+
+def study_signature(study_dir: str) -> str:
+    """Digest of the study files' and case folders' modification times.
+
+    A case folder's mtime changes whenever a file in it is created, removed,
+    or replaced by rename, so one `stat` per case stands in for the four
+    case files.
+    """
+    digest = hashlib.sha1()
+    for filename in STUDY_FILENAMES:
+        digest.update(f"{filename}:{file_signature(os.path.join(study_dir, filename))}\n".encode())
+    try:
+        entries = sorted(os.scandir(os.path.join(study_dir, 'cases_all')), key=lambda entry: entry.name)
+    except OSError:
+        entries = []
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                digest.update(f"{entry.name}:{entry.stat().st_mtime_ns}\n".encode())
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def _update_range(summary: Dict, t) -> None:
+    if summary['min_t'] is None or t < summary['min_t']:
+        summary['min_t'] = t
+    if summary['max_t'] is None or t > summary['max_t']:
+        summary['max_t'] = t
+
+
+def summarize_case(case_dir: str) -> Dict:
+    """Describe one case folder without keeping its data in memory."""
+    summary = {
+        'case_id': os.path.basename(case_dir),
+        'file_sizes': {},
+        'bytes': 0,
+        'number_of_observation_fields': 0,
+        'number_of_medication_fields': 0,
+        'series': 0,
+        'points': 0,
+        'notes': 0,
+        'min_t': None,
+        'max_t': None,
+    }
+    for key, filename in CASE_FILENAMES.items():
+        path = os.path.join(case_dir, filename)
+        sig = file_signature(path)
+        if sig is None:
+            continue
+        summary['file_sizes'][filename] = sig[1]
+        summary['bytes'] += sig[1]
+        if key == 'demographics':
+            continue
+        data = _read_json(path)
+        if not isinstance(data, dict):
+            continue
+        if key == 'notes':
+            for notes in data.values():
+                for note in notes if isinstance(notes, list) else []:
+                    summary['notes'] += 1
+                    if isinstance(note, dict) and isinstance(note.get('js_time'), (int, float)):
+                        _update_range(summary, note['js_time'])
+            continue
+        summary['number_of_observation_fields' if key == 'observations'
+                else 'number_of_medication_fields'] = len(data)
+        for variable in data.values():
+            for series_key in SERIES_KEYS:
+                for series in (variable.get(series_key) or []) if isinstance(variable, dict) else []:
+                    points = series.get('data') or []
+                    summary['series'] += 1
+                    summary['points'] += len(points)
+                    if points:
+                        _update_range(summary, min(p[0] for p in points))
+                        _update_range(summary, max(p[0] for p in points))
+    return summary
+
+
+def build_study_manifest(study_dir: str, signature: Optional[str] = None,
+                         previous: Optional[Dict] = None) -> Dict:
+    """Summarise every case of `study_dir` and write its `manifest.json`.
+
+    Case summaries in `previous` (the study's last manifest) are reused for
+    case folders whose mtime is unchanged, so only changed cases are read.
+    """
+    signature = signature or study_signature(study_dir)
+    case_details = _read_json(os.path.join(study_dir, 'case_details.json')) or {}
+    reusable = {case.get('case_id'): case for case in (previous or {}).get('cases') or []}
+    cases = []
+    for case_id in list_case_dirs(study_dir):
+        case_dir = os.path.join(study_dir, 'cases_all', case_id)
+        try:
+            mtime_ns = os.stat(case_dir).st_mtime_ns
+        except OSError:
+            continue
+        summary = reusable.get(case_id)
+        if summary is None or summary.get('mtime_ns') != mtime_ns:
+            # The mtime is taken first, so a change made while reading is picked up next time.
+            summary = summarize_case(case_dir)
+            summary['mtime_ns'] = mtime_ns
+        summary = dict(summary, time_steps=len(case_details.get(case_id) or []))
+        cases.append(summary)
+    times = [t for case in cases for t in (case['min_t'], case['max_t']) if t is not None]
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'study_id': os.path.basename(os.path.normpath(study_dir)),
+        'signature': signature,
+        'built_at': time.time(),
+        'case_count': len(cases),
+        'total_bytes': sum(case['bytes'] for case in cases),
+        'total_points': sum(case['points'] for case in cases),
+        'min_t': min(times) if times else None,
+        'max_t': max(times) if times else None,
+        'cases': cases,
+    }
+    _write_json_atomic(manifest, os.path.join(study_dir, MANIFEST_FILENAME))
+    return manifest
+
+
+def _index_entry(manifest: Dict) -> Dict:
+    return {key: manifest.get(key) for key in
+            ('case_count', 'total_bytes', 'total_points', 'min_t', 'max_t', 'built_at')}
+
+
+def refresh_manifests(resources_dir: str, force: bool = False,
+                      study_ids: Optional[List[str]] = None) -> Dict:
+    """Rebuild stale (or, with `force`, all) study manifests and the index.
+
+    `study_ids` limits which studies are checked; the index still lists
+    every study folder. Without `force`, unchanged cases of a stale study
+    are not re-read. Returns the index.
+    """
+    index_path = os.path.join(resources_dir, INDEX_FILENAME)
+    old_index = _read_json(index_path) or {}
+    studies = {}
+    changed = old_index.get('version') != MANIFEST_VERSION
+    for study_id in list_study_dirs(resources_dir):
+        study_dir = os.path.join(resources_dir, study_id)
+        manifest = _read_json(os.path.join(study_dir, MANIFEST_FILENAME))
+        if study_ids is None or study_id in study_ids:
+            signature = study_signature(study_dir)
+            if (force or manifest is None or manifest.get('version') != MANIFEST_VERSION
+                    or manifest.get('signature') != signature):
+                logger.info("Building manifest for study '%s'", study_id)
+                previous = manifest if not force and manifest and manifest.get('version') == MANIFEST_VERSION else None
+                manifest = build_study_manifest(study_dir, signature, previous)
+        elif manifest is None:
+            manifest = build_study_manifest(study_dir)
+        studies[study_id] = _index_entry(manifest)
+        changed = changed or studies[study_id] != (old_index.get('studies') or {}).get(study_id)
+    if changed or set(studies) != set(old_index.get('studies') or {}):
+        index = {'version': MANIFEST_VERSION, 'built_at': time.time(), 'studies': studies}
+        _write_json_atomic(index, index_path)
+        return index
+    return old_index
+
+
+class ManifestRefresher:
+    """Daemon thread that calls `refresh_manifests` at startup and every `interval` seconds.
+
+    An `interval` of 0 refreshes once at startup only. Passes are skipped
+    while another process's refresher holds the refresh lock.
+    """
+
+    def __init__(self, resources_dir: str, interval: float):
+        self.resources_dir = resources_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None and os.path.isdir(self.resources_dir):
+            self._thread = threading.Thread(target=self._run, name='semr-manifest-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def refresh(self) -> bool:
+        """Run one pass unless another process is refreshing; returns True if it ran."""
+        try:
+            lock = open(os.path.join(self.resources_dir, REFRESH_LOCK_FILENAME), 'ab')
+        except OSError:
+            # A read-only resources directory cannot hold the lock; refresh unelected.
+            refresh_manifests(self.resources_dir)
+            return True
+        with lock, try_flocked(lock) as elected:
+            if elected:
+                refresh_manifests(self.resources_dir)
+            return elected
+
+    def _run(self) -> None:
+        delay = 0
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+            except Exception:
+                # Keep refreshing: a malformed study must not stop the thread for good.
+                logger.exception("Failed to refresh manifests in %s", self.resources_dir)
+            if self.interval <= 0:
+                return
+            delay = self.interval
+
+
+_refreshers: Dict[str, ManifestRefresher] = {}
+_refreshers_lock = threading.Lock()
+
+
+def load_study_index(resources_dir: str, load: Callable[[str], Optional[Dict]],
+                     refresh_interval: float = 0) -> Dict:
+    """Return the studies index; manifests are never built here.
+
+    `load` reads a JSON path (normally the cached `services.load_json`). The
+    first call for `resources_dir` starts its `ManifestRefresher`. Until an
+    index has been written, an empty one (with `built_at` None) is returned.
+    """
+    key = os.path.abspath(resources_dir)
+    with _refreshers_lock:
+        if key not in _refreshers:
+            _refreshers[key] = ManifestRefresher(resources_dir, refresh_interval)
+            _refreshers[key].start()
+    index = load(os.path.join(resources_dir, INDEX_FILENAME))
+    if index is None or index.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'built_at': None, 'studies': {}}
+    return index
+
+
+def _reset_after_fork() -> None:
+    # Threads do not survive fork; children start their own refreshers.
+    global _refreshers_lock
+    _refreshers.clear()
+    _refreshers_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
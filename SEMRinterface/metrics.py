@@ -0,0 +1,299 @@
+"""
+Lightweight in-process metrics exported in the Prometheus text format.
+
+A process-wide `REGISTRY` holds counters and histograms (plain dicts guarded
+by one lock per metric, no external dependency). They are fed by:
+
+- `MetricsMiddleware`: per-view request latency histograms, request counts
+  by status, and response bytes;
+- hooks in the service layer: files opened and bytes read (by kind), JSON
+  decode and payload serialization time, and template render time;
+- collectors called at scrape time, e.g. the JSON and payload cache
+  hit/miss counters and hit ratios reported by `SEMRinterface.services`.
+
+`render()` returns the text served at `/api/metrics/`. Each recording costs
+a `perf_counter` pair, a lock, and a dict update, so instrumentation can
+stay on in production. Values are per process: with several worker
+processes, scrape each one (or aggregate in Prometheus).
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - psutil is optional
+    psutil = None
+
+#: Latency buckets in seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {entry[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(entry[-1])}")
+        return lines
+
+
+class Registry:
+    """Named metrics plus scrape-time collectors."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict, float]]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict, float]]]) -> None:
+        """Add a callable returning `(name, kind, help, labels, value)` samples at scrape time."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        described = set()
+        for collector in collectors:
+            for name, kind, help_text, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'semr_request_duration_seconds', 'Time to produce a response, by view.', ('view', 'method'))
+REQUESTS = REGISTRY.counter('semr_requests_total', 'Requests handled, by view and status.',
+                            ('view', 'method', 'status'))
+RESPONSE_BYTES = REGISTRY.counter('semr_response_bytes_total',
+                                  'Bytes in non-streaming response bodies, by view.', ('view',))
+FILES_OPENED = REGISTRY.counter('semr_files_opened_total', 'Data files opened, by kind.', ('kind',))
+BYTES_READ = REGISTRY.counter('semr_read_bytes_total', 'Bytes read from data files, by kind.', ('kind',))
+JSON_DECODE = REGISTRY.histogram('semr_json_decode_seconds', 'Time spent decoding JSON files.')
+SERIALIZE = REGISTRY.histogram('semr_serialize_seconds', 'Time spent serializing case payloads.')
+TEMPLATE_RENDER = REGISTRY.histogram('semr_template_render_seconds', 'Time spent rendering templates.',
+                                     ('template',))
+#: Request methods reported as themselves in the `method` label.
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def _process_start_time() -> float:
+    """Unix time at which this process started.
+
+    Read from the OS when the optional `psutil` package is installed;
+    otherwise the current time, which is close enough when called while the
+    WSGI/ASGI handler loads its middleware or right after a worker forks.
+    """
+    if psutil is not None:
+        try:
+            return psutil.Process().create_time()
+        except psutil.Error:
+            pass
+    return time.time()
+
+
+PROCESS_START = _process_start_time()
+REGISTRY.register_collector(lambda: [
+    ('semr_process_start_time_seconds', 'gauge', 'Start time of the process (Unix time).', {}, PROCESS_START),
+])
+
+
+def record_read(kind: str, nbytes: int) -> None:
+    """Count one opened file of `kind` and the bytes read from it."""
+    FILES_OPENED.inc(kind=kind)
+    BYTES_READ.inc(nbytes, kind=kind)
+
+
+def cache_samples(name: str, stats: Dict) -> List[Tuple[str, str, str, Dict, float]]:
+    """Collector samples for a `BoundedLRUCache.stats()` mapping."""
+    labels = {'cache': name}
+    return [
+        ('semr_cache_hits_total', 'counter', 'Cache hits, by cache.', labels, stats.get('hits', 0)),
+        ('semr_cache_misses_total', 'counter', 'Cache misses, by cache.', labels, stats.get('misses', 0)),
+        ('semr_cache_evictions_total', 'counter', 'Cache evictions, by cache.', labels, stats.get('evictions', 0)),
+        ('semr_cache_bytes', 'gauge', 'Bytes held, by cache.', labels, stats.get('bytes', 0)),
+        ('semr_cache_hit_ratio', 'gauge', 'Hits over lookups since start, by cache.', labels,
+         stats.get('hit_ratio', 0.0)),
+    ]
+
+
+class MetricsMiddleware:
+    """Record latency, status, and response size of every request.
+
+    The view label is the URL pattern name (`unmatched` for requests that
+    did not resolve). For streaming responses the latency covers building
+    the response, not sending it, and no bytes are counted. Disabled with
+    `settings.SEMR_METRICS_ENABLED = False`.
+
+    Works in both sync and async chains, so async views served over ASGI
+    are not adapted through a thread. Methods outside `HTTP_METHODS` are
+    labelled `other`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        # Imported here so the service layer can record metrics without Django.
+        from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+        from django.conf import settings
+        from django.core.exceptions import MiddlewareNotUsed
+
+        if not getattr(settings, 'SEMR_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _record(request, response, elapsed: float) -> None:
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=method)
+        REQUESTS.inc(view=view, method=method, status=response.status_code)
+        if not response.streaming:
+            RESPONSE_BYTES.inc(len(response.content), view=view)
+
+
+def _reset_after_fork() -> None:
+    # A lock held by another thread at fork time would never be released.
+    # A forked worker is a new process, started now.
+    global PROCESS_START
+    PROCESS_START = _process_start_time()
+    for metric in REGISTRY._metrics.values():
+        metric._lock = threading.Lock()
+    REGISTRY._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
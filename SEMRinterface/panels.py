@@ -0,0 +1,153 @@
+"""
+Server-side assembly of the case viewer's grouped panels.
+
+The case viewer shows observations in physiologic and lab panels grouped by
+each variable's `display_group` (`variable_details.json`), and medications
+in panels grouped by `med_route` (`med_details.json`), in the group order of
+the study's `data_layout.json` (`physio_panel_groups`, `lab_panel_groups`,
+`med_panel_groups`). Rather than have the browser download and scan those
+dictionaries, `build_group_index` turns them into a per-study index
+(group -> ordered variable ids plus display metadata) once, and
+`assemble_panels` projects a case onto it:
+
+    {"physio_data": [{"id": "Vitals", "name": "Vitals",
+                      "variables": [{"id": "VTHR", "name": "Heart Rate", "units": "bpm", ...}]}],
+     "lab_data": [...], "med_data": [...],
+     "instructions": "...", "active_time_step": {"index": 0, "min_t": ..., ...}}
+
+Only groups and variables present in the case are emitted; the series
+themselves stay in `observations`/`medications` under the same ids.
+Observations with no `variable_details.json` entry are listed in a trailing
+`UNASSIGNED` lab group so they are never silently hidden.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+UNASSIGNED_GROUP = 'UNASSIGNED'
+
+#: Default text for each `instruction_set` used in `case_details.json`.
+INSTRUCTION_SETS = {
+    'familiar': "Review the patient's record to become familiar with the case. "
+                "Click Continue when you are ready to move on.",
+    'select': "Select the information that was relevant to your assessment of the patient, "
+              "then click Continue.",
+}
+
+
+def group_label(group_id: str) -> str:
+    """Human-readable name of a group id (`Blood_Gases` -> `Blood Gases`)."""
+    return group_id.replace('_', ' ')
+
+
+def build_group_index(data_layout: Optional[Dict], variable_details: Optional[Dict],
+                      med_details: Optional[Dict]) -> Dict:
+    """Return the per-study group index.
+
+    The index maps panel kind ('physio', 'lab', 'med') to an ordered list of
+    `(group_id, [variable_id, ...])` pairs, and 'variables'/'medications' to
+    the display metadata of each id. Variables keep their order in the
+    details files; groups not listed in `data_layout.json` are left out.
+    """
+    data_layout = data_layout or {}
+    variable_details = variable_details or {}
+    med_details = med_details or {}
+    kinds = {
+        'physio': data_layout.get('physio_panel_groups') or [],
+        'lab': data_layout.get('lab_panel_groups') or [],
+        'med': data_layout.get('med_panel_groups') or [],
+    }
+    members: Dict[str, Dict[str, List[str]]] = {kind: {g: [] for g in groups} for kind, groups in kinds.items()}
+    physio_groups = set(kinds['physio'])
+
+    variables = {}
+    for variable_id, details in variable_details.items():
+        group = details.get('display_group')
+        kind = 'physio' if group in physio_groups else 'lab'
+        if group in members[kind]:
+            members[kind][group].append(variable_id)
+        variables[variable_id] = {
+            'name': details.get('display_name') or variable_id,
+            'units': details.get('units', ''),
+            'normal_range': details.get('dflt_normal_ranges'),
+            'y_axis_range': details.get('dflt_y_axis_ranges'),
+        }
+    medications = {}
+    for med_id, details in med_details.items():
+        route = details.get('med_route')
+        if route in members['med']:
+            members['med'][route].append(med_id)
+        medications[med_id] = {'name': details.get('display_name') or med_id}
+
+    index = {kind: [(group, ids) for group, ids in groups.items()] for kind, groups in members.items()}
+    index['variables'] = variables
+    index['medications'] = medications
+    return index
+
+
+def _panels(groups, present: Dict, metadata: Dict) -> List[Dict]:
+    panels = []
+    for group, ids in groups:
+        entries = [dict(metadata[i], id=i) for i in ids if i in present]
+        if entries:
+            panels.append({'id': group, 'name': group_label(group), 'variables': entries})
+    return panels
+
+
+def assemble_panels(case_files: Dict, index: Dict, steps: List[Dict], time_step: Optional[int],
+                    instruction_sets: Optional[Dict] = None) -> Dict:
+    """Return `case_files` plus grouped panels and the active step's instruction.
+
+    `steps` is the case's `case_details.json` entry and `time_step` the
+    active index (the first step when None). `instruction_sets` maps
+    instruction set names to text; unknown sets yield `instructions: None`.
+    """
+    observations = case_files.get('observations') or {}
+    medications = case_files.get('medications') or {}
+    lab_data = _panels(index['lab'], observations, index['variables'])
+    unassigned = [{'id': i, 'name': (observations[i] or {}).get('display_text') or i, 'units': ''}
+                  for i in observations if i not in index['variables']]
+    if unassigned:
+        unassigned_group = next((p for p in lab_data if p['id'] == UNASSIGNED_GROUP), None)
+        if unassigned_group is None:
+            lab_data.append({'id': UNASSIGNED_GROUP, 'name': group_label(UNASSIGNED_GROUP),
+                             'variables': unassigned})
+        else:
+            unassigned_group['variables'].extend(unassigned)
+
+    step_index = 0 if time_step is None else time_step
+    step = steps[step_index] if 0 <= step_index < len(steps) else None
+    instruction_sets = INSTRUCTION_SETS if instruction_sets is None else instruction_sets
+    return dict(
+        case_files,
+        physio_data=_panels(index['physio'], observations, index['variables']),
+        lab_data=lab_data,
+        med_data=_panels(index['med'], medications, index['medications']),
+        instructions=instruction_sets.get(step.get('instruction_set')) if step else None,
+        active_time_step=dict(step, index=step_index) if step else None,
+    )
+
+
+_indexes: Dict[str, tuple] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_group_index(study_dir: str, load: Callable[[str], Optional[Dict]]) -> Dict:
+    """Return the cached group index of a study, rebuilding it when its sources change.
+
+    `load` reads a JSON path (normally the cached `services.load_json`,
+    which returns the same object while a file is unchanged, so staleness
+    is an identity check).
+    """
+    sources = tuple(load(os.path.join(study_dir, filename))
+                    for filename in ('data_layout.json', 'variable_details.json', 'med_details.json'))
+    key = os.path.abspath(study_dir)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and all(a is b for a, b in zip(cached[0], sources)):
+        return cached[1]
+    index = build_group_index(*sources)
+    with _indexes_lock:
+        _indexes[key] = (sources, index)
+    return index
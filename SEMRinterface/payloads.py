@@ -0,0 +1,298 @@
+"""
+Serialized, precompressed case-data payloads.
+
+Case data is effectively immutable once a study is published, so the
+`/api/get_case_data/` response for a given case and set of query options is
+serialized once, compressed, and kept on disk next to the compiled store:
+
+    resources/<study_id>/compiled/<case_id>/payloads/<variant>.<etag>.<json|bin>[.gz|.br]
+
+`case_data_etag` derives a strong validator from `os.stat` signatures of the
+case files (and `case_details.json`, which defines time-step windows), so a
+conditional request can be answered with 304 without reading any case JSON.
+Brotli encodings are produced only when the optional `brotli` package is
+installed. The `format` option selects one of the wire formats of
+`SEMRinterface.wireformats`; binary payloads are stored as `.bin`.
+
+Only the bounded option sets (time steps, panels, formats) are stored on
+disk. Payloads for `TRANSIENT_OPTIONS`, whose values are open-ended, are
+built per request and left to the caller's in-memory cache, so arbitrary
+client options cannot grow the payload directory.
+
+For the unfiltered payload of a case whose files were validated by
+`manage.py compile_study`, `iter_raw_case_payload` splices the on-disk JSON
+bytes into the response envelope without decoding them at all. The
+`panels` option (which the case viewer always sends) does not change the
+case files, so such payloads are passed through too, with the panel keys
+appended after the raw files.
+"""
+
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from . import jsoncodec, metrics, wireformats
+from .cache import file_signature
+from .case_store import CASE_FILENAMES, SOURCES_FILENAME, compiled_case_dir, is_case_validated
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+#: Bump when the payload layout changes so stale validators stop matching.
+PAYLOAD_VERSION = 1
+PAYLOADS_DIRNAME = 'payloads'
+
+#: Study-level files that panel assembly (the `panels` option) reads.
+PANEL_FILENAMES = ('data_layout.json', 'variable_details.json', 'med_details.json')
+
+#: Read size used when streaming raw case files.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+#: Options with open-ended values; payloads that set one are never stored on disk.
+TRANSIENT_OPTIONS = ('max_points', 'variables')
+
+#: Options that only add keys next to the case files, so the raw files can still be passed through.
+PASSTHROUGH_OPTIONS = ('panels',)
+
+#: Content-Encoding -> file suffix, in server preference order.
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz', 'identity': ''}
+
+
+def available_encodings() -> list:
+    """Return the content encodings this process can produce, preferred first."""
+    return [e for e in ENCODING_SUFFIXES if e != 'br' or brotli is not None]
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Pick the best available encoding for an `Accept-Encoding` header value."""
+    accepted = {}
+    for token in (accept_encoding or '').split(','):
+        parts = token.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    for encoding in available_encodings():
+        if encoding == 'identity':
+            break
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return 'identity'
+
+
+def payload_variant(options: Dict) -> str:
+    """Return a short, filename-safe key for a set of query options."""
+    canonical = json.dumps({k: v for k, v in options.items() if v is not None}, sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def is_persistent_variant(options: Dict) -> bool:
+    """Return True if payloads for `options` are stored in the payload directory."""
+    return all(options.get(name) is None for name in TRANSIENT_OPTIONS)
+
+
+def is_passthrough_variant(options: Dict) -> bool:
+    """Return True if payloads for `options` leave the case files untouched."""
+    return all(v is None for k, v in options.items() if k not in PASSTHROUGH_OPTIONS)
+
+
+def is_safe_id(identifier: str) -> bool:
+    """Return True if `identifier` names a single directory entry."""
+    return bool(identifier) and identifier not in ('.', '..') and not any(sep in identifier for sep in '/\\')
+
+
+def case_data_etag(study_dir: str, case_id: str, options: Dict, encoding: str = 'identity') -> Optional[str]:
+    """Return a strong ETag for a case payload, or None if the case is missing.
+
+    Only `stat` calls are made. The encoding is part of the tag because the
+    bytes on the wire differ between encodings. Payloads with panels also
+    depend on the study's layout and variable/medication details. For
+    options that allow it (`is_passthrough_variant`) the tag also covers
+    the compiled store's validation record, which decides whether the raw
+    case bytes are passed through (`can_passthrough`) or a compact payload
+    is built.
+    """
+    case_dir = os.path.join(study_dir, 'cases_all', case_id)
+    if not is_safe_id(case_id) or not os.path.isdir(case_dir):
+        return None
+    parts = [str(PAYLOAD_VERSION), payload_variant(options)]
+    for filename in CASE_FILENAMES.values():
+        parts.append(repr(file_signature(os.path.join(case_dir, filename))))
+    parts.append(repr(file_signature(os.path.join(study_dir, 'case_details.json'))))
+    if options.get('panels'):
+        for filename in PANEL_FILENAMES:
+            parts.append(repr(file_signature(os.path.join(study_dir, filename))))
+    if is_passthrough_variant(options):
+        parts.append(repr(file_signature(os.path.join(compiled_case_dir(study_dir, case_id), SOURCES_FILENAME))))
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+    return digest if encoding == 'identity' else f"{digest}-{encoding}"
+
+
+def serialize_payload(case_data: Dict, fmt: Optional[str] = None) -> bytes:
+    """Return the success envelope for `case_data` in wire format `fmt`.
+
+    The default (None) is compact UTF-8 JSON; 'columnar' and 'binary' are
+    described in `SEMRinterface.wireformats`.
+    """
+    envelope = {'status': 'success', 'case_data': case_data}
+    with metrics.SERIALIZE.time():
+        if fmt == 'columnar':
+            return wireformats.serialize_columnar(envelope)
+        if fmt == 'binary':
+            return wireformats.serialize_binary(envelope)
+        return jsoncodec.dumps(envelope)
+
+
+def can_passthrough(study_dir: str, case_id: str, options: Dict,
+                    load_index: Optional[Callable[[str], Optional[Dict]]] = None) -> bool:
+    """Return True if the raw case files can be streamed as the payload.
+
+    That requires no options that reshape the case files (`panels` is
+    allowed) and a compiled store whose recorded signatures show every case
+    file was validated and is unchanged. `load_index` reads the store's
+    `sources.json`; pass the service layer's cached `load_json` so the
+    check costs only `stat` calls.
+    """
+    if not is_passthrough_variant(options):
+        return False
+    case_dir = os.path.join(study_dir, 'cases_all', case_id)
+    out_dir = compiled_case_dir(study_dir, case_id)
+    if load_index is None:
+        return is_case_validated(case_dir, out_dir)
+    return is_case_validated(case_dir, out_dir, load_index)
+
+
+def iter_raw_case_payload(study_dir: str, case_id: str, chunk_size: int = STREAM_CHUNK_SIZE,
+                          extra: Optional[Dict] = None) -> Iterator[bytes]:
+    """Yield the success envelope with the case files' bytes spliced in verbatim.
+
+    The output is equivalent to `serialize_payload(get_case_files(...))`
+    without a time step or downsampling, but only one read buffer is held
+    at a time. Missing files are emitted as `null`, as `load_json` would.
+    `extra` keys (the panels) are serialized after the case files.
+    """
+    case_dir = os.path.join(study_dir, 'cases_all', case_id)
+    yield b'{"status":"success","case_data":{'
+    for position, (key, filename) in enumerate(CASE_FILENAMES.items()):
+        yield (',' if position else '').encode('utf-8') + f'"{key}":'.encode('utf-8')
+        try:
+            file = open(os.path.join(case_dir, filename), 'rb')
+        except FileNotFoundError:
+            yield b'null'
+            continue
+        read = 0
+        with file:
+            while True:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    break
+                read += len(chunk)
+                yield chunk
+        metrics.record_read('raw_case', read)
+    for key, value in (extra or {}).items():
+        yield b',' + jsoncodec.dumps(key) + b':' + jsoncodec.dumps(value)
+    yield b'}}'
+
+
+def encode_payload(body: bytes, encoding: str) -> bytes:
+    """Compress `body` with `encoding` ('gzip', 'br', or 'identity')."""
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body)
+    return body
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def _payload_location(study_dir: str, case_id: str, options: Dict,
+                      etag: Optional[str] = None) -> Tuple[str, str, str]:
+    """Return `(payload_dir, variant, stem)`; raises FileNotFoundError for unknown cases.
+
+    `stem` is the payload's file name without the encoding suffix. `etag`
+    is the payload's `case_data_etag` (in any encoding) when the caller
+    already has it; otherwise it is computed here.
+    """
+    if etag is None:
+        etag = case_data_etag(study_dir, case_id, options)
+        if etag is None:
+            raise FileNotFoundError(f"Case '{case_id}' not found in {study_dir}")
+    payload_dir = os.path.join(compiled_case_dir(study_dir, case_id), PAYLOADS_DIRNAME)
+    variant = payload_variant(options)
+    extension = wireformats.FILE_EXTENSIONS[options.get('format')]
+    return payload_dir, variant, f"{variant}.{etag.partition('-')[0]}.{extension}"
+
+
+def _read_payload_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as file:
+            body = file.read()
+    except OSError:
+        return None
+    metrics.record_read('payload', len(body))
+    return body
+
+
+def read_encoded_payload(study_dir: str, case_id: str, options: Dict, encoding: str,
+                         etag: Optional[str] = None) -> Optional[bytes]:
+    """Return the stored payload for the current ETag, or None if not built yet.
+
+    Always None for options that are not stored (`is_persistent_variant`).
+    Raises FileNotFoundError when the case does not exist. Pass the
+    request's `etag` to skip recomputing it.
+    """
+    payload_dir, _, stem = _payload_location(study_dir, case_id, options, etag)
+    if not is_persistent_variant(options):
+        return None
+    return _read_payload_file(os.path.join(payload_dir, stem + ENCODING_SUFFIXES[encoding]))
+
+
+def get_encoded_payload(study_dir: str, case_id: str, options: Dict, encoding: str,
+                        build: Callable[[], bytes], etag: Optional[str] = None) -> bytes:
+    """Return the encoded payload for a case, building it on first use.
+
+    `build` returns the uncompressed body and is only called when no
+    payload file for the current ETag exists. Every available encoding is
+    written at once and older files for the same options are removed. If
+    the payload directory is not writable, or the options are transient,
+    the payload is built in memory in the requested encoding only. Pass the
+    request's `etag` to skip recomputing it.
+    """
+    payload_dir, variant, stem = _payload_location(study_dir, case_id, options, etag)
+    if not is_persistent_variant(options):
+        return encode_payload(build(), encoding)
+    body = _read_payload_file(os.path.join(payload_dir, stem + ENCODING_SUFFIXES[encoding]))
+    if body is not None:
+        return body
+
+    body = build()
+    encoded = {e: encode_payload(body, e) for e in available_encodings()}
+    try:
+        os.makedirs(payload_dir, exist_ok=True)
+        for name in os.listdir(payload_dir):
+            if name.startswith(variant + '.') and not name.startswith(stem):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(payload_dir, name))
+        for e, data in encoded.items():
+            _write_atomic(os.path.join(payload_dir, stem + ENCODING_SUFFIXES[e]), data)
+    except OSError:
+        pass
+    return encoded[encoding]
@@ -0,0 +1,155 @@
+"""
+Background prefetching of case-data payloads.
+
+When a reviewer opens a case, the payload they are most likely to request
+next (their next uncompleted case, or the next time step of the current one)
+can be built before they click Continue. A `Prefetcher` runs such warm-up
+tasks on a small, bounded thread pool:
+
+- Tasks are grouped by an `owner` (a study/user pair). Scheduling new work
+  for an owner cancels that owner's tasks that have not started yet, since
+  the reviewer has moved on; `cancel(owner)` does the same explicitly.
+- Tasks with the same `key` are not queued twice.
+- At most `max_pending` tasks wait at once; extra requests are dropped,
+  because prefetching is only an optimisation.
+
+The tasks themselves (see `services.prefetch_case_data`) fill the in-memory
+case payload cache, whose byte budget caps the memory prefetching may use.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Bounded, cancellable background task runner for cache warm-up.
+
+    Parameters
+    ----------
+    max_workers: int
+        Size of the thread pool. 0 disables prefetching.
+    max_pending: int
+        Maximum number of queued or running tasks.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8):
+        self.max_workers = max(0, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._tasks: Dict[Hashable, Future] = {}
+        self._owners: Dict[Hashable, set] = {}
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, key: Hashable, owner: Hashable, task: Callable[[], object]) -> bool:
+        """Queue `task` under `key` for `owner`; returns False if not queued."""
+        if self.max_workers == 0:
+            return False
+        with self._lock:
+            if key in self._tasks:
+                return True
+            if len(self._tasks) >= self.max_pending:
+                self.dropped += 1
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='semr-prefetch')
+            future = self._executor.submit(task)
+            self._tasks[key] = future
+            self._owners.setdefault(owner, set()).add(key)
+            self.scheduled += 1
+        future.add_done_callback(lambda f: self._done(key, owner, f))
+        return True
+
+    def replace(self, owner: Hashable, tasks: Dict[Hashable, Callable[[], object]]) -> int:
+        """Cancel `owner`'s pending tasks not in `tasks`, then queue `tasks`.
+
+        Returns the number of tasks queued (or already in flight).
+        """
+        with self._lock:
+            stale = self._owners.get(owner, set()) - set(tasks)
+        self._cancel_keys(stale)
+        return sum(self.submit(key, owner, task) for key, task in tasks.items())
+
+    def cancel(self, owner: Hashable) -> int:
+        """Cancel every not-yet-started task of `owner`; returns how many."""
+        with self._lock:
+            keys = set(self._owners.get(owner, ()))
+        return self._cancel_keys(keys)
+
+    def _cancel_keys(self, keys) -> int:
+        cancelled = 0
+        for key in keys:
+            with self._lock:
+                future = self._tasks.get(key)
+            if future is not None and future.cancel():
+                cancelled += 1
+        return cancelled
+
+    def _done(self, key: Hashable, owner: Hashable, future: Future) -> None:
+        with self._lock:
+            self._tasks.pop(key, None)
+            keys = self._owners.get(owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[owner]
+            if future.cancelled():
+                self.cancelled += 1
+                return
+            exc = future.exception()
+            if exc is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if exc is not None:
+            logger.debug("Prefetch %r failed: %s", key, exc)
+
+    def stats(self) -> Dict[str, int]:
+        """Return task counters and the number of tasks currently pending."""
+        with self._lock:
+            return {
+                'pending': len(self._tasks),
+                'scheduled': self.scheduled,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+    def shutdown(self) -> None:
+        """Cancel queued tasks and wait for running ones."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_prefetchers = []
+
+
+def register(prefetcher: Prefetcher) -> Prefetcher:
+    """Track `prefetcher` so a forked child starts with a fresh pool."""
+    _prefetchers.append(prefetcher)
+    return prefetcher
+
+
+def _reset_after_fork() -> None:
+    # Worker threads do not survive fork; queued tasks belong to the parent.
+    for prefetcher in _prefetchers:
+        prefetcher._executor = None
+        prefetcher._lock = threading.Lock()
+        prefetcher._tasks = {}
+        prefetcher._owners = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
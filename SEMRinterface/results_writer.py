@@ -0,0 +1,298 @@
+"""
+Buffered writer for the `stored_results.txt` selections log.
+
+`save_selected_items` used to open, append to, and close the log on every
+request. A `ResultsWriter` instead queues records in memory and a background
+thread appends them in batches, each under an exclusive `flock` so several
+worker processes can share the file without interleaving partial lines.
+
+Two durability modes are supported:
+
+- ``'group'`` (default): records are acknowledged once queued and are written
+  (and fsynced) together when `max_batch` records are pending or
+  `flush_interval` seconds have passed, whichever comes first.
+- ``'record'``: each record is written and fsynced on the calling thread
+  before `submit` returns.
+
+Failed writes are classified (`is_transient`). Transient failures (a full
+disk, a locked database, ...) put the batch back and retry it with
+exponential backoff, while at most `max_pending` records wait; `submit`
+refuses new records beyond that. Permanent failures (a missing directory,
+a record that cannot be serialized, ...) are retried record by record, and
+the records that still fail are handed to `dead_letter` (by default logged
+in full at ERROR level) so one bad record never blocks the ones behind it.
+A file append that fails after writing part of a batch is truncated back
+before the batch is retried, so retries never duplicate lines.
+
+Pending records are drained on interpreter shutdown via `atexit`. A custom
+`sink` callable can replace the file append, which is how other storage
+backends reuse the same batching (one transaction per batch).
+"""
+
+import atexit
+import errno
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import jsoncodec
+from .filelock import flocked
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ('group', 'record')
+
+#: OSError errnos worth retrying; every other failure is permanent.
+TRANSIENT_ERRNOS = frozenset(code for code in (
+    errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.EIO, errno.ENOSPC, errno.ETIMEDOUT,
+    getattr(errno, 'EDQUOT', None),
+) if code is not None)
+
+
+class TransientWriteError(OSError):
+    """Raised by a sink for a failure that is worth retrying (e.g. a locked database)."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Return True if a failed write may succeed when retried unchanged."""
+    return isinstance(exc, TransientWriteError) or (isinstance(exc, OSError) and exc.errno in TRANSIENT_ERRNOS)
+
+
+class ResultsWriter:
+    """Append JSON-lines records to `path`, batching writes off the request path.
+
+    When `sink` is given it is called with each batch (a list of records)
+    instead of appending to `path`, which then only names the writer; a
+    sink signals retryable failures with `TransientWriteError`. Failed
+    batches are retried after `retry_initial` seconds, doubling up to
+    `retry_max`. `dead_letter(records, exc)` receives records that failed
+    permanently.
+    """
+
+    def __init__(self, path: str, durability: str = 'group', max_batch: int = 100,
+                 flush_interval: float = 0.5, sink: Optional[Callable[[List[Dict]], None]] = None,
+                 max_pending: int = 10000, retry_initial: float = 0.1, retry_max: float = 30.0,
+                 dead_letter: Optional[Callable[[List[Dict], BaseException], None]] = None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES}")
+        self.path = path
+        self.durability = durability
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.max_batch, int(max_pending))
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.sink = sink or self._append_to_file
+        self.dead_letter = dead_letter
+        # A file-backed writer only accepts records while its directory exists.
+        self._directory = os.path.dirname(path) if sink is None else None
+        self._pending: List[Dict] = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._overflowing = False
+        self.dropped = 0
+
+    def submit(self, record: Dict) -> bool:
+        """Queue (or, in 'record' mode, write) one record.
+
+        Returns False when the record was not accepted: the writer's
+        directory is missing, the queue is full, or (in 'record' mode) the
+        write failed.
+        """
+        if self._directory is not None and not os.path.isdir(self._directory):
+            return False
+        with self._cond:
+            if self.durability == 'group' and not self._closed:
+                if len(self._pending) >= self.max_pending:
+                    if not self._overflowing:
+                        logger.error("Result queue for %s is full (%d records); rejecting new records",
+                                     self.path, len(self._pending))
+                    self._overflowing = True
+                    return False
+                self._overflowing = False
+                self._pending.append(record)
+                direct = False
+            else:
+                direct = True
+        if direct:
+            with self._write_lock:
+                error = self._write([record])
+                if error is not None and not is_transient(error):
+                    self._dead_letter([record], error)
+                return error is None
+        with self._cond:
+            self._ensure_thread()
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return True
+
+    def flush(self) -> bool:
+        """Write every pending record now; returns False if any write failed.
+
+        Records that failed transiently stay queued (ahead of newer ones)
+        for the next attempt; records that failed permanently are
+        dead-lettered.
+        """
+        # Holding the write lock across take-and-write keeps batches in order.
+        with self._write_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return True
+            error = self._write(batch)
+            if error is None:
+                self._succeeded()
+                return True
+            if is_transient(error):
+                self._requeue(batch, error)
+                return False
+            # Find the records that cannot be written and let the rest through.
+            for position, record in enumerate(batch if len(batch) > 1 else ()):
+                error = self._write([record])
+                if error is None:
+                    continue
+                if is_transient(error):
+                    self._requeue(batch[position:], error)
+                    return False
+                self._dead_letter([record], error)
+            if len(batch) == 1:
+                self._dead_letter(batch, error)
+            return False
+
+    def close(self) -> None:
+        """Stop the background thread after draining pending records.
+
+        Records that still cannot be written are dead-lettered.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._cond:
+            remaining, self._pending = self._pending, []
+        if remaining:
+            self._dead_letter(remaining, OSError(f"writer for {self.path} closed with unwritten records"))
+
+    def _succeeded(self) -> None:
+        with self._cond:
+            if self._failures:
+                logger.info("Writing results to %s succeeded after %d failed attempt(s)", self.path, self._failures)
+            self._failures = 0
+            self._retry_at = 0.0
+
+    def _requeue(self, batch: List[Dict], error: BaseException) -> None:
+        with self._cond:
+            self._pending[:0] = batch
+            self._failures += 1
+            delay = min(self.retry_max, self.retry_initial * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + delay
+        logger.warning("Failed to write %d result record(s) to %s (%s); retrying in %.1fs",
+                       len(batch), self.path, error, delay)
+
+    def _dead_letter(self, records: List[Dict], error: BaseException) -> None:
+        self.dropped += len(records)
+        if self.dead_letter is not None:
+            try:
+                self.dead_letter(records, error)
+                return
+            except Exception:
+                logger.exception("Dead-letter handler for %s failed", self.path)
+        lines = []
+        for record in records:
+            try:
+                lines.append(jsoncodec.dumps(record).decode('utf-8'))
+            except (TypeError, ValueError):
+                lines.append(repr(record))
+        logger.error("Dropping %d result record(s) for %s after a permanent failure (%s):\n%s",
+                     len(records), self.path, error, '\n'.join(lines))
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='semr-results-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed:
+                    delay = self._retry_at - time.monotonic()
+                    if delay > 0:
+                        self._cond.wait(delay)  # back off; a notify only re-checks
+                        continue
+                    if len(self._pending) >= self.max_batch or (self._failures and self._pending):
+                        break
+                    self._cond.wait(self.flush_interval)
+                    break
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def _append_to_file(self, batch: List[Dict]) -> None:
+        payload = memoryview(b''.join(jsoncodec.dumps(record) + b'\n' for record in batch))
+        # Unbuffered, so nothing is left in a buffer to be written again on close.
+        with open(self.path, 'ab', buffering=0) as file, flocked(file):
+            start = os.fstat(file.fileno()).st_size
+            try:
+                while payload:
+                    payload = payload[file.write(payload):]
+                os.fsync(file.fileno())
+            except OSError:
+                # Undo a partial append so the retried batch is not duplicated.
+                try:
+                    os.ftruncate(file.fileno(), start)
+                except OSError as exc:
+                    raise OSError(f"{self.path} may hold part of a failed batch: {exc}") from exc
+                raise
+
+    def _write(self, batch: List[Dict]) -> Optional[BaseException]:
+        """Pass `batch` to the sink; returns the exception it raised, or None."""
+        try:
+            self.sink(batch)
+            return None
+        except Exception as exc:
+            return exc
+
+
+_writers: Dict[str, ResultsWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_results_writer(path: str, **options) -> ResultsWriter:
+    """Return the process-wide writer for `path`, creating it on first use."""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = ResultsWriter(key, **options)
+        return writer
+
+
+def _reset_after_fork() -> None:
+    # Records queued before fork belong to the parent, which will write them.
+    for writer in _writers.values():
+        writer._pending = []
+        writer._cond = threading.Condition()
+        writer._write_lock = threading.Lock()
+        writer._thread = None
+        writer._failures = 0
+        writer._retry_at = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def close_all() -> None:
+    """Drain every writer; called automatically at interpreter exit."""
+    for writer in list(_writers.values()):
+        writer.close()
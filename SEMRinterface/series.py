@@ -0,0 +1,260 @@
+"""
+Compact in-memory representation of case time series.
+
+Parsed case files hold every point as a two-element list, which costs well
+over 100 bytes per point once the list and its two number objects are
+counted. The service layer caches observations and medications in this
+module's compact form instead:
+
+- `CompactSeries` keeps a series' timestamps and values in two parallel
+  `array('d')` buffers (16 bytes per point) and shares its other keys
+  (`zones`, `marker`, `name`, ...) with every identical series through an
+  interning table. Per-point lists such as `med_reason_tooltips` are kept
+  alongside and sliced with the points.
+- `CompactVariable` stores a variable's fields in a tuple laid out by a
+  shared key layout, with equal `display_text` and `units` strings shared
+  by all variables of one file.
+
+The interning tables hold their entries weakly, and strings are shared only
+within one `compact_variables` call, so nothing outlives the cache entries
+that use it.
+
+Both are read-only `Mapping`s that look like the dicts they replace
+(`series['data']` materializes the `[t, v]` lists on demand), so code that
+reads case files works unchanged, and `to_wire()` returns the original
+structure so `SEMRinterface.jsoncodec` serializes them in the current wire
+format. Series that are not plain numeric `[t, v]` pairs stay dicts.
+"""
+
+import weakref
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from . import jsoncodec
+
+#: Keys under a variable dict that hold lists of Highcharts series.
+SERIES_KEYS = ('numeric_lab_data', 'discrete_lab_data', 'med_data')
+
+#: Per-point lists that must stay aligned with a series' `data`.
+PARALLEL_POINT_KEYS = ('med_reason_tooltips',)
+
+#: Variable fields whose equal strings are shared by the variables of one file.
+SHARED_STRING_KEYS = ('display_text', 'units')
+
+
+class _Meta(dict):
+    """A series' non-point keys; a dict subclass only so it can be weakly referenced."""
+
+    __slots__ = ('__weakref__',)
+
+
+_metas: 'weakref.WeakValueDictionary[bytes, _Meta]' = weakref.WeakValueDictionary()
+_layouts: 'weakref.WeakValueDictionary[Tuple[str, ...], _Layout]' = weakref.WeakValueDictionary()
+
+
+def _shared_meta(meta: Dict) -> Dict:
+    """Return one shared (read-only) dict for every live series with these keys and values."""
+    key = jsoncodec.dumps(meta)
+    return _metas.setdefault(key, _Meta(meta))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _int_flags(numbers: Sequence) -> Union[bool, bytes]:
+    """True if every number is an int, False if none is, else a per-number mask."""
+    flags = bytes(isinstance(n, int) for n in numbers)
+    if not numbers or flags.count(1) == 0:
+        return False
+    return True if flags.count(0) == 0 else flags
+
+
+def _restore_ints(numbers: List[float], flags: Union[bool, bytes]) -> list:
+    if flags is True:
+        return [int(n) for n in numbers]
+    if flags:
+        return [int(n) if flag else n for n, flag in zip(numbers, flags)]
+    return numbers
+
+
+def _take_flags(flags: Union[bool, bytes], indices) -> Union[bool, bytes]:
+    if isinstance(flags, bytes):
+        return flags[indices] if isinstance(indices, slice) else bytes(flags[i] for i in indices)
+    return flags
+
+
+class CompactSeries(Mapping):
+    """A series with its points in parallel float64 arrays.
+
+    `times` and `values` are `array('d')` buffers, or read-only float64
+    `memoryview`s into a memory-mapped compiled store (see
+    `SEMRinterface.case_store`); both index, slice, and iterate alike.
+    `int_times` and `int_values` record which numbers were JSON integers
+    (True for all, False for none, else a per-point mask) so they are
+    written back exactly as read.
+    """
+
+    __slots__ = ('meta', 'times', 'values', 'int_times', 'int_values', 'parallel')
+
+    def __init__(self, meta: Dict, times: array, values: array, int_times: Union[bool, bytes] = False,
+                 int_values: Union[bool, bytes] = False, parallel: Optional[Dict[str, list]] = None):
+        self.meta = meta
+        self.times = times
+        self.values = values
+        self.int_times = int_times
+        self.int_values = int_values
+        self.parallel = parallel
+
+    @property
+    def length(self) -> int:
+        """Number of points."""
+        return len(self.times)
+
+    def columns(self) -> Tuple[list, list]:
+        """The series' timestamps and values as two lists."""
+        return (_restore_ints(self.times.tolist(), self.int_times),
+                _restore_ints(self.values.tolist(), self.int_values))
+
+    def points(self) -> List[list]:
+        """The series' `data` as `[t, v]` lists."""
+        times, values = self.columns()
+        return [[t, v] for t, v in zip(times, values)]
+
+    def slice(self, lo: int, hi: int) -> 'CompactSeries':
+        """Return the points `[lo:hi]` as a new series."""
+        parallel = {k: v[lo:hi] for k, v in self.parallel.items()} if self.parallel else None
+        window = slice(lo, hi)
+        return CompactSeries(self.meta, self.times[window], self.values[window], _take_flags(self.int_times, window),
+                             _take_flags(self.int_values, window), parallel)
+
+    def take(self, indices: Sequence[int]) -> 'CompactSeries':
+        """Return the points at sorted `indices` as a new series."""
+        times, values = self.times, self.values
+        parallel = {k: [v[i] for i in indices] for k, v in self.parallel.items()} if self.parallel else None
+        return CompactSeries(self.meta, array('d', [times[i] for i in indices]),
+                             array('d', [values[i] for i in indices]), _take_flags(self.int_times, indices),
+                             _take_flags(self.int_values, indices), parallel)
+
+    def __getitem__(self, key):
+        if key == 'data':
+            return self.points()
+        if self.parallel and key in self.parallel:
+            return self.parallel[key]
+        return self.meta[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.meta
+        if self.parallel:
+            yield from self.parallel
+
+    def __len__(self) -> int:
+        return len(self.meta) + (len(self.parallel) if self.parallel else 0)
+
+    def to_wire(self) -> Dict:
+        """The series as the dict it was built from."""
+        return {key: self[key] for key in self}
+
+
+def make_series(record: Dict, times: array, values: array, int_times: Union[bool, bytes] = False,
+                int_values: Union[bool, bytes] = False) -> CompactSeries:
+    """Build a `CompactSeries` from a series dict's non-point keys and its point arrays.
+
+    `record` keeps a `data` slot (its value is ignored) so key order
+    survives; per-point lists as long as the series become parallel lists.
+    """
+    meta = {}
+    parallel = {}
+    for key, value in record.items():
+        if key == 'data':
+            meta[key] = None
+        elif key in PARALLEL_POINT_KEYS and isinstance(value, list) and len(value) == len(times):
+            parallel[key] = value
+        else:
+            meta[key] = value
+    return CompactSeries(_shared_meta(meta), times, values, int_times, int_values, parallel or None)
+
+
+def compact_series(series: Dict):
+    """Return `series` as a `CompactSeries`, or unchanged if its points are irregular."""
+    data = series.get('data') or []
+    if not all(isinstance(p, list) and len(p) == 2 and _is_number(p[0]) and _is_number(p[1]) for p in data):
+        return series
+    times = [p[0] for p in data]
+    values = [p[1] for p in data]
+    return make_series(series, array('d', times), array('d', values), _int_flags(times), _int_flags(values))
+
+
+class _Layout:
+    """Key order of a variable plus each key's position, shared by all variables with those keys."""
+
+    __slots__ = ('keys', 'index', '__weakref__')
+
+    def __init__(self, keys: Tuple[str, ...]):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+
+
+class CompactVariable(Mapping):
+    """A variable dict stored as a tuple of field values in a shared layout."""
+
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout: _Layout, values: tuple):
+        self._layout = layout
+        self._values = values
+
+    def __getitem__(self, key):
+        value = self._values[self._layout.index[key]]
+        if key in SERIES_KEYS and isinstance(value, tuple):
+            return list(value)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._layout.keys)
+
+    def __len__(self) -> int:
+        return len(self._layout.keys)
+
+    def __contains__(self, key) -> bool:
+        return key in self._layout.index
+
+    def to_wire(self) -> Dict:
+        """The variable as the dict it was built from (series stay compact)."""
+        return {key: self[key] for key in self._layout.keys}
+
+
+def compact_variable(details, series_factory=compact_series, strings: Optional[Dict[str, str]] = None):
+    """Return a variable dict as a `CompactVariable` (other values unchanged).
+
+    `series_factory` converts each entry of its series lists. `strings`
+    maps each `SHARED_STRING_KEYS` value seen so far to the one copy kept;
+    pass the same dict for every variable of a file.
+    """
+    if not isinstance(details, dict):
+        return details
+    for key in SHARED_STRING_KEYS:
+        if details.get(key) is not None and not isinstance(details[key], str):
+            return details
+    keys = tuple(details)
+    layout = _layouts.get(keys)
+    if layout is None:
+        layout = _layouts.setdefault(keys, _Layout(keys))
+    values = []
+    for key, value in details.items():
+        if key in SHARED_STRING_KEYS:
+            if value is not None and strings is not None:
+                value = strings.setdefault(value, value)
+        elif key in SERIES_KEYS and isinstance(value, list):
+            value = tuple(series_factory(s) if isinstance(s, dict) else s for s in value)
+        values.append(value)
+    return CompactVariable(layout, tuple(values))
+
+
+def compact_variables(variables: Optional[Dict]) -> Optional[Dict]:
+    """Return `observations.json`/`medications.json` content with every variable compacted."""
+    if not isinstance(variables, dict):
+        return variables
+    strings: Dict[str, str] = {}
+    return {var_id: compact_variable(details, strings=strings) for var_id, details in variables.items()}
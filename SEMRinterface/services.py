@@ -15,14 +15,75 @@ Conventions
 Functions in this module should avoid any framework (Django) concerns and
 only perform I/O and in-memory transformations so they are easy to reuse and
 unit test.
+
+User assignments, case selections, and selection results are delegated to a
+pluggable storage backend (see `SEMRinterface.storage`): by default the
+study's JSON files, with assignments written through an append-only event
+journal (`SEMRinterface.journal`) rather than by rewriting
+`user_details.json`; optionally an indexed SQLite database.
+
+On request, case payloads also carry the viewer's grouped panels
+(`physio_data`, `lab_data`, `med_data`) and the active time step's
+instructions, assembled from a per-study group index (see
+`SEMRinterface.panels`).
+
+Serialized `/api/get_case_data/` payloads are additionally kept in a bounded
+in-memory cache (`get_case_payload`), which `prefetch_case_data` fills in the
+background for the case a reviewer is likely to open next (see
+`SEMRinterface.prefetch`).
+
+Cohort queries ("which cases have a lactate over 4 in their first time
+step") are answered from the per-study variable index that `manage.py
+compile_study` builds (see `SEMRinterface.variable_index`).
+
+Parsed JSON is memoized per path in an in-process LRU cache (see
+`SEMRinterface.cache`) that is invalidated by file mtime/size and bounded by
+`settings.SEMR_JSON_CACHE_MAX_BYTES`. Cached objects are shared, so callers
+must not mutate what `load_json` returns; read-modify-write helpers pass
+`use_cache=False` and `save_json` refreshes the entry after writing. Case
+observations and medications are cached separately
+(`settings.SEMR_SERIES_CACHE_MAX_BYTES`) in the compact array-backed form
+of `SEMRinterface.series`, at a small fraction of the memory of parsed JSON.
+
+JSON file reads (files opened, bytes, decode time) and the hit ratios of
+the caches are reported through `SEMRinterface.metrics`.
 """
 
 import os
-import json
+import asyncio
 import logging
-from typing import Dict, List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .cache import BoundedLRUCache, FileCache
+from .timeseries import delta_case_files, downsample_case_files, select_case_variables, window_case_files
+from .case_store import (
+    SERIES_FILENAME,
+    compiled_case_dir,
+    is_case_validated,
+    load_compiled_case,
+    variable_index_path,
+)
+from .series import compact_variables
+from .wireformats import columnar_case_data
+from .variable_index import StaleIndexError, VariableIndex, get_variable_index
+from .storage import get_storage_backend
+from .manifest import MANIFEST_FILENAME, load_study_index
+from .payloads import (
+    can_passthrough,
+    case_data_etag,
+    get_encoded_payload,
+    iter_raw_case_payload,
+    read_encoded_payload,
+    serialize_payload,
+)
+from .analytics import get_study_analytics
+from .panels import INSTRUCTION_SETS as DEFAULT_INSTRUCTION_SETS, assemble_panels, get_group_index
+from .prefetch import Prefetcher, register as register_prefetcher
+from . import jsoncodec, metrics
 try:
     from django.conf import settings  # type: ignore
+    getattr(settings, "BASE_DIR", None)  # raises ImproperlyConfigured when no settings are configured
 except Exception:  # pragma: no cover - fallback for non-Django contexts
     class _SettingsFallback:
         BASE_DIR = os.getcwd()
@@ -31,32 +92,115 @@ except Exception:  # pragma: no cover - fallback for non-Django contexts
 logger = logging.getLogger(__name__)
 
 BASE_DIR = getattr(settings, "BASE_DIR", os.getcwd())
-RESOURCES_DIR = os.path.join(BASE_DIR, "resources")
+RESOURCES_DIR = getattr(settings, "SEMR_RESOURCES_DIR", os.path.join(BASE_DIR, "resources"))
+JSON_CACHE_MAX_BYTES = getattr(settings, "SEMR_JSON_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+JOURNAL_FSYNC_INTERVAL = getattr(settings, "SEMR_JOURNAL_FSYNC_INTERVAL", 0.1)
+JOURNAL_COMPACT_EVENTS = getattr(settings, "SEMR_JOURNAL_COMPACT_EVENTS", 500)
+RESULTS_DURABILITY = getattr(settings, "SEMR_RESULTS_DURABILITY", "group")
+RESULTS_BATCH_SIZE = getattr(settings, "SEMR_RESULTS_BATCH_SIZE", 100)
+RESULTS_FLUSH_INTERVAL = getattr(settings, "SEMR_RESULTS_FLUSH_INTERVAL", 0.5)
+RESULTS_MAX_PENDING = getattr(settings, "SEMR_RESULTS_MAX_PENDING", 10000)
+STORAGE_BACKEND = getattr(settings, "SEMR_STORAGE_BACKEND", "json")
+MANIFEST_REFRESH_INTERVAL = getattr(settings, "SEMR_MANIFEST_REFRESH_INTERVAL", 30)
+CASE_PAYLOAD_CACHE_MAX_BYTES = getattr(settings, "SEMR_CASE_PAYLOAD_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+PREFETCH_WORKERS = getattr(settings, "SEMR_PREFETCH_WORKERS", 2)
+PREFETCH_MAX_PENDING = getattr(settings, "SEMR_PREFETCH_MAX_PENDING", 8)
+ANALYTICS_CHECKPOINT_RECORDS = getattr(settings, "SEMR_ANALYTICS_CHECKPOINT_RECORDS", 1000)
+ANALYTICS_CHECKPOINT_INTERVAL = getattr(settings, "SEMR_ANALYTICS_CHECKPOINT_INTERVAL", 60)
+BATCH_WORKERS = getattr(settings, "SEMR_BATCH_WORKERS", 4)
+BATCH_MAX_CASES = getattr(settings, "SEMR_BATCH_MAX_CASES", 200)
+BATCH_WINDOW = max(1, BATCH_WORKERS) * 2
+SQLITE_PATH = getattr(settings, "SEMR_SQLITE_PATH", os.path.join(BASE_DIR, "db.sqlite3"))
+INSTRUCTION_SETS = getattr(settings, "SEMR_INSTRUCTION_SETS", DEFAULT_INSTRUCTION_SETS)
+SERIES_CACHE_MAX_BYTES = getattr(settings, "SEMR_SERIES_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+
+_json_cache = FileCache(JSON_CACHE_MAX_BYTES)
+_series_cache = FileCache(SERIES_CACHE_MAX_BYTES)
+_payload_cache = BoundedLRUCache(CASE_PAYLOAD_CACHE_MAX_BYTES)
+_prefetcher = register_prefetcher(Prefetcher(PREFETCH_WORKERS, PREFETCH_MAX_PENDING))
+_batch_executor: Optional[ThreadPoolExecutor] = None
+_batch_executor_lock = threading.Lock()
+metrics.REGISTRY.register_collector(lambda: metrics.cache_samples('json', _json_cache.stats())
+                                    + metrics.cache_samples('series', _series_cache.stats())
+                                    + metrics.cache_samples('case_payload', _payload_cache.stats()))
+
+def _read_json_file(file_path: str) -> Optional[Dict]:
+    """Parse `file_path` from disk, returning None if missing or invalid."""
+    try:
+        with open(file_path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    metrics.record_read('json', len(data))
+    try:
+        with metrics.JSON_DECODE.time():
+            return jsoncodec.loads(data)
+    except ValueError:
+        logger.warning("Failed to decode JSON at %s", file_path)
+        return None
 
-def load_json(file_path: str) -> Optional[Dict]:
+def load_json(file_path: str, use_cache: bool = True) -> Optional[Dict]:
     """Load and parse JSON from `file_path`.
 
     Parameters
     ----------
     file_path: str
         Absolute path to a JSON file on disk.
+    use_cache: bool
+        Serve from the in-process cache when the file is unchanged. Pass
+        False to get a private copy that is safe to mutate.
 
     Returns
     -------
     dict | None
         Parsed JSON object if the file exists, otherwise None.
     """
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, 'r') as file:
-                return json.load(file)
-        except json.JSONDecodeError:
-            logger.warning("Failed to decode JSON at %s", file_path)
-            return None
-    return None
+    if not use_cache:
+        return _read_json_file(file_path)
+    return _json_cache.get(file_path, _read_json_file)
+
+def load_series_json(file_path: str) -> Optional[Dict]:
+    """Load `observations.json` or `medications.json` as compact variables.
+
+    Like `load_json`, results are cached per path (in the series cache) and
+    shared; variables are `series.CompactVariable` mappings.
+    """
+    return _series_cache.get(file_path, lambda path: compact_variables(_read_json_file(path)))
+
+def _load_compiled_series(case_dir: str, out_dir: str) -> Optional[tuple]:
+    """Return cached `(medications, observations)` from a fresh compiled store, or None."""
+    if not is_case_validated(case_dir, out_dir, load_json):
+        return None
+    compiled = _series_cache.get(os.path.join(out_dir, SERIES_FILENAME),
+                                 lambda path: load_compiled_case(case_dir, out_dir, load_json))
+    if compiled is None:
+        return None
+    return compiled['medications'], compiled['observations']
+
+def load_case_series(case_dir: str, out_dir: str) -> tuple:
+    """Return a case's `(medications, observations)` in compact form.
+
+    Read from the compiled store in `out_dir` when it is fresh, else from
+    the case's JSON files; either way cached in the series cache.
+    """
+    compiled = _load_compiled_series(case_dir, out_dir)
+    if compiled is not None:
+        return compiled
+    return (load_series_json(os.path.join(case_dir, 'medications.json')),
+            load_series_json(os.path.join(case_dir, 'observations.json')))
+
+def get_json_cache_stats() -> Dict[str, Any]:
+    """Return hit/miss/eviction counters for the JSON cache."""
+    return _json_cache.stats()
+
+def clear_caches() -> None:
+    """Empty the parsed-JSON, series, and case payload caches (e.g. for cold-cache benchmarks)."""
+    _json_cache.clear()
+    _series_cache.clear()
+    _payload_cache.clear()
 
 def save_json(data: Dict, file_path: str) -> None:
-    """Write `data` as pretty-printed JSON to `file_path`.
+    """Write `data` as compact JSON to `file_path`.
 
     Parameters
     ----------
@@ -66,8 +210,11 @@ def save_json(data: Dict, file_path: str) -> None:
         Absolute path where the file will be written (created or replaced).
     """
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w') as file:
-        json.dump(data, file, indent=4)
+    encoded = jsoncodec.dumps(data)
+    with open(file_path, 'wb') as file:
+        file.write(encoded)
+    # Cache what was written, not the caller's object, which they may go on mutating.
+    _json_cache.refresh(file_path, jsoncodec.loads(encoded))
 
 def get_study_ids(resources_dir: str = RESOURCES_DIR) -> List[str]:
     """List available study identifiers.
@@ -80,14 +227,32 @@ def get_study_ids(resources_dir: str = RESOURCES_DIR) -> List[str]:
     Returns
     -------
     list[str]
-        Directory names found in `resources_dir`.
+        Study folder names listed in the precomputed studies manifest (see
+        `SEMRinterface.manifest`); the directory itself is not scanned.
+    """
+    return list(get_study_index(resources_dir)['studies'])
+
+def get_study_index(resources_dir: str = RESOURCES_DIR) -> Dict:
+    """Return the `studies_manifest.json` index of per-study summaries."""
+    return load_study_index(resources_dir, load_json, MANIFEST_REFRESH_INTERVAL)
+
+def get_study_manifest(study_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[Dict]:
+    """Return a study's `manifest.json` (case ids, sizes, counts, time ranges).
+
+    The returned mapping is shared and must not be mutated.
     """
-    if not os.path.exists(resources_dir):
-        return []
-    return [
-        item for item in os.listdir(resources_dir)
-        if os.path.isdir(os.path.join(resources_dir, item))
-    ]
+    if study_id not in get_study_index(resources_dir)['studies']:
+        return None
+    return load_json(os.path.join(resources_dir, study_id, MANIFEST_FILENAME))
+
+def results_writer_options() -> Dict[str, Any]:
+    """Return the configured `ResultsWriter` keyword arguments."""
+    return {
+        'durability': RESULTS_DURABILITY,
+        'max_batch': RESULTS_BATCH_SIZE,
+        'flush_interval': RESULTS_FLUSH_INTERVAL,
+        'max_pending': RESULTS_MAX_PENDING,
+    }
 
 def get_user_details(study_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[Dict]:
     """Load the `user_details.json` mapping for a study.
@@ -102,11 +267,11 @@ def get_user_details(study_id: str, resources_dir: str = RESOURCES_DIR) -> Optio
     Returns
     -------
     dict | None
-        Mapping of user_id -> assignment details, if present.
+        Mapping of user_id -> assignment details, if present. The mapping may
+        be the backend's shared view and must not be mutated.
     """
-    user_details_path = os.path.join(resources_dir, study_id, 'user_details.json')
-    logger.debug("Loading user details for study '%s' from %s", study_id, user_details_path)
-    return load_json(user_details_path)
+    logger.debug("Loading user details for study '%s'", study_id)
+    return get_storage_backend(resources_dir).get_user_details(study_id)
 
 def get_case_assignments(study_id: str, user_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[Dict]:
     """Return assignment details for `user_id` within `study_id`.
@@ -114,24 +279,14 @@ def get_case_assignments(study_id: str, user_id: str, resources_dir: str = RESOU
     Returns the structure stored under the user key in `user_details.json`,
     typically containing keys like `cases_assigned` and `cases_completed`.
     """
-    user_details = get_user_details(study_id, resources_dir)
-    if user_details and user_id in user_details:
-        return user_details[user_id]
-    return None
+    return get_storage_backend(resources_dir).get_case_assignments(study_id, user_id)
 
 def update_case_assignments(study_id: str, user_id: str, new_details: Dict, resources_dir: str = RESOURCES_DIR) -> bool:
     """Merge `new_details` into a user's assignment record and persist.
 
     Returns True on success, False if the study or user does not exist.
     """
-    user_details_path = os.path.join(resources_dir, study_id, 'user_details.json')
-    user_details = load_json(user_details_path)
-    if not user_details or user_id not in user_details:
-        return False
-
-    user_details[user_id].update(new_details)
-    save_json(user_details, user_details_path)
-    return True
+    return get_storage_backend(resources_dir).update_case_assignments(study_id, user_id, new_details)
 
 def load_case_details(study_id: str, case_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[Dict]:
     """Return the entry for `case_id` from `case_details.json`.
@@ -146,23 +301,24 @@ def load_case_details(study_id: str, case_id: str, resources_dir: str = RESOURCE
         raise FileNotFoundError(f"case_id '{case_id}' not present in case_details.json")
     return case_details[case_id]
 
+def get_time_step_window(study_id: str, case_id: str, time_step: int, resources_dir: str = RESOURCES_DIR) -> tuple:
+    """Return the `(min_t, max_t)` display window for a case's time step.
+
+    Raises FileNotFoundError for an unknown case and ValueError when
+    `time_step` is not an index into the case's epoch list.
+    """
+    steps = load_case_details(study_id, case_id, resources_dir)
+    if not 0 <= time_step < len(steps):
+        raise ValueError(f"time_step {time_step} out of range for case '{case_id}'")
+    return steps[time_step]['min_t'], steps[time_step]['max_t']
+
 def save_case_selection(study_id: str, user_id: str, case_id: str, resources_dir: str = RESOURCES_DIR) -> bool:
     """Append `case_id` to the list of selections for `user_id` within a study.
 
-    A flat line-delimited JSON log is written to `case_selections.json`.
+    The JSON backend keeps these in `case_selections.json`.
     Returns True on success.
     """
-    selection_path = os.path.join(resources_dir, study_id, 'case_selections.json')
-    selections = load_json(selection_path) or {}
-
-    if user_id not in selections:
-        selections[user_id] = []
-
-    if case_id not in selections[user_id]:
-        selections[user_id].append(case_id)
-
-    save_json(selections, selection_path)
-    return True
+    return get_storage_backend(resources_dir).save_case_selection(study_id, user_id, case_id)
 
 def mark_case_complete(study_id: str, user_id: str, case_id: str, resources_dir: str = RESOURCES_DIR) -> bool:
     """Mark `case_id` as completed for the user, persisting updates.
@@ -170,60 +326,126 @@ def mark_case_complete(study_id: str, user_id: str, case_id: str, resources_dir:
     Returns True when the case was recorded as completed; False when the
     user or study mapping could not be found.
     """
-    user_details_path = os.path.join(resources_dir, study_id, 'user_details.json')
-    user_details = load_json(user_details_path)
-    if not user_details or user_id not in user_details:
-        return False
-
-    user_record = user_details[user_id]
-    completed = user_record.get('cases_completed')
-    if completed is None:
-        user_record['cases_completed'] = []
-        completed = user_record['cases_completed']
-    if case_id not in completed:
-        completed.append(case_id)
-    save_json(user_details, user_details_path)
-    return True
+    return get_storage_backend(resources_dir).mark_case_complete(study_id, user_id, case_id)
 
 def reset_case(study_id: str, user_id: str, case_id: str, resources_dir: str = RESOURCES_DIR) -> bool:
     """Remove `case_id` from the user's completed list if present.
 
     Returns True if a removal occurred; False otherwise.
     """
-    user_details_path = os.path.join(resources_dir, study_id, 'user_details.json')
-    user_details = load_json(user_details_path)
-    if not user_details or user_id not in user_details:
-        return False
-
-    if case_id in user_details[user_id]['cases_completed']:
-        user_details[user_id]['cases_completed'].remove(case_id)
-        save_json(user_details, user_details_path)
-        return True
-    return False
+    return get_storage_backend(resources_dir).reset_case(study_id, user_id, case_id)
 
 def save_selected_items(study_id: str, user_id: str, case_id: str, selected_items: List[str], resources_dir: str = RESOURCES_DIR) -> bool:
     """Append a line with the user's selected items for a case to a log.
 
-    The log file is `stored_results.txt`, one JSON object per line for
-    easy downstream parsing.
+    With the JSON backend the log file is `stored_results.txt`, one JSON
+    object per line for easy downstream parsing. Records are written by a
+    shared `ResultsWriter`; in the default 'group' durability mode the
+    record is queued and written with others shortly after this returns.
     """
-    stored_results_path = os.path.join(resources_dir, study_id, 'stored_results.txt')
-    try:
-        with open(stored_results_path, 'a') as file:
-            file.write(json.dumps({
-                "user_id": user_id,
-                "case_id": case_id,
-                "selected_items": selected_items
-            }) + '\n')
-        return True
-    except IOError:
-        return False
-
-def get_case_files(study_id: str, case_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[Dict]:
+    return get_storage_backend(resources_dir).save_selected_items(study_id, user_id, case_id, selected_items)
+
+def read_results(study_id: str, cursor: int = 0, resources_dir: str = RESOURCES_DIR,
+                 limit: Optional[int] = None) -> tuple:
+    """Return `(records, cursor)` for selection results stored after `cursor`.
+
+    Pass the returned cursor back in to read only newer results.
+    """
+    return get_storage_backend(resources_dir).read_results(study_id, cursor, limit)
+
+def get_results_analytics(study_id: str, case_ids: Optional[List[str]] = None,
+                          resources_dir: str = RESOURCES_DIR) -> Dict:
+    """Return selection analytics for a study, folding in new results first.
+
+    Per-(case, item) counts, inter-reviewer agreement, and per-user totals
+    are maintained incrementally (see `SEMRinterface.analytics`), so each
+    call only reads results stored since the previous one. `case_ids`
+    limits the per-case section of the report.
+    """
+    analytics = get_study_analytics(study_id, os.path.join(resources_dir, study_id),
+                                    get_storage_backend(resources_dir),
+                                    ANALYTICS_CHECKPOINT_RECORDS, ANALYTICS_CHECKPOINT_INTERVAL)
+    analytics.refresh()
+    return analytics.summary(case_ids)
+
+def get_study_variable_index(study_id: str, resources_dir: str = RESOURCES_DIR) -> Optional[VariableIndex]:
+    """Return the study's variable index, or None if `compile_study` has not built one."""
+    return get_variable_index(variable_index_path(os.path.join(resources_dir, study_id)), load_json)
+
+def query_variable_index(study_id: str, variable: str, min_value: Optional[float] = None,
+                         max_value: Optional[float] = None, time_step: Optional[int] = None,
+                         resources_dir: str = RESOURCES_DIR) -> Dict:
+    """Find the cases of a study with a point of `variable` in a value range.
+
+    Parameters
+    ----------
+    variable: str
+        Observation or medication id (a key of `observations.json` or
+        `medications.json`).
+    min_value, max_value: float, optional
+        Inclusive value bounds; omit either (or both) for an open range.
+    time_step: int, optional
+        Only count points in this `case_details.json` time step of each case.
+
+    Returns
+    -------
+    dict
+        `variable`, its `kind`, the query, `case_count`, and `cases`: one
+        row per matching case (in case-id order) with the `count`, `min_v`,
+        `max_v`, `min_t`, and `max_t` of its points in scope. Answered from
+        the index alone; `scanned_cases` counts the cases whose values
+        straddle a two-sided range and were checked point by point. Raises
+        FileNotFoundError when the study has no index and ValueError when
+        `min_value` exceeds `max_value` or `time_step` is negative.
+    """
+    if min_value is not None and max_value is not None and min_value > max_value:
+        raise ValueError('min_value is greater than max_value')
+    if time_step is not None and time_step < 0:
+        raise ValueError('Invalid time_step')
+    while True:
+        index = get_study_variable_index(study_id, resources_dir)
+        if index is None:
+            raise FileNotFoundError(f"No variable index for study '{study_id}'; run manage.py compile_study")
+        try:
+            cases, scanned = index.query(variable, min_value, max_value, time_step)
+            break
+        except StaleIndexError:
+            continue  # rebuilt between the lookup and the query
+    return {
+        'variable': variable,
+        'kind': index.kind(variable),
+        'min_value': min_value,
+        'max_value': max_value,
+        'time_step': time_step,
+        'case_count': len(cases),
+        'cases': cases,
+        'scanned_cases': scanned,
+        'built_at': index.built_at,
+    }
+
+def get_case_files(study_id: str, case_id: str, resources_dir: str = RESOURCES_DIR,
+                   time_step: Optional[int] = None, max_points: Optional[int] = None,
+                   variables: Optional[List[str]] = None, panels: Optional[bool] = None,
+                   since_step: Optional[int] = None) -> Optional[Dict]:
     """Load the core JSON files for a specific case.
 
     Returns a mapping with keys: `demographics`, `medications`, `notes`,
     and `observations`. Missing files yield None values for their entries.
+    When `time_step` is given, series points and notes are trimmed to that
+    step's `min_t`/`max_t` window from `case_details.json`. When
+    `max_points` is given, each numeric and medication series longer than
+    that is downsampled with LTTB, keeping out-of-range points. When
+    `variables` is given, only those observation and medication keys are
+    returned. When `panels` is true, the grouped `physio_data`, `lab_data`,
+    and `med_data` panels plus `instructions` and `active_time_step` for the
+    active (or first) time step are added; see `get_case_panels`. When
+    `since_step` is given with `time_step`, only what `time_step` adds to
+    the earlier step is returned; see `get_delta_window`.
+
+    Observations and medications are read from the memory-mapped compiled
+    store (see `manage.py compile_study`) when one exists and is newer than
+    the case files, and decoded from JSON otherwise; both are cached as
+    compact variables (see `load_case_series`).
 
     Returns
     -------
@@ -234,9 +456,345 @@ def get_case_files(study_id: str, case_id: str, resources_dir: str = RESOURCES_D
     if not os.path.exists(case_dir):
         raise FileNotFoundError(f"Case directory not found at {case_dir}")
 
-    return {
+    medications, observations = load_case_series(
+        case_dir, compiled_case_dir(os.path.join(resources_dir, study_id), case_id))
+
+    case_files = {
         "demographics": load_json(os.path.join(case_dir, 'demographics.json')),
-        "medications": load_json(os.path.join(case_dir, 'medications.json')),
+        "medications": medications,
         "notes": load_json(os.path.join(case_dir, 'note_panel_data.json')),
-        "observations": load_json(os.path.join(case_dir, 'observations.json')),
+        "observations": observations,
+    }
+    return _shape_case_files(study_id, case_id, case_files, resources_dir, time_step, max_points, variables, panels,
+                             since_step)
+
+def _shape_case_files(study_id: str, case_id: str, case_files: Dict, resources_dir: str,
+                      time_step: Optional[int], max_points: Optional[int],
+                      variables: Optional[List[str]] = None, panels: Optional[bool] = None,
+                      since_step: Optional[int] = None) -> Dict:
+    """Apply variable selection, the `time_step` window or delta, downsampling, and panel assembly to loaded case files."""
+    if variables is not None:
+        case_files = select_case_variables(case_files, variables)
+    if since_step is not None:
+        min_t, after_t, max_t = get_delta_window(study_id, case_id, since_step, time_step, resources_dir)
+        case_files = delta_case_files(case_files, min_t, after_t, max_t)
+    elif time_step is not None:
+        min_t, max_t = get_time_step_window(study_id, case_id, time_step, resources_dir)
+        case_files = window_case_files(case_files, min_t, max_t)
+    if max_points is not None:
+        case_files = downsample_case_files(case_files, max_points)
+    if panels:
+        case_files = get_case_panels(study_id, case_id, case_files, time_step, resources_dir)
+    return case_files
+
+def get_delta_window(study_id: str, case_id: str, since_step: int, time_step: Optional[int],
+                     resources_dir: str = RESOURCES_DIR) -> tuple:
+    """Return `(min_t, after_t, max_t)` for a delta from `since_step` to `time_step`.
+
+    `time_step` must extend `since_step`: the same `min_t` and a `max_t` no
+    earlier than its own. The delta holds what falls in `(after_t, max_t]`,
+    `after_t` being the earlier step's `max_t`. Raises ValueError otherwise.
+    """
+    if time_step is None:
+        raise ValueError('since_step requires time_step')
+    prev_min_t, after_t = get_time_step_window(study_id, case_id, since_step, resources_dir)
+    min_t, max_t = get_time_step_window(study_id, case_id, time_step, resources_dir)
+    if min_t != prev_min_t or max_t < after_t:
+        raise ValueError(f"time_step {time_step} does not extend since_step {since_step} for case '{case_id}'")
+    return min_t, after_t, max_t
+
+def get_case_panels(study_id: str, case_id: str, case_files: Dict, time_step: Optional[int] = None,
+                    resources_dir: str = RESOURCES_DIR) -> Dict:
+    """Return `case_files` with the viewer's grouped panels and instructions added.
+
+    Variables are grouped by the study's cached group index (built from
+    `data_layout.json`, `variable_details.json`, and `med_details.json`),
+    and `instructions` is the text of the active step's `instruction_set`
+    (see `settings.SEMR_INSTRUCTION_SETS`).
+    """
+    index = get_group_index(os.path.join(resources_dir, study_id), load_json)
+    try:
+        steps = load_case_details(study_id, case_id, resources_dir)
+    except FileNotFoundError:
+        steps = []  # no time steps: panels only, `instructions` is None
+    return assemble_panels(case_files, index, steps, time_step, INSTRUCTION_SETS)
+
+async def aget_case_files(study_id: str, case_id: str, resources_dir: str = RESOURCES_DIR,
+                          time_step: Optional[int] = None, max_points: Optional[int] = None,
+                          variables: Optional[List[str]] = None, panels: Optional[bool] = None,
+                          since_step: Optional[int] = None) -> Dict:
+    """Async variant of `get_case_files` that loads the case files concurrently.
+
+    Demographics, notes, and the observation/medication series (from the
+    compiled store, or else both JSON files) are read and decoded on the
+    default thread pool at the same time, so slow storage costs one
+    round-trip per case instead of four. Options and errors are those of
+    `get_case_files`.
+    """
+    case_dir = os.path.join(resources_dir, study_id, 'cases_all', case_id)
+    if not await asyncio.to_thread(os.path.isdir, case_dir):
+        raise FileNotFoundError(f"Case directory not found at {case_dir}")
+
+    def load(filename: str, loader=load_json):
+        return asyncio.to_thread(loader, os.path.join(case_dir, filename))
+
+    async def load_series():
+        compiled = await asyncio.to_thread(
+            _load_compiled_series, case_dir, compiled_case_dir(os.path.join(resources_dir, study_id), case_id))
+        if compiled is not None:
+            return compiled
+        return await asyncio.gather(load('medications.json', load_series_json),
+                                    load('observations.json', load_series_json))
+
+    demographics, notes, (medications, observations) = await asyncio.gather(
+        load('demographics.json'), load('note_panel_data.json'), load_series())
+    case_files = {
+        "demographics": demographics,
+        "medications": medications,
+        "notes": notes,
+        "observations": observations,
     }
+    if time_step is None and max_points is None and variables is None and not panels and since_step is None:
+        return case_files
+    return await asyncio.to_thread(
+        _shape_case_files, study_id, case_id, case_files, resources_dir, time_step, max_points, variables, panels,
+        since_step)
+
+def iter_passthrough_payload(study_id: str, case_id: str, options: Dict,
+                             resources_dir: str = RESOURCES_DIR) -> Iterator[bytes]:
+    """Return the chunks of a passed-through case payload (see `payloads.can_passthrough`).
+
+    The case files are streamed verbatim; with the `panels` option the
+    viewer's panels, built from the case's cached series, follow them.
+    """
+    study_dir = os.path.join(resources_dir, study_id)
+    extra = None
+    if options.get('panels'):
+        case_dir = os.path.join(study_dir, 'cases_all', case_id)
+        medications, observations = load_case_series(case_dir, compiled_case_dir(study_dir, case_id))
+        series = {'medications': medications, 'observations': observations}
+        panels = get_case_panels(study_id, case_id, series, None, resources_dir)
+        extra = {key: value for key, value in panels.items() if key not in series}
+    return iter_raw_case_payload(study_dir, case_id, extra=extra)
+
+def _payload_cache_key(study_id: str, case_id: str, options: Dict, encoding: str, resources_dir: str,
+                       etag: Optional[str] = None):
+    if etag is None:
+        etag = case_data_etag(os.path.join(resources_dir, study_id), case_id, options, encoding)
+        if etag is None:
+            raise FileNotFoundError(f"Case '{case_id}' not found in study '{study_id}'")
+    return (os.path.abspath(resources_dir), study_id, case_id, etag)
+
+def get_cached_case_payload(study_id: str, case_id: str, options: Dict, encoding: str,
+                            resources_dir: str = RESOURCES_DIR, etag: Optional[str] = None) -> Optional[bytes]:
+    """Return an encoded case payload from the in-memory cache, or None.
+
+    `etag` is the payload's `case_data_etag` for `encoding` when the caller
+    already computed it (as `get_case_data` does); otherwise it is computed.
+    """
+    try:
+        key = _payload_cache_key(study_id, case_id, options, encoding, resources_dir, etag)
+    except FileNotFoundError:
+        return None
+    return _payload_cache.get(key)
+
+def _split_format(options: Dict) -> Tuple[Dict, Optional[str]]:
+    """Return `(get_case_files options, wire format)` from payload options."""
+    return {k: v for k, v in options.items() if k != 'format'}, options.get('format')
+
+def get_case_payload(study_id: str, case_id: str, options: Dict, encoding: str,
+                     resources_dir: str = RESOURCES_DIR, etag: Optional[str] = None) -> bytes:
+    """Return the encoded `/api/get_case_data/` body for a case.
+
+    Parameters
+    ----------
+    options: dict
+        `get_case_files` keyword options (`time_step`, `max_points`, ...),
+        plus an optional wire `format` ('columnar' or 'binary'; see
+        `SEMRinterface.wireformats`).
+    encoding: str
+        Content-Encoding of the returned bytes ('identity', 'gzip', 'br').
+    etag: str, optional
+        The payload's `case_data_etag` for `encoding`, when the caller
+        already computed it; otherwise it is computed once here.
+
+    Returns
+    -------
+    bytes
+        Served from the in-memory payload cache, else from the on-disk
+        payload cache, else built (and stored in both). The cache key is the
+        payload's ETag, so edited case files are never served stale.
+        Raises FileNotFoundError or ValueError like `get_case_files`.
+    """
+    study_dir = os.path.join(resources_dir, study_id)
+    if etag is None:
+        etag = case_data_etag(study_dir, case_id, options, encoding)
+    key = _payload_cache_key(study_id, case_id, options, encoding, resources_dir, etag)
+    body = _payload_cache.get(key)
+    if body is not None:
+        return body
+    if can_passthrough(study_dir, case_id, options, load_json):
+        build = lambda: b''.join(iter_passthrough_payload(study_id, case_id, options, resources_dir))
+    else:
+        file_options, fmt = _split_format(options)
+        build = lambda: serialize_payload(get_case_files(study_id, case_id, resources_dir, **file_options), fmt)
+    body = get_encoded_payload(study_dir, case_id, options, encoding, build, etag)
+    _payload_cache.put(key, body, len(body))
+    return body
+
+async def aget_case_payload(study_id: str, case_id: str, options: Dict, encoding: str,
+                            resources_dir: str = RESOURCES_DIR, etag: Optional[str] = None) -> bytes:
+    """Async variant of `get_case_payload`.
+
+    Blocking work runs on the default thread pool; when the payload has to
+    be built from JSON the case files are loaded with `aget_case_files`.
+    """
+    study_dir = os.path.join(resources_dir, study_id)
+    if etag is None:
+        etag = await asyncio.to_thread(case_data_etag, study_dir, case_id, options, encoding)
+    key = _payload_cache_key(study_id, case_id, options, encoding, resources_dir, etag)
+    body = _payload_cache.get(key)
+    if body is not None:
+        return body
+    body = await asyncio.to_thread(read_encoded_payload, study_dir, case_id, options, encoding, etag)
+    if body is None:
+        if await asyncio.to_thread(can_passthrough, study_dir, case_id, options, load_json):
+            return await asyncio.to_thread(get_case_payload, study_id, case_id, options, encoding,
+                                           resources_dir, etag)
+        file_options, fmt = _split_format(options)
+        case_files = await aget_case_files(study_id, case_id, resources_dir, **file_options)
+        body = await asyncio.to_thread(get_encoded_payload, study_dir, case_id, options, encoding,
+                                       lambda: serialize_payload(case_files, fmt), etag)
+    _payload_cache.put(key, body, len(body))
+    return body
+
+def get_case_payload_cache_stats() -> Dict[str, Any]:
+    """Return payload-cache counters plus the prefetcher's task counters."""
+    return dict(_payload_cache.stats(), prefetch=_prefetcher.stats())
+
+def _next_uncompleted_case(assignments: Dict, case_id: str) -> Optional[str]:
+    """Return the first uncompleted assigned case after `case_id`, wrapping around."""
+    assigned = assignments.get('cases_assigned') or []
+    completed = set(assignments.get('cases_completed') or [])
+    start = assigned.index(case_id) + 1 if case_id in assigned else 0
+    for candidate in assigned[start:] + assigned[:start]:
+        if candidate != case_id and candidate not in completed:
+            return candidate
+    return None
+
+def _extends(step: Dict, next_step: Dict) -> bool:
+    return step['min_t'] == next_step['min_t'] and next_step['max_t'] >= step['max_t']
+
+def prefetch_case_data(study_id: str, user_id: str, case_id: str, time_step: int = 0,
+                       encoding: str = 'identity', resources_dir: str = RESOURCES_DIR) -> int:
+    """Warm the payload cache for what `user_id` will probably request next.
+
+    Schedules, on the background prefetch pool, the full payload of the
+    user's next uncompleted case and the `time_step + 1` payload of
+    `case_id` (in full, and as a delta from `time_step` when it extends
+    it), all with panels as the case viewer requests them. Pending
+    prefetches for the same user that are no longer relevant are
+    cancelled. Returns the number of tasks scheduled.
+    """
+    if _prefetcher.max_workers == 0:
+        return 0
+    owner = (os.path.abspath(resources_dir), study_id, user_id)
+    tasks = {}
+    assignments = get_case_assignments(study_id, user_id, resources_dir)
+    next_case = _next_uncompleted_case(assignments, case_id) if assignments else None
+    if next_case is not None:
+        tasks[(owner, next_case, 'all', encoding)] = lambda: get_case_payload(
+            study_id, next_case, {'time_step': None, 'max_points': None, 'panels': True}, encoding, resources_dir)
+    try:
+        steps = load_case_details(study_id, case_id, resources_dir)
+    except FileNotFoundError:
+        steps = []
+    if time_step + 1 < len(steps):
+        tasks[(owner, case_id, time_step + 1, encoding)] = lambda: get_case_payload(
+            study_id, case_id, {'time_step': time_step + 1, 'max_points': None, 'panels': True},
+            encoding, resources_dir)
+        if _extends(steps[time_step], steps[time_step + 1]):
+            tasks[(owner, case_id, (time_step, time_step + 1), encoding)] = lambda: get_case_payload(
+                study_id, case_id, {'time_step': time_step + 1, 'since_step': time_step, 'max_points': None,
+                                    'panels': True}, encoding, resources_dir)
+    return _prefetcher.replace(owner, tasks)
+
+def cancel_prefetch(study_id: str, user_id: str, resources_dir: str = RESOURCES_DIR) -> int:
+    """Cancel `user_id`'s prefetches that have not started; returns how many."""
+    return _prefetcher.cancel((os.path.abspath(resources_dir), study_id, user_id))
+
+def _batch_case_line(study_id: str, request: Dict, resources_dir: str) -> bytes:
+    """Load one batch entry and return its NDJSON line (errors included)."""
+    case_id = request['case_id']
+    options = {k: request.get(k) for k in ('time_step', 'max_points', 'variables', 'panels', 'since_step')}
+    try:
+        case_data = get_case_files(study_id, case_id, resources_dir, **options)
+        if request.get('format') == 'columnar':
+            case_data = columnar_case_data(case_data)
+        line = {'case_id': case_id, 'status': 'success', 'case_data': case_data}
+    except FileNotFoundError:
+        line = {'case_id': case_id, 'status': 'error', 'message': 'Case data not found'}
+    except ValueError as exc:
+        line = {'case_id': case_id, 'status': 'error', 'message': str(exc)}
+    except Exception:
+        logger.exception("Batch load failed for case '%s' in study '%s'", case_id, study_id)
+        line = {'case_id': case_id, 'status': 'error', 'message': 'Internal error'}
+    if options['time_step'] is not None:
+        line['time_step'] = options['time_step']
+    return jsoncodec.dumps(line) + b'\n'
+
+def _batch_pool() -> ThreadPoolExecutor:
+    """Return the thread pool shared by all batch requests, creating it on first use."""
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max(1, BATCH_WORKERS), thread_name_prefix='semr-batch')
+        return _batch_executor
+
+def _reset_batch_pool_after_fork() -> None:
+    # Worker threads do not survive fork; the child creates its own pool.
+    global _batch_executor, _batch_executor_lock
+    _batch_executor = None
+    _batch_executor_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_batch_pool_after_fork)
+
+def iter_case_batch(study_id: str, requests: List[Dict], resources_dir: str = RESOURCES_DIR,
+                    window: int = BATCH_WINDOW) -> Iterator[bytes]:
+    """Yield one newline-delimited JSON line per requested case, in request order.
+
+    Parameters
+    ----------
+    requests: list[dict]
+        Entries with a `case_id` and optional `time_step`, `max_points`,
+        `variables` (observation/medication keys to keep), `panels`, and
+        `format` ('columnar' for `t`/`v` series columns).
+    window: int
+        Cases are loaded on the process-wide pool of `SEMR_BATCH_WORKERS`
+        threads, with at most this many per request queued or loaded ahead
+        of the line being sent.
+
+    Each line is `{"case_id", "status": "success", "case_data"}` or
+    `{"case_id", "status": "error", "message"}`, plus `time_step` when one
+    was requested, so one failing case does not abort the batch.
+    """
+    window = max(1, window)
+    executor = _batch_pool()
+    pending = []
+    try:
+        entries = iter(requests)
+        for request in entries:
+            pending.append(executor.submit(_batch_case_line, study_id, request, resources_dir))
+            if len(pending) >= window:
+                break
+        while pending:
+            line = pending.pop(0).result()
+            request = next(entries, None)
+            if request is not None:
+                pending.append(executor.submit(_batch_case_line, study_id, request, resources_dir))
+            yield line
+    finally:
+        # Runs when the client disconnects too; drop cases not started yet.
+        for future in pending:
+            future.cancel()
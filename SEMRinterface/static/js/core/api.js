@@ -91,13 +91,75 @@ class SEMRApiClient {
      * Get case data for a specific study and case
      * @param {string} studyId - The study ID
      * @param {string} caseId - The case ID
-     * @returns {Promise<Object>} Case data
+     * @returns {Promise<Object>} Case data, with grouped panels and instructions
      */
     async getCaseData(studyId, caseId) {
-        const url = `/api/get_case_data/?study_id=${encodeURIComponent(studyId)}&case_id=${encodeURIComponent(caseId)}`;
+        const url = `/api/get_case_data/?study_id=${encodeURIComponent(studyId)}&case_id=${encodeURIComponent(caseId)}&panels=1`;
         return this.request(url, { method: 'GET' });
     }
 
+    /**
+     * Get what a time step adds to an earlier one it extends
+     * @param {string} studyId - The study ID
+     * @param {string} caseId - The case ID
+     * @param {number} sinceStep - Time step already loaded
+     * @param {number} timeStep - Time step to advance to
+     * @returns {Promise<Object>} New points, notes, and variables, with `new_variables`
+     */
+    async getCaseDelta(studyId, caseId, sinceStep, timeStep) {
+        const url = `/api/get_case_data/?study_id=${encodeURIComponent(studyId)}&case_id=${encodeURIComponent(caseId)}`
+            + `&time_step=${timeStep}&since_step=${sinceStep}&panels=1`;
+        return this.request(url, { method: 'GET' });
+    }
+
+    /**
+     * Get case data in the binary wire format, with series as typed arrays
+     * @param {string} studyId - The study ID
+     * @param {string} caseId - The case ID
+     * @returns {Promise<Object>} Case data; numeric series carry `t` and `v` Float64Arrays instead of `data`
+     */
+    async getCaseDataBinary(studyId, caseId) {
+        const url = `/api/get_case_data/?study_id=${encodeURIComponent(studyId)}&case_id=${encodeURIComponent(caseId)}&panels=1`;
+        const response = await fetch(url, { headers: { 'Accept': 'application/vnd.semr.binary' } });
+        if (!response.ok) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.message || `HTTP ${response.status}: ${response.statusText}`);
+        }
+        return SEMRApiClient.decodeCaseFrame(await response.arrayBuffer());
+    }
+
+    /**
+     * Decode a binary case-data frame (`format=binary`)
+     * @param {ArrayBuffer} buffer - The response body
+     * @returns {Object} The response envelope; series `offset`/`length` become `t` and `v` views
+     */
+    static decodeCaseFrame(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'SEMR' || view.getUint32(4, true) !== 1) {
+            throw new Error('Unsupported case data frame');
+        }
+        const headerLength = view.getUint32(8, true);
+        const envelope = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+        const bodyOffset = 12 + headerLength;
+        const seriesKeys = ['numeric_lab_data', 'discrete_lab_data', 'med_data'];
+        for (const fileKey of ['observations', 'medications']) {
+            for (const variable of Object.values(envelope.case_data?.[fileKey] || {})) {
+                for (const key of seriesKeys) {
+                    for (const series of variable[key] || []) {
+                        if (series.offset === undefined) continue;
+                        // Frames are little-endian, as are the hosts browsers run on.
+                        series.t = new Float64Array(buffer, bodyOffset + series.offset * 8, series.length);
+                        series.v = new Float64Array(buffer, bodyOffset + (series.offset + series.length) * 8, series.length);
+                        delete series.offset;
+                        delete series.length;
+                    }
+                }
+            }
+        }
+        return envelope;
+    }
+
     /**
      * Get user details for a study
      * @param {string} studyId - The study ID
@@ -0,0 +1,216 @@
+"""
+Pluggable storage backends for mutable study state.
+
+Study configuration and case data are read-only files, but user assignments,
+case selections, and selection results change while a study runs. The
+`StorageBackend` interface isolates those operations so they can live in the
+original JSON files (`JsonStorageBackend`, the default) or in an indexed
+SQLite database (`SQLiteStorageBackend` in `SEMRinterface.storage_sqlite`).
+
+The backend is chosen with `settings.SEMR_STORAGE_BACKEND` ('json' or
+'sqlite') and obtained through `get_storage_backend`; the functions in
+`SEMRinterface.services` delegate to it.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from . import jsoncodec
+from .journal import get_journal
+from .payloads import is_safe_id
+from .results_writer import get_results_writer
+
+#: Bytes read per block when scanning `stored_results.txt`.
+RESULTS_READ_CHUNK = 1024 * 1024
+
+
+class StorageBackend(ABC):
+    """Interface for the mutable parts of a study.
+
+    Every method takes the study identifier; the backend decides where the
+    data lives. Read methods return shared structures that callers must
+    not mutate.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def get_user_details(self, study_id: str) -> Optional[Dict]:
+        """Return `user_id -> record` for the study, or None if unknown."""
+
+    def get_case_assignments(self, study_id: str, user_id: str) -> Optional[Dict]:
+        """Return one user's record (`cases_assigned`, `cases_completed`, ...)."""
+        user_details = self.get_user_details(study_id)
+        if user_details and user_id in user_details:
+            return user_details[user_id]
+        return None
+
+    @abstractmethod
+    def update_case_assignments(self, study_id: str, user_id: str, new_details: Dict) -> bool:
+        """Merge `new_details` into a user's record; False if the user is unknown."""
+
+    @abstractmethod
+    def mark_case_complete(self, study_id: str, user_id: str, case_id: str) -> bool:
+        """Record `case_id` as completed; False if the user is unknown."""
+
+    @abstractmethod
+    def reset_case(self, study_id: str, user_id: str, case_id: str) -> bool:
+        """Remove `case_id` from the completed list; True only if it was there."""
+
+    @abstractmethod
+    def save_case_selection(self, study_id: str, user_id: str, case_id: str) -> bool:
+        """Remember that the user opened `case_id`."""
+
+    @abstractmethod
+    def save_selected_items(self, study_id: str, user_id: str, case_id: str, selected_items: List[str]) -> bool:
+        """Append one selection result."""
+
+    @abstractmethod
+    def read_results(self, study_id: str, cursor: int = 0,
+                     limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Return result records stored after `cursor` and the cursor to resume from.
+
+        Records use the field names they were stored with (older logs use
+        `selected_ids` instead of `selected_items`). Cursors are opaque
+        integers owned by the backend; 0 means "from the beginning". At most
+        `limit` records are returned when it is given. A returned cursor of 0
+        for a non-zero `cursor` means the results were replaced and callers
+        that aggregate them should start over.
+        """
+
+
+class JsonStorageBackend(StorageBackend):
+    """Backend over the study folder's JSON files and `stored_results.txt`.
+
+    Assignments go through the append-only journal, results through the
+    batched `ResultsWriter`, and `case_selections.json` is rewritten whole.
+    """
+
+    name = 'json'
+
+    def __init__(self, resources_dir: str, journal_options: Optional[Dict] = None,
+                 results_options: Optional[Dict] = None):
+        self.resources_dir = resources_dir
+        self.journal_options = journal_options or {}
+        self.results_options = results_options or {}
+
+    def _study_dir(self, study_id: str) -> str:
+        return os.path.join(self.resources_dir, study_id)
+
+    def _journal(self, study_id: str):
+        return get_journal(self._study_dir(study_id), **self.journal_options)
+
+    def _append(self, study_id: str, event: Dict, require_change: bool = False) -> bool:
+        journal = self._journal(study_id)
+        return journal is not None and journal.append(event, require_change)
+
+    def get_user_details(self, study_id: str) -> Optional[Dict]:
+        journal = self._journal(study_id)
+        return journal.read() if journal is not None else None
+
+    def update_case_assignments(self, study_id: str, user_id: str, new_details: Dict) -> bool:
+        return self._append(study_id, {'op': 'update', 'user_id': user_id, 'details': new_details})
+
+    def mark_case_complete(self, study_id: str, user_id: str, case_id: str) -> bool:
+        return self._append(study_id, {'op': 'complete', 'user_id': user_id, 'case_id': case_id})
+
+    def reset_case(self, study_id: str, user_id: str, case_id: str) -> bool:
+        return self._append(study_id, {'op': 'reset', 'user_id': user_id, 'case_id': case_id},
+                            require_change=True)
+
+    def save_case_selection(self, study_id: str, user_id: str, case_id: str) -> bool:
+        from .services import load_json, save_json
+
+        selection_path = os.path.join(self._study_dir(study_id), 'case_selections.json')
+        selections = load_json(selection_path, use_cache=False) or {}
+        if user_id not in selections:
+            selections[user_id] = []
+        if case_id not in selections[user_id]:
+            selections[user_id].append(case_id)
+        save_json(selections, selection_path)
+        return True
+
+    def save_selected_items(self, study_id: str, user_id: str, case_id: str, selected_items: List[str]) -> bool:
+        # Writers live for the whole process, so never create one for an unknown study.
+        study_dir = self._study_dir(study_id)
+        if not is_safe_id(study_id) or not os.path.isdir(study_dir):
+            return False
+        path = os.path.join(study_dir, 'stored_results.txt')
+        return get_results_writer(path, **self.results_options).submit({
+            "user_id": user_id,
+            "case_id": case_id,
+            "selected_items": selected_items
+        })
+
+    def read_results(self, study_id: str, cursor: int = 0,
+                     limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Read `stored_results.txt` from byte offset `cursor`.
+
+        The file is read in `RESULTS_READ_CHUNK` blocks and only complete
+        lines are consumed, so a line being appended is picked up on the
+        next call. Unparseable lines are skipped.
+        """
+        path = os.path.join(self._study_dir(study_id), 'stored_results.txt')
+        records: List[Dict] = []
+        try:
+            with open(path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size < cursor:
+                    return [], 0  # the log was replaced or truncated
+                file.seek(cursor)
+                buffer = b''
+                while limit is None or len(records) < limit:
+                    chunk = file.read(RESULTS_READ_CHUNK)
+                    if not chunk:
+                        break
+                    buffer += chunk
+                    lines = buffer.split(b'\n')
+                    buffer = lines.pop()
+                    for line in lines:
+                        cursor += len(line) + 1
+                        try:
+                            record = jsoncodec.loads(line)
+                        except ValueError:
+                            continue
+                        if isinstance(record, dict):
+                            records.append(record)
+                            if limit is not None and len(records) >= limit:
+                                break
+        except FileNotFoundError:
+            return [], 0
+        return records, cursor
+
+
+_backends: Dict[Tuple[str, str], StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage_backend(resources_dir: str, name: Optional[str] = None) -> StorageBackend:
+    """Return the process-wide backend for `resources_dir`.
+
+    `name` defaults to `settings.SEMR_STORAGE_BACKEND` ('json' if unset).
+    """
+    from . import services
+
+    name = name or services.STORAGE_BACKEND
+    key = (name, os.path.abspath(resources_dir))
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if name == 'json':
+                backend = JsonStorageBackend(
+                    resources_dir,
+                    journal_options={
+                        'fsync_interval': services.JOURNAL_FSYNC_INTERVAL,
+                        'compact_events': services.JOURNAL_COMPACT_EVENTS,
+                    },
+                    results_options=services.results_writer_options(),
+                )
+            elif name == 'sqlite':
+                from .storage_sqlite import SQLiteStorageBackend
+                backend = SQLiteStorageBackend(services.SQLITE_PATH, results_options=services.results_writer_options())
+            else:
+                raise ValueError(f"Unknown storage backend '{name}'")
+            _backends[key] = backend
+        return backend
@@ -0,0 +1,295 @@
+"""
+SQLite storage backend for assignments, case selections, and results.
+
+Uses the standard-library `sqlite3` module against the project's SQLite
+database file (`settings.SEMR_SQLITE_PATH`, defaulting to the `default`
+DATABASES entry). The database runs in WAL mode so readers never block the
+single writer, every table is keyed by `(study_id, user_id, ...)` so per-user
+lookups and completion updates are index seeks, and selection results are
+inserted in batches through the shared `ResultsWriter` queue, one
+transaction per batch.
+
+`import_json_study` performs a one-shot import of an existing study's
+`user_details.json` (plus journal), `case_selections.json`, and
+`stored_results.txt`; see `manage.py import_storage`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .results_writer import TransientWriteError, get_results_writer
+from .storage import JsonStorageBackend, StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS semr_user (
+    study_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    details TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (study_id, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS semr_case_assignment (
+    study_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (study_id, user_id, case_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS semr_case_completion (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    study_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    UNIQUE (study_id, user_id, case_id)
+);
+CREATE TABLE IF NOT EXISTS semr_case_selection (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    study_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    UNIQUE (study_id, user_id, case_id)
+);
+CREATE TABLE IF NOT EXISTS semr_result (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    study_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    selected_items TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS semr_result_study_case ON semr_result (study_id, case_id);
+CREATE INDEX IF NOT EXISTS semr_result_study_user ON semr_result (study_id, user_id);
+"""
+
+#: Record keys stored in their own tables rather than in `semr_user.details`.
+LIST_FIELDS = ('cases_assigned', 'cases_completed')
+
+#: Every table holding per-study rows.
+STUDY_TABLES = ('semr_user', 'semr_case_assignment', 'semr_case_completion', 'semr_case_selection', 'semr_result')
+
+
+class StudyExistsError(ValueError):
+    """Raised by `import_json_study` when the study already has rows and `replace` is not set."""
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """`StorageBackend` persisted in a WAL-mode SQLite database."""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str, results_options: Optional[Dict] = None):
+        self.db_path = db_path
+        self.results_options = results_options or {}
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # -- reads -------------------------------------------------------------------
+
+    def _records(self, study_id: str, user_id: Optional[str] = None) -> Dict[str, Dict]:
+        conn = self._connection()
+        where, args = 'study_id = ?', [study_id]
+        if user_id is not None:
+            where, args = where + ' AND user_id = ?', args + [user_id]
+        records = {}
+        for uid, details in conn.execute(f'SELECT user_id, details FROM semr_user WHERE {where}', args):
+            record = json.loads(details)
+            record['cases_assigned'] = []
+            record['cases_completed'] = []
+            records[uid] = record
+        for uid, case_id in conn.execute(
+                f'SELECT user_id, case_id FROM semr_case_assignment WHERE {where} ORDER BY user_id, position', args):
+            records[uid]['cases_assigned'].append(case_id)
+        for uid, case_id in conn.execute(
+                f'SELECT user_id, case_id FROM semr_case_completion WHERE {where} ORDER BY seq', args):
+            records[uid]['cases_completed'].append(case_id)
+        return records
+
+    def get_user_details(self, study_id: str) -> Optional[Dict]:
+        return self._records(study_id) or None
+
+    def get_case_assignments(self, study_id: str, user_id: str) -> Optional[Dict]:
+        return self._records(study_id, user_id).get(user_id)
+
+    def read_results(self, study_id: str, cursor: int = 0,
+                     limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Return results with `id > cursor`; the cursor is the last row id read."""
+        rows = self._connection().execute(
+            'SELECT id, user_id, case_id, selected_items FROM semr_result'
+            ' WHERE study_id = ? AND id > ? ORDER BY id LIMIT ?',
+            (study_id, cursor, -1 if limit is None else limit)).fetchall()
+        records = [{'user_id': u, 'case_id': c, 'selected_items': json.loads(items)} for _, u, c, items in rows]
+        return records, (rows[-1][0] if rows else cursor)
+
+    # -- writes ------------------------------------------------------------------
+
+    def _user_exists(self, conn: sqlite3.Connection, study_id: str, user_id: str) -> bool:
+        return conn.execute('SELECT 1 FROM semr_user WHERE study_id = ? AND user_id = ?',
+                            (study_id, user_id)).fetchone() is not None
+
+    def _replace_list(self, conn, table: str, study_id: str, user_id: str, case_ids: List[str]) -> None:
+        conn.execute(f'DELETE FROM {table} WHERE study_id = ? AND user_id = ?', (study_id, user_id))
+        if table == 'semr_case_assignment':
+            conn.executemany('INSERT OR IGNORE INTO semr_case_assignment VALUES (?, ?, ?, ?)',
+                             [(study_id, user_id, c, i) for i, c in enumerate(case_ids)])
+        else:
+            conn.executemany(f'INSERT OR IGNORE INTO {table} (study_id, user_id, case_id) VALUES (?, ?, ?)',
+                             [(study_id, user_id, c) for c in case_ids])
+
+    def _upsert_user(self, conn, study_id: str, user_id: str, record: Dict) -> None:
+        details = {k: v for k, v in record.items() if k not in LIST_FIELDS}
+        conn.execute('INSERT INTO semr_user (study_id, user_id, details) VALUES (?, ?, ?)'
+                     ' ON CONFLICT (study_id, user_id) DO UPDATE SET details = excluded.details',
+                     (study_id, user_id, json.dumps(details)))
+        if record.get('cases_assigned') is not None:
+            self._replace_list(conn, 'semr_case_assignment', study_id, user_id, record['cases_assigned'])
+        if record.get('cases_completed') is not None:
+            self._replace_list(conn, 'semr_case_completion', study_id, user_id, record['cases_completed'])
+
+    def update_case_assignments(self, study_id: str, user_id: str, new_details: Dict) -> bool:
+        conn = self._connection()
+        with conn:
+            row = conn.execute('SELECT details FROM semr_user WHERE study_id = ? AND user_id = ?',
+                               (study_id, user_id)).fetchone()
+            if row is None:
+                return False
+            details = json.loads(row[0])
+            details.update({k: v for k, v in new_details.items() if k not in LIST_FIELDS})
+            self._upsert_user(conn, study_id, user_id, dict(details, **{
+                k: new_details.get(k) for k in LIST_FIELDS}))
+        return True
+
+    def mark_case_complete(self, study_id: str, user_id: str, case_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            if not self._user_exists(conn, study_id, user_id):
+                return False
+            conn.execute('INSERT OR IGNORE INTO semr_case_completion (study_id, user_id, case_id) VALUES (?, ?, ?)',
+                         (study_id, user_id, case_id))
+        return True
+
+    def reset_case(self, study_id: str, user_id: str, case_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute('DELETE FROM semr_case_completion WHERE study_id = ? AND user_id = ? AND case_id = ?',
+                                  (study_id, user_id, case_id))
+        return cursor.rowcount > 0
+
+    def save_case_selection(self, study_id: str, user_id: str, case_id: str) -> bool:
+        conn = self._connection()
+        with conn:
+            conn.execute('INSERT OR IGNORE INTO semr_case_selection (study_id, user_id, case_id) VALUES (?, ?, ?)',
+                         (study_id, user_id, case_id))
+        return True
+
+    def _insert_results(self, batch: List[Dict]) -> None:
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO semr_result (study_id, user_id, case_id, selected_items, created_at)'
+                    ' VALUES (?, ?, ?, ?, ?)',
+                    [(r['study_id'], r['user_id'], r['case_id'], json.dumps(r['selected_items']), r['created_at'])
+                     for r in batch])
+        except sqlite3.OperationalError as exc:
+            # Locked or busy database, full disk, ...: worth retrying.
+            raise TransientWriteError(f"SQLite results insert failed: {exc}") from exc
+        except sqlite3.Error as exc:
+            raise OSError(f"SQLite results insert failed: {exc}") from exc
+
+    def save_selected_items(self, study_id: str, user_id: str, case_id: str, selected_items: List[str]) -> bool:
+        writer = get_results_writer(f"{self.db_path}#semr_result", sink=self._insert_results, **self.results_options)
+        return writer.submit({
+            'study_id': study_id,
+            'user_id': user_id,
+            'case_id': case_id,
+            'selected_items': selected_items,
+            'created_at': time.time(),
+        })
+
+    def _has_rows(self, conn: sqlite3.Connection, study_id: str) -> bool:
+        return any(conn.execute(f'SELECT 1 FROM {table} WHERE study_id = ? LIMIT 1', (study_id,)).fetchone()
+                   for table in STUDY_TABLES)
+
+    def _delete_rows(self, conn: sqlite3.Connection, study_id: str) -> None:
+        for table in STUDY_TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE study_id = ?', (study_id,))
+
+    def has_study(self, study_id: str) -> bool:
+        """Return True if any table holds rows for `study_id`."""
+        return self._has_rows(self._connection(), study_id)
+
+    def clear_study(self, study_id: str) -> None:
+        """Delete every row belonging to `study_id`."""
+        conn = self._connection()
+        with conn:
+            self._delete_rows(conn, study_id)
+
+
+def import_json_study(source: JsonStorageBackend, target: SQLiteStorageBackend, study_id: str,
+                      replace: bool = False) -> Dict[str, int]:
+    """Copy one study's JSON-file state into `target` in a single transaction.
+
+    Raises StudyExistsError if `target` already has rows for the study in
+    any table, unless `replace` is set, in which case those rows are
+    deleted in the same transaction, so a failed import leaves them intact.
+
+    Old result lines that use `selected_ids` instead of `selected_items` are
+    accepted. Selections and results that cannot be stored (a missing or
+    non-string user or case id, or a non-list item field) are skipped.
+    Returns counts of imported users, selections, and results, and of the
+    skipped `invalid_selections` and `invalid_results`.
+    """
+    from .services import load_json
+
+    users = source.get_user_details(study_id) or {}
+    selections = load_json(os.path.join(source.resources_dir, study_id, 'case_selections.json'),
+                           use_cache=False) or {}
+    selection_rows = [(study_id, u, c) for u, cases in selections.items()
+                      for c in (cases if isinstance(cases, list) else [None])]
+    valid_selections = [row for row in selection_rows if isinstance(row[2], str)]
+    result_rows = []
+    invalid_results = 0
+    for record in source.read_results(study_id)[0]:
+        items = record.get('selected_items', record.get('selected_ids', []))
+        if not (isinstance(record.get('user_id'), str) and isinstance(record.get('case_id'), str)
+                and isinstance(items, list)):
+            invalid_results += 1
+            continue
+        result_rows.append((record['user_id'], record['case_id'], items))
+    conn = target._connection()
+    now = time.time()
+    with conn:
+        # Take the write lock before checking, so no other writer can add rows in between.
+        conn.execute('BEGIN IMMEDIATE')
+        if target._has_rows(conn, study_id):
+            if not replace:
+                raise StudyExistsError(f"'{study_id}' already has rows in {target.db_path}")
+            target._delete_rows(conn, study_id)
+        for user_id, record in users.items():
+            target._upsert_user(conn, study_id, user_id, dict(record, **{
+                k: record.get(k) or [] for k in LIST_FIELDS}))
+        conn.executemany('INSERT OR IGNORE INTO semr_case_selection (study_id, user_id, case_id) VALUES (?, ?, ?)',
+                         valid_selections)
+        conn.executemany(
+            'INSERT INTO semr_result (study_id, user_id, case_id, selected_items, created_at) VALUES (?, ?, ?, ?, ?)',
+            [(study_id, user_id, case_id, json.dumps(items), now) for user_id, case_id, items in result_rows])
+    return {
+        'users': len(users),
+        'selections': len(valid_selections),
+        'results': len(result_rows),
+        'invalid_selections': len(selection_rows) - len(valid_selections),
+        'invalid_results': invalid_results,
+    }
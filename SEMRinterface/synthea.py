@@ -0,0 +1,501 @@
+"""
+Convert Synthea CSV exports into a SEMR study.
+
+The conversion runs in three passes so memory stays bounded no matter how
+large the export is:
+
+1. `select_encounters` streams `encounters.csv` and `patients.csv` and keeps
+   only the encounters to import (by encounter class and, optionally, reason)
+   together with their patients' demographics.
+2. `partition_table` streams one event CSV (observations, medications,
+   conditions, ...) in chunks of `chunk_rows` rows and appends each row of a
+   selected encounter to a spool file for that encounter's shard. Tables are
+   partitioned in parallel, one process per file.
+3. `convert_shard` runs in a process pool, one task per shard. It groups the
+   shard's spooled rows by encounter and writes `cases_all/<encounter_id>/`
+   (`observations.json`, `medications.json`, `demographics.json`,
+   `note_panel_data.json`), returning the case summaries and the variable
+   descriptions it saw.
+
+`import_study` drives the passes and writes the study-level
+`case_details.json` and `list_case_dicts.json` (plus `variable_details.json`,
+`med_details.json`, and `data_layout.json` when the study has none yet).
+Observation and medication codes are used as variable keys with dashes
+replaced by underscores, since the keys become HTML ids (`8310-5` ->
+`8310_5`).
+"""
+
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+import zlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+#: Table name -> CSV file name of the event tables that are partitioned.
+EVENT_TABLES = {
+    'observations': 'observations.csv',
+    'medications': 'medications.csv',
+    'careplans': 'careplans.csv',
+    'conditions': 'conditions.csv',
+    'devices': 'devices.csv',
+    'procedures': 'procedures.csv',
+    'allergies': 'allergies.csv',
+    'imaging_studies': 'imaging_studies.csv',
+    'immunizations': 'immunizations.csv',
+}
+
+#: Event table -> note panel group (see the study's `data_layout.json`).
+NOTE_GROUPS = {
+    'careplans': 'Careplan',
+    'conditions': 'Condition',
+    'devices': 'Device',
+    'procedures': 'Procedure',
+    'allergies': 'Allergies',
+    'imaging_studies': 'Images',
+    'immunizations': 'Immunizations',
+}
+
+DEFAULT_DATA_LAYOUT = {
+    'title_bar': ['id', 'name', 'age', 'sex', 'race', 'ethnicity'],
+    'physio_panel_groups': ['Physio'],
+    'med_panel_groups': ['All_routes'],
+    'lab_panel_groups': ['UNASSIGNED'],
+    'note_panel_groups': list(NOTE_GROUPS.values()),
+}
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def normalize_key(code: str) -> str:
+    """Return `code` usable as an HTML id (dashes become underscores)."""
+    return code.strip().replace('-', '_')
+
+
+def parse_time(value: str) -> Optional[float]:
+    """Parse a Synthea date or timestamp into JavaScript epoch milliseconds."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() * 1000.0
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def shard_of(encounter_id: str, shards: int) -> int:
+    """Stable shard index for an encounter id."""
+    return zlib.crc32(encounter_id.encode('utf-8')) % shards
+
+
+def iter_csv(path: str) -> Iterator[Dict[str, str]]:
+    """Stream the rows of a CSV file as dicts."""
+    with open(path, newline='', encoding='utf-8') as file:
+        yield from csv.DictReader(file)
+
+
+# -- pass 1: encounters ------------------------------------------------------------
+
+def select_encounters(csv_dir: str, encounter_classes=('inpatient',), reason: Optional[str] = None,
+                      limit: Optional[int] = None) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Return `(encounters, patients)` for the encounters to import.
+
+    Encounters are kept when their ENCOUNTERCLASS is in `encounter_classes`
+    (all classes if empty) and, if `reason` is given, it occurs
+    (case-insensitively) in their reason or description.
+    """
+    encounters = {}
+    wanted_reason = reason.lower() if reason else None
+    for row in iter_csv(os.path.join(csv_dir, 'encounters.csv')):
+        if encounter_classes and row.get('ENCOUNTERCLASS') not in encounter_classes:
+            continue
+        text = f"{row.get('REASONDESCRIPTION', '')} {row.get('DESCRIPTION', '')}".lower()
+        if wanted_reason and wanted_reason not in text:
+            continue
+        start, stop = parse_time(row.get('START')), parse_time(row.get('STOP'))
+        if start is None:
+            continue
+        encounters[row['Id']] = {
+            'patient_id': row['PATIENT'],
+            'start': start,
+            'stop': stop if stop is not None else start,
+            'encounter_type': row.get('ENCOUNTERCLASS', ''),
+            'admit_reason': row.get('REASONDESCRIPTION') or row.get('DESCRIPTION', ''),
+        }
+        if limit and len(encounters) >= limit:
+            break
+    wanted_patients = {e['patient_id'] for e in encounters.values()}
+    patients = {}
+    for row in iter_csv(os.path.join(csv_dir, 'patients.csv')):
+        if row['Id'] in wanted_patients:
+            patients[row['Id']] = {
+                'birth': parse_time(row.get('BIRTHDATE')),
+                'sex': row.get('GENDER', ''),
+                'race': row.get('RACE', ''),
+                'ethnicity': row.get('ETHNICITY', ''),
+                'name': ' '.join(p for p in (row.get('FIRST', ''), row.get('LAST', '')) if p),
+            }
+    return encounters, patients
+
+
+# -- pass 2: partitioning ----------------------------------------------------------
+
+def _spool_path(spool_dir: str, shard: int, table: str) -> str:
+    return os.path.join(spool_dir, f"{shard:05d}.{table}.csv")
+
+
+def partition_table(csv_path: str, table: str, shard_by_encounter: Dict[str, int], spool_dir: str,
+                    chunk_rows: int = 50000) -> int:
+    """Append the rows of selected encounters to per-shard spool files.
+
+    Rows are buffered per shard and flushed every `chunk_rows` rows, so
+    memory use is bounded by the chunk size. Returns the number of rows kept.
+    """
+    kept = 0
+    with open(csv_path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header or 'ENCOUNTER' not in header:
+            return 0
+        encounter_col = header.index('ENCOUNTER')
+        buffers: Dict[int, List[List[str]]] = defaultdict(list)
+        started = set()
+
+        def flush() -> None:
+            for shard, rows in buffers.items():
+                path = _spool_path(spool_dir, shard, table)
+                with open(path, 'a', newline='', encoding='utf-8') as out:
+                    writer = csv.writer(out)
+                    if shard not in started:
+                        writer.writerow(header)
+                        started.add(shard)
+                    writer.writerows(rows)
+            buffers.clear()
+
+        buffered = 0
+        for row in reader:
+            shard = shard_by_encounter.get(row[encounter_col]) if len(row) > encounter_col else None
+            if shard is None:
+                continue
+            buffers[shard].append(row)
+            kept += 1
+            buffered += 1
+            if buffered >= chunk_rows:
+                flush()
+                buffered = 0
+        flush()
+    return kept
+
+
+# -- pass 3: case building ---------------------------------------------------------
+
+def build_observations(rows: List[Dict[str, str]]) -> Tuple[Dict, Dict]:
+    """Return `(observations, variable_descriptions)` for one encounter."""
+    by_key: Dict[str, Dict] = {}
+    for row in rows:
+        t = parse_time(row.get('DATE'))
+        if t is None or not row.get('CODE'):
+            continue
+        key = normalize_key(row['CODE'])
+        entry = by_key.setdefault(key, {'description': row.get('DESCRIPTION', ''),
+                                        'units': row.get('UNITS', ''), 'numeric': [], 'discrete': []})
+        value = None if row.get('TYPE') == 'text' else _to_float(row.get('VALUE'))
+        if value is not None:
+            entry['numeric'].append([t, value])
+        elif row.get('VALUE'):
+            entry['discrete'].append((t, row['VALUE']))
+
+    observations, descriptions = {}, {}
+    for key, entry in by_key.items():
+        numeric = sorted(entry['numeric'])
+        discrete = sorted(entry['discrete'])
+        nominal: List[str] = []
+        for _, value in discrete:
+            if value not in nominal:
+                nominal.append(value)
+        values = [v for _, v in numeric]
+        observations[key] = {
+            'display_text': entry['description'],
+            'numeric_lab_data': [{
+                'name': 'numeric_values',
+                'zones': [{'color': '#000000'}],
+                'data': numeric,
+                'marker': {'symbol': 'circle'},
+            }] if numeric else [],
+            'discrete_lab_data': [{
+                'name': 'discrete_values',
+                'color': '#000000',
+                'data': [[t, nominal.index(v)] for t, v in discrete],
+                'marker': {'symbol': 'square'},
+            }] if discrete else [],
+            'discrete_nominal_to_yIndex': nominal,
+            'y_axis_ranges': [min(values), max(values)] if values else [0, max(len(nominal) - 1, 0)],
+        }
+        descriptions[key] = {'description': entry['description'], 'units': entry['units']}
+    return observations, descriptions
+
+
+def build_medications(rows: List[Dict[str, str]]) -> Tuple[Dict, Dict]:
+    """Return `(medications, medication_descriptions)` for one encounter."""
+    by_key: Dict[str, Dict] = {}
+    for row in rows:
+        t = parse_time(row.get('START'))
+        if t is None or not row.get('CODE'):
+            continue
+        key = normalize_key(row['CODE'])
+        entry = by_key.setdefault(key, {'description': row.get('DESCRIPTION', ''), 'points': []})
+        value = _to_float(row.get('BASE_COST'))
+        entry['points'].append((t, value if value is not None else 0.0, row.get('REASONDESCRIPTION', '')))
+
+    medications, descriptions = {}, {}
+    for key, entry in by_key.items():
+        points = sorted(entry['points'], key=lambda p: p[0])
+        values = [v for _, v, _ in points]
+        medications[key] = {
+            'display_text': entry['description'],
+            'med_data': [{
+                'name': 'medication_data',
+                'color': '#000000',
+                'data': [[t, v] for t, v, _ in points],
+                'marker': {'symbol': 'circle'},
+                'med_reason_tooltips': [reason for _, _, reason in points],
+            }],
+            'y_axis_ranges': [min(values), max(values)],
+        }
+        descriptions[key] = {'description': entry['description']}
+    return medications, descriptions
+
+
+def build_notes(tables: Dict[str, List[Dict[str, str]]]) -> Dict[str, List[Dict]]:
+    """Return `note_panel_data` grouped by note panel group."""
+    notes: Dict[str, List[Dict]] = {}
+    upk = 0
+    for table, group in NOTE_GROUPS.items():
+        entries = []
+        for row in tables.get(table, ()):
+            t = parse_time(row.get('START') or row.get('DATE'))
+            if t is None:
+                continue
+            text = row.get('DESCRIPTION') or row.get('BODYSITE_DESCRIPTION') or ''
+            if row.get('REASONDESCRIPTION'):
+                text = f"{text} (reason: {row['REASONDESCRIPTION']})"
+            entries.append((t, text))
+        for t, text in sorted(entries, key=lambda e: e[0]):
+            date = datetime.fromtimestamp(t / 1000.0, tz=timezone.utc)
+            notes.setdefault(group, []).append({
+                'date': f"{date.month:02d}/{date.day:02d}",
+                'text': text,
+                'js_time': t,
+                'upk': upk,
+                'type': group,
+            })
+            upk += 1
+    return notes
+
+
+def build_time_steps(start: float, stop: float, steps: int = 2) -> List[Dict]:
+    """Return `case_details.json` epochs for an encounter.
+
+    Every step starts at admission; the last ends `floor(stay)` days after
+    admission (at least one day) and earlier steps end one day before the
+    next. Only the last step asks for selections.
+    """
+    last_day = max(1, int((stop - start) // DAY_MS))
+    epochs = []
+    for index in range(steps):
+        end_day = max(1, last_day - (steps - 1 - index))
+        final = index == steps - 1
+        epochs.append({
+            'min_t': start,
+            'max_t': start + end_day * DAY_MS,
+            'check_boxes': 1 if final else 0,
+            'instruction_set': 'select' if final else 'familiar',
+        })
+    return epochs
+
+
+def _write_json(data, path: str) -> None:
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+
+def convert_shard(spool_dir: str, shard: int, encounters: Dict[str, Dict], patients: Dict[str, Dict],
+                  cases_dir: str, time_steps: int = 2) -> Dict:
+    """Build the case folders of one shard (runs in a worker process).
+
+    Returns `{'cases': [...list_case_dicts entries], 'case_details': {...},
+    'variables': {...}, 'medications': {...}}`.
+    """
+    rows: Dict[str, Dict[str, List[Dict[str, str]]]] = defaultdict(lambda: defaultdict(list))
+    for table in EVENT_TABLES:
+        path = _spool_path(spool_dir, shard, table)
+        if os.path.exists(path):
+            for row in iter_csv(path):
+                rows[row['ENCOUNTER']][table].append(row)
+
+    result = {'cases': [], 'case_details': {}, 'variables': {}, 'medications': {}}
+    for encounter_id in sorted(encounters):
+        encounter = encounters[encounter_id]
+        patient = patients.get(encounter['patient_id'], {})
+        tables = rows.pop(encounter_id, {})
+        observations, variables = build_observations(tables.get('observations', []))
+        medications, meds = build_medications(tables.get('medications', []))
+        birth = patient.get('birth')
+        demographics = {
+            'age': int((encounter['start'] - birth) // (365.2425 * DAY_MS)) if birth is not None else '',
+            'sex': patient.get('sex', ''),
+            'race': patient.get('race', ''),
+            'ethnicity': patient.get('ethnicity', ''),
+            'id': encounter_id,
+            'name': patient.get('name', ''),
+        }
+
+        case_dir = os.path.join(cases_dir, encounter_id)
+        os.makedirs(case_dir, exist_ok=True)
+        _write_json(observations, os.path.join(case_dir, 'observations.json'))
+        _write_json(medications, os.path.join(case_dir, 'medications.json'))
+        _write_json(demographics, os.path.join(case_dir, 'demographics.json'))
+        _write_json(build_notes(tables), os.path.join(case_dir, 'note_panel_data.json'))
+
+        start, stop = encounter['start'], encounter['stop']
+        result['case_details'][encounter_id] = build_time_steps(start, stop, time_steps)
+        result['cases'].append({
+            'case_id': encounter_id,
+            'min_t': start,
+            'max_t': stop,
+            'START_DATETIME': datetime.fromtimestamp(start / 1000.0, tz=timezone.utc).strftime('%Y/%m/%d'),
+            'END_DATETIME': datetime.fromtimestamp(stop / 1000.0, tz=timezone.utc).strftime('%Y/%m/%d'),
+            'admit_reason': encounter['admit_reason'],
+            'encounter_type': encounter['encounter_type'],
+            'length_of_stay': int((stop - start) // DAY_MS),
+            'patient_id': encounter['patient_id'],
+            'patient_name': patient.get('name', ''),
+            'number_of_observation_fields': len(observations),
+            'number_of_medication_fields': len(medications),
+        })
+        result['variables'].update(variables)
+        result['medications'].update(meds)
+    return result
+
+
+# -- driver ------------------------------------------------------------------------
+
+def _read_existing(path: str, default):
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return default
+    return data if isinstance(data, type(default)) else default
+
+
+def _merge_case_index(study_dir: str, cases: List[Dict], case_details: Dict) -> None:
+    """Add imported cases to the study's `case_details.json` and `list_case_dicts.json`.
+
+    Entries of cases that were not re-imported are kept; re-imported cases
+    are replaced in place and new ones appended.
+    """
+    details_path = os.path.join(study_dir, 'case_details.json')
+    merged_details = _read_existing(details_path, {})
+    merged_details.update(case_details)
+    _write_json(dict(sorted(merged_details.items())), details_path)
+
+    list_path = os.path.join(study_dir, 'list_case_dicts.json')
+    imported = {case['case_id']: case for case in cases}
+    merged_cases = []
+    for case in _read_existing(list_path, []):
+        case_id = case.get('case_id') if isinstance(case, dict) else None
+        merged_cases.append(imported.pop(case_id) if case_id in imported else case)
+    merged_cases.extend(case for case in cases if case['case_id'] in imported)
+    _write_json(merged_cases, list_path)
+
+
+def _merge_details(study_dir: str, variables: Dict, medications: Dict) -> None:
+    """Write variable/medication details and a data layout the study lacks."""
+    variable_path = os.path.join(study_dir, 'variable_details.json')
+    if not os.path.exists(variable_path):
+        _write_json({key: {
+            'display_group': 'UNASSIGNED',
+            'display_name': info['description'],
+            'dflt_normal_ranges': ['', ''],
+            'dflt_y_axis_ranges': [0, 0],
+            'original_name': info['description'],
+            'units': info['units'],
+        } for key, info in sorted(variables.items())}, variable_path)
+    med_path = os.path.join(study_dir, 'med_details.json')
+    if not os.path.exists(med_path):
+        _write_json({key: {'med_route': 'All_routes', 'display_name': info['description']}
+                     for key, info in sorted(medications.items())}, med_path)
+    layout_path = os.path.join(study_dir, 'data_layout.json')
+    if not os.path.exists(layout_path):
+        _write_json(DEFAULT_DATA_LAYOUT, layout_path)
+
+
+def import_study(csv_dir: str, study_dir: str, workers: Optional[int] = None, shard_size: int = 500,
+                 chunk_rows: int = 50000, encounter_classes=('inpatient',), reason: Optional[str] = None,
+                 limit: Optional[int] = None, time_steps: int = 2, log=None) -> Dict:
+    """Convert the Synthea export in `csv_dir` into the study at `study_dir`.
+
+    Imported cases are added to an existing study's `case_details.json` and
+    `list_case_dicts.json` (see `_merge_case_index`); a case folder with the
+    same id is overwritten. Returns counts of imported cases and of rows
+    kept per event table.
+    """
+    log = log or (lambda message: None)
+    encounters, patients = select_encounters(csv_dir, encounter_classes, reason, limit)
+    log(f"Selected {len(encounters)} encounters for {len(patients)} patients")
+    if not encounters:
+        return {'cases': 0, 'rows': {}}
+    shards = max(1, math.ceil(len(encounters) / max(1, shard_size)))
+    shard_by_encounter = {encounter_id: shard_of(encounter_id, shards) for encounter_id in encounters}
+
+    cases_dir = os.path.join(study_dir, 'cases_all')
+    os.makedirs(cases_dir, exist_ok=True)
+    spool_dir = tempfile.mkdtemp(prefix='semr-synthea-', dir=study_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tables = {table: os.path.join(csv_dir, filename) for table, filename in EVENT_TABLES.items()
+                      if os.path.exists(os.path.join(csv_dir, filename))}
+            futures = {table: pool.submit(partition_table, path, table, shard_by_encounter, spool_dir, chunk_rows)
+                       for table, path in tables.items()}
+            rows = {table: future.result() for table, future in futures.items()}
+            log("Partitioned " + ", ".join(f"{count} {table}" for table, count in rows.items()))
+
+            by_shard: Dict[int, Dict[str, Dict]] = defaultdict(dict)
+            for encounter_id, shard in shard_by_encounter.items():
+                by_shard[shard][encounter_id] = encounters[encounter_id]
+            futures = [
+                pool.submit(convert_shard, spool_dir, shard, shard_encounters,
+                            {e['patient_id']: patients.get(e['patient_id'], {}) for e in shard_encounters.values()},
+                            cases_dir, time_steps)
+                for shard, shard_encounters in sorted(by_shard.items())
+            ]
+            cases, case_details, variables, medications = [], {}, {}, {}
+            for future in futures:
+                result = future.result()
+                cases.extend(result['cases'])
+                case_details.update(result['case_details'])
+                variables.update(result['variables'])
+                medications.update(result['medications'])
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    cases.sort(key=lambda case: (case['min_t'], case['case_id']))
+    _merge_case_index(study_dir, cases, case_details)
+    _merge_details(study_dir, variables, medications)
+    return {'cases': len(cases), 'rows': rows}
@@ -0,0 +1,268 @@
+"""
+Synthetic studies for benchmarks and scale tests.
+
+`generate_study` writes a complete, valid study folder (the same files as
+`resources/demo_study`: `case_details.json`, `user_details.json`,
+`variable_details.json`, `med_details.json`, `data_layout.json`, and
+`cases_all/<case_id>/*.json`) whose size is set by a few parameters: number
+of cases and users, observation variables and medications per case, points
+per series, and notes per case.
+
+Every value of a case is drawn from a `random.Random` seeded with
+`(seed, case index)`, so a study is byte-for-byte reproducible for a given
+seed and parameters regardless of how many worker processes wrote it. Cases
+are written by a process pool in contiguous index ranges, and each case's
+series are streamed to disk one variable at a time, so memory use does not
+grow with points per case and multi-gigabyte studies can be generated on a
+laptop. `manage.py generate_study` is the command-line entry point.
+"""
+
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+#: First admission time (2012-01-01T00:00:00Z) in JavaScript milliseconds.
+BASE_TIME = 1325376000000.0
+
+PHYSIO_GROUPS = ['Vitals', 'Ventilator']
+LAB_GROUPS = ['Basic_Chemistry', 'CBC', 'Blood_Gases', 'Coags', 'Other']
+MED_ROUTES = ['IV', 'By_Mouth', 'subQ']
+NOTE_GROUPS = ['Progress_Note', 'HandP', 'RAD']
+
+#: Words synthetic note text is drawn from.
+NOTE_WORDS = ('patient', 'stable', 'afebrile', 'pain', 'improved', 'continue', 'plan', 'monitor',
+              'overnight', 'labs', 'reviewed', 'no', 'acute', 'distress', 'tolerating', 'diet')
+
+
+def variable_id(index: int) -> str:
+    return f"VAR{index}"
+
+
+def medication_id(index: int) -> str:
+    return f"medidx{index}"
+
+
+def case_id(index: int) -> str:
+    return f"{10000000 + index}"
+
+
+def admit_time(index: int) -> float:
+    """Admission time of case `index` (one hour apart)."""
+    return BASE_TIME + index * 3600 * 1000
+
+
+def _write_json(data, path: str) -> None:
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+
+def _assignments(case_ids: List[str], users: int, cases_per_user: Optional[int],
+                 completed_fraction: float) -> Dict[str, Dict]:
+    """Give each user a rotating slice of `cases_per_user` cases (all by default)."""
+    per_user = len(case_ids) if cases_per_user is None else min(cases_per_user, len(case_ids))
+    details = {}
+    for u in range(users):
+        start = (u * per_user) % len(case_ids) if case_ids else 0
+        assigned = (case_ids[start:] + case_ids[:start])[:per_user]
+        details[f"user{u}"] = {
+            'last_accessed': None,
+            'cases_assigned': assigned,
+            'cases_completed': assigned[:int(len(assigned) * completed_fraction)],
+        }
+    return details
+
+
+def study_files(cases: int, users: int, variables: int, medications: int, stay_days: int = 4,
+                cases_per_user: Optional[int] = None, completed_fraction: float = 0.0) -> Dict[str, Dict]:
+    """Return the study-level JSON documents, keyed by file name."""
+    case_ids = [case_id(i) for i in range(cases)]
+    groups = PHYSIO_GROUPS + LAB_GROUPS
+    return {
+        'data_layout.json': {
+            'title_bar': ['id', 'age', 'sex', 'race'],
+            'physio_panel_groups': PHYSIO_GROUPS,
+            'med_panel_groups': MED_ROUTES,
+            'lab_panel_groups': LAB_GROUPS,
+            'note_panel_groups': NOTE_GROUPS,
+        },
+        'variable_details.json': {
+            variable_id(i): {
+                'display_group': groups[i % len(groups)],
+                'display_name': f"Variable {i}",
+                'dflt_normal_ranges': [40.0, 60.0],
+                'dflt_y_axis_ranges': [0, 0],
+                'original_name': f"Variable {i}",
+                'units': 'u',
+            } for i in range(variables)
+        },
+        'med_details.json': {
+            medication_id(i): {
+                'med_route': MED_ROUTES[i % len(MED_ROUTES)],
+                'display_name': f"Medication {i}",
+                'original_name': f"Medication {i}",
+            } for i in range(medications)
+        },
+        'case_details.json': {
+            cid: [
+                {'min_t': admit_time(i), 'max_t': admit_time(i) + (stay_days - 1) * DAY_MS,
+                 'check_boxes': 0, 'instruction_set': 'familiar'},
+                {'min_t': admit_time(i), 'max_t': admit_time(i) + stay_days * DAY_MS,
+                 'check_boxes': 1, 'instruction_set': 'select'},
+            ] for i, cid in enumerate(case_ids)
+        },
+        'user_details.json': _assignments(case_ids, users, cases_per_user, completed_fraction),
+    }
+
+
+def _series(rng: random.Random, start: float, span: float, points: int, low: float, high: float) -> List[list]:
+    times = sorted(start + rng.random() * span for _ in range(points))
+    return [[float(int(t // 60000) * 60000), round(rng.uniform(low, high), 1)] for t in times]
+
+
+def _observations(rng: random.Random, start: float, span: float, variables: int,
+                  points: int) -> Iterator[Tuple[str, Dict]]:
+    for v in range(variables):
+        data = _series(rng, start, span, points, 30.0, 70.0)
+        values = [p[1] for p in data]
+        yield variable_id(v), {
+            'display_text': f"Variable {v}",
+            'numeric_lab_data': [{
+                'zones': [{'color': '#000000'}],
+                'marker': {'symbol': 'circle'},
+                'data': data,
+                'name': 'numeric_values',
+            }],
+            'discrete_lab_data': [],
+            'y_axis_ranges': [min(values), max(values)] if values else [0, 0],
+            'units': 'u',
+            'discrete_nominal_to_yIndex': [],
+        }
+
+
+def _medications(rng: random.Random, start: float, span: float, medications: int,
+                 points: int) -> Iterator[Tuple[str, Dict]]:
+    for m in range(medications):
+        data = _series(rng, start, span, max(1, points // 4), 1.0, 100.0)
+        values = [p[1] for p in data]
+        yield medication_id(m), {
+            'display_text': f"Medication {m}",
+            'med_data': [{
+                'color': '#000000',
+                'marker': {'symbol': 'circle'},
+                'data': data,
+                'name': 'medication_data',
+            }],
+            'y_axis_ranges': [min(values), max(values)],
+        }
+
+
+def _notes(rng: random.Random, start: float, span: float, notes: int, note_words: int) -> Dict[str, List[Dict]]:
+    note_panel_data: Dict[str, List[Dict]] = {}
+    for upk in range(notes):
+        group = NOTE_GROUPS[upk % len(NOTE_GROUPS)]
+        js_time = float(int((start + rng.random() * span) // 60000) * 60000)
+        note_panel_data.setdefault(group, []).append({
+            'date': '01/01',
+            'text': ' '.join(rng.choice(NOTE_WORDS) for _ in range(note_words)),
+            'js_time': js_time,
+            'upk': upk,
+            'type': group,
+        })
+    return note_panel_data
+
+
+def _stream_json_object(entries: Iterator[Tuple[str, Dict]], path: str) -> int:
+    """Write `{key: value, ...}` one entry at a time; returns bytes written."""
+    written = 0
+    with open(path, 'w') as file:
+        written += file.write('{')
+        for position, (key, value) in enumerate(entries):
+            written += file.write(f"{', ' if position else ''}{json.dumps(key)}: {json.dumps(value)}")
+        written += file.write('}')
+    return written
+
+
+def write_case(study_dir: str, index: int, seed: int = 0, variables: int = 20, medications: int = 5,
+               points: int = 50, notes: int = 6, note_words: int = 60, stay_days: int = 4) -> int:
+    """Write `cases_all/<case_id>/` for case `index`; returns bytes written."""
+    case_dir = os.path.join(study_dir, 'cases_all', case_id(index))
+    os.makedirs(case_dir, exist_ok=True)
+    rng = random.Random(f"{seed}:{index}")
+    start, span = admit_time(index), stay_days * DAY_MS
+    written = _stream_json_object(_observations(rng, start, span, variables, points),
+                                  os.path.join(case_dir, 'observations.json'))
+    written += _stream_json_object(_medications(rng, start, span, medications, points),
+                                   os.path.join(case_dir, 'medications.json'))
+    for filename, data in (
+        ('note_panel_data.json', _notes(rng, start, span, notes, note_words)),
+        ('demographics.json', {'age': rng.randint(18, 90), 'sex': rng.choice('MF'),
+                               'race': 'n/a **SYNTHETIC DATA**', 'id': int(case_id(index))}),
+    ):
+        path = os.path.join(case_dir, filename)
+        _write_json(data, path)
+        written += os.path.getsize(path)
+    return written
+
+
+def _write_cases(study_dir: str, indexes: range, case_options: Dict) -> int:
+    return sum(write_case(study_dir, index, **case_options) for index in indexes)
+
+
+def estimate_case_bytes(variables: int, medications: int, points: int, notes: int, note_words: int = 60) -> int:
+    """Rough on-disk size of one case (about 24 bytes per point)."""
+    return (variables * (points * 24 + 260) + medications * (max(1, points // 4) * 24 + 200)
+            + notes * (note_words * 8 + 90) + 100)
+
+
+def generate_study(study_dir: str, cases: int = 10, users: int = 5, variables: int = 20,
+                   medications: int = 5, points: int = 50, notes: int = 6, note_words: int = 60,
+                   seed: int = 0, workers: int = 1, cases_per_user: Optional[int] = None,
+                   completed_fraction: float = 0.0, stay_days: int = 4, log=None) -> Dict:
+    """Write a synthetic study to `study_dir`; returns its parameters and size.
+
+    Parameters
+    ----------
+    cases, users: int
+        Number of case folders and of users (each assigned `cases_per_user`
+        cases, all by default, with the first `completed_fraction` of them
+        already completed).
+    variables, medications: int
+        Observation variables and medications in every case.
+    points: int
+        Points per observation series (medications get a quarter as many).
+    notes, note_words: int
+        Notes per case and words per note.
+    seed: int
+        Random seed; the same seed and parameters give identical files.
+    workers: int
+        Processes writing case folders; 1 writes them in this process.
+    """
+    log = log or (lambda message: None)
+    os.makedirs(os.path.join(study_dir, 'cases_all'), exist_ok=True)
+    for filename, data in study_files(cases, users, variables, medications, stay_days,
+                                      cases_per_user, completed_fraction).items():
+        _write_json(data, os.path.join(study_dir, filename))
+
+    case_options = {'seed': seed, 'variables': variables, 'medications': medications, 'points': points,
+                    'notes': notes, 'note_words': note_words, 'stay_days': stay_days}
+    workers = max(1, min(workers, cases))
+    if workers == 1:
+        total = _write_cases(study_dir, range(cases), case_options)
+    else:
+        # Several ranges per worker keep the pool busy when cases differ in cost.
+        step = max(1, cases // (workers * 4))
+        total = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_write_cases, study_dir, range(start, min(start + step, cases)), case_options)
+                       for start in range(0, cases, step)]
+            report_every = -(-len(futures) // 10)
+            for done, future in enumerate(futures, 1):
+                total += future.result()
+                if done % report_every == 0 or done == len(futures):
+                    log(f"Wrote {min(done * step, cases)}/{cases} cases")
+    return {'cases': cases, 'users': users, 'variables': variables, 'medications': medications,
+            'points': points, 'notes': notes, 'seed': seed, 'case_bytes': total}
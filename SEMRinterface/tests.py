@@ -0,0 +1,481 @@
+import datetime
+import errno
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from . import jsoncodec, manifest, services, timeseries
+from .cache import BoundedLRUCache, FileCache
+from .filelock import flocked
+from .journal import JOURNAL_FILENAME, SNAPSHOT_FILENAME, AssignmentJournal
+from .results_writer import ResultsWriter, TransientWriteError
+from .case_store import variable_index_path
+from .series import compact_series
+from .storage import JsonStorageBackend
+from .storage_sqlite import SQLiteStorageBackend, StudyExistsError, import_json_study
+from .variable_index import (
+    StaleIndexError, build_variable_index, case_variable_stats, get_variable_index, write_variable_index,
+)
+from .views import JsonResponse
+
+
+class TempDirMixin:
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp(prefix='semr-test-')
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+
+class CacheTests(TempDirMixin, SimpleTestCase):
+    def test_lru_evicts_by_weight(self):
+        cache = BoundedLRUCache(10)
+        cache.put('a', 1, 4)
+        cache.put('b', 2, 4)
+        cache.get('a')
+        cache.put('c', 3, 4)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertFalse(cache.put('d', 4, 11))
+        self.assertLessEqual(cache.current_bytes, 10)
+
+    def test_file_cache_invalidates_on_change(self):
+        path = self.write('a.json', b'{"v": 1}')
+        cache = FileCache(1024)
+        loads = []
+
+        def loader(p):
+            loads.append(p)
+            with open(p) as file:
+                return file.read()
+
+        self.assertEqual(cache.get(path, loader), '{"v": 1}')
+        self.assertEqual(cache.get(path, loader), '{"v": 1}')
+        self.assertEqual(len(loads), 1)
+        self.write('a.json', b'{"v": 22}')
+        self.assertEqual(cache.get(path, loader), '{"v": 22}')
+        self.assertEqual(len(loads), 2)
+        os.remove(path)
+        self.assertIsNone(cache.get(path, loader))
+
+    def test_save_json_does_not_cache_callers_object(self):
+        path = os.path.join(self.tmp, 'study', 'case_selections.json')
+        data = {'u1': ['c1']}
+        services.save_json(data, path)
+        data['u1'].append('c2')
+        self.assertEqual(services.load_json(path), {'u1': ['c1']})
+
+
+class JsonCodecTests(SimpleTestCase):
+    def test_django_types_and_response(self):
+        value = {'at': datetime.date(2024, 1, 2), 'series': compact_series({'name': 'HR', 'data': [[1, 2]]})}
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps(value)),
+                         {'at': '2024-01-02', 'series': {'name': 'HR', 'data': [[1, 2]]}})
+        response = JsonResponse({'status': 'success'}, status=201)
+        self.assertEqual((response.status_code, response['Content-Type']), (201, 'application/json'))
+        self.assertEqual(jsoncodec.loads(response.content), {'status': 'success'})
+
+    def test_service_layer_imports_without_django(self):
+        script = (
+            "import sys\n"
+            "class Block:\n"
+            "    def find_spec(self, name, path, target=None):\n"
+            "        if name.split('.')[0] in ('django', 'asgiref'):\n"
+            "            raise ImportError(name)\n"
+            "sys.meta_path.insert(0, Block())\n"
+            "import SEMRinterface.services, SEMRinterface.jsoncodec as codec\n"
+            "assert codec.loads(codec.dumps({'a': [1]})) == {'a': [1]}\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {k: v for k, v in os.environ.items() if k != 'DJANGO_SETTINGS_MODULE'}
+        result = subprocess.run([sys.executable, '-c', script], cwd=root, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class LTTBTests(SimpleTestCase):
+    def series(self, n, seed=0):
+        rng = random.Random(seed)
+        times = [1000.0 * i for i in range(n)]
+        values = [math.sin(i / 7.0) * 10 + rng.gauss(0, 1) for i in range(n)]
+        return times, values
+
+    def test_short_series_kept(self):
+        times, values = self.series(10)
+        self.assertEqual(timeseries._lttb_indices(times, values, 10), list(range(10)))
+        self.assertEqual(timeseries._lttb_indices(times, values, 2), list(range(10)))
+
+    def test_endpoints_and_one_pick_per_bucket(self):
+        times, values = self.series(1000)
+        indices = timeseries._lttb_indices(times, values, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertEqual(indices, sorted(set(indices)))
+
+    @skipIf(timeseries.np is None, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        rng = random.Random(1)
+        for width in (1, 3, timeseries.LTTB_PAIRWISE_MAX_WIDTH + 1, 40):
+            for _ in range(20):
+                n_out = rng.randint(3, 60)
+                times, values = self.series(n_out * width + rng.randint(0, width), seed=rng.random())
+                if len(times) <= n_out:
+                    continue
+                self.assertEqual(timeseries._lttb_numpy(times, values, n_out),
+                                 timeseries._lttb_python(times, values, n_out))
+
+    def test_downsample_keeps_out_of_range_points(self):
+        times, values = self.series(500)
+        values[123], values[321] = 99.0, -99.0
+        series = {'name': 'HR', 'zones': [{'value': -50}, {'value': 50}, {}],
+                  'data': [[t, v] for t, v in zip(times, values)]}
+        reduced = timeseries.downsample_series(series, 40)
+        kept = [p[0] for p in reduced['data']]
+        self.assertIn(times[123], kept)
+        self.assertIn(times[321], kept)
+        self.assertEqual((kept[0], kept[-1]), (times[0], times[-1]))
+        self.assertLessEqual(len(kept), 40)
+        self.assertEqual(series['data'][0], [times[0], values[0]])
+
+    def test_downsample_compact_series(self):
+        times, values = self.series(300)
+        compact = compact_series({'name': 'HR', 'data': [[t, v] for t, v in zip(times, values)]})
+        plain = {'name': 'HR', 'data': [[t, v] for t, v in zip(times, values)]}
+        self.assertEqual(timeseries.downsample_series(compact, 30).to_wire(),
+                         timeseries.downsample_series(plain, 30))
+
+
+class JournalTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write(SNAPSHOT_FILENAME, jsoncodec.dumps({
+            'u1': {'name': 'One', 'cases_assigned': ['c1', 'c2'], 'cases_completed': []},
+            'u2': {'name': 'Two', 'cases_assigned': ['c1'], 'cases_completed': ['c1']},
+        }))
+
+    def journal(self, **options):
+        options.setdefault('fsync_interval', 0)
+        return AssignmentJournal(self.tmp, **options)
+
+    def journal_lines(self):
+        with open(os.path.join(self.tmp, JOURNAL_FILENAME), 'rb') as file:
+            return file.read().splitlines()
+
+    def test_append_is_replayed_by_other_readers(self):
+        writer, reader = self.journal(), self.journal()
+        self.assertEqual(reader.read()['u1']['cases_completed'], [])
+        self.assertTrue(writer.append({'op': 'complete', 'user_id': 'u1', 'case_id': 'c1'}))
+        self.assertTrue(writer.append({'op': 'update', 'user_id': 'u2', 'details': {'name': 'Second'}}))
+        state = reader.read()
+        self.assertEqual(state['u1']['cases_completed'], ['c1'])
+        self.assertEqual(state['u2']['name'], 'Second')
+        self.assertEqual(len(self.journal_lines()), 2)
+        with open(os.path.join(self.tmp, SNAPSHOT_FILENAME), 'rb') as file:
+            self.assertEqual(jsoncodec.loads(file.read())['u1']['cases_completed'], [])
+
+    def test_unknown_user_and_unchanged_reset_are_not_written(self):
+        journal = self.journal()
+        self.assertFalse(journal.append({'op': 'complete', 'user_id': 'nobody', 'case_id': 'c1'}))
+        self.assertFalse(journal.append({'op': 'reset', 'user_id': 'u1', 'case_id': 'c1'}, require_change=True))
+        self.assertTrue(journal.append({'op': 'reset', 'user_id': 'u2', 'case_id': 'c1'}, require_change=True))
+        self.assertEqual(len(self.journal_lines()), 1)
+
+    def test_partial_and_corrupt_lines_are_skipped(self):
+        with open(os.path.join(self.tmp, JOURNAL_FILENAME), 'wb') as file:
+            file.write(b'not json\n{"op": "complete", "user_id": "u1", "case_id": "c2"}\n{"op": "comp')
+        with self.assertLogs('SEMRinterface.journal', 'WARNING'):
+            state = self.journal().read()
+        self.assertEqual(state['u1']['cases_completed'], ['c2'])
+
+    def test_compaction_folds_journal_into_snapshot(self):
+        journal = self.journal(compact_events=3)
+        reader = self.journal()
+        reader.read()
+        for case_id in ('c1', 'c2'):
+            journal.append({'op': 'complete', 'user_id': 'u1', 'case_id': case_id})
+        journal.append({'op': 'reset', 'user_id': 'u2', 'case_id': 'c1'})
+        self.assertEqual(self.journal_lines(), [])
+        with open(os.path.join(self.tmp, SNAPSHOT_FILENAME), 'rb') as file:
+            snapshot = jsoncodec.loads(file.read())
+        self.assertEqual(snapshot['u1']['cases_completed'], ['c1', 'c2'])
+        self.assertEqual(snapshot['u2']['cases_completed'], [])
+        journal.append({'op': 'reset', 'user_id': 'u1', 'case_id': 'c1'})
+        self.assertEqual(reader.read()['u1']['cases_completed'], ['c2'])
+        self.assertEqual(self.journal().read(), reader.read())
+
+    def test_read_returns_a_snapshot(self):
+        journal = self.journal()
+        before = journal.read()
+        completed = before['u1']['cases_completed']
+        self.assertIs(journal.read(), before)
+        details = {'cases_assigned': ['c1', 'c2', 'c3']}
+        journal.append({'op': 'complete', 'user_id': 'u1', 'case_id': 'c1'})
+        journal.append({'op': 'update', 'user_id': 'u1', 'details': details})
+        details['cases_assigned'].append('c4')
+        self.assertEqual(completed, [])
+        after = journal.read()
+        self.assertIsNot(after, before)
+        self.assertEqual(after['u1']['cases_completed'], ['c1'])
+        self.assertEqual(after['u1']['cases_assigned'], ['c1', 'c2', 'c3'])
+
+    def test_missing_snapshot(self):
+        os.remove(os.path.join(self.tmp, SNAPSHOT_FILENAME))
+        journal = self.journal()
+        self.assertIsNone(journal.read())
+        self.assertFalse(journal.append({'op': 'complete', 'user_id': 'u1', 'case_id': 'c1'}))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, JOURNAL_FILENAME)))
+
+
+class ResultsWriterTests(TempDirMixin, SimpleTestCase):
+    def writer(self, **options):
+        options.setdefault('flush_interval', 60)
+        options.setdefault('retry_initial', 0)
+        writer = ResultsWriter(os.path.join(self.tmp, 'stored_results.txt'), **options)
+        self.addCleanup(writer.close)
+        return writer
+
+    def stored(self):
+        with open(os.path.join(self.tmp, 'stored_results.txt'), 'rb') as file:
+            return [jsoncodec.loads(line) for line in file.read().splitlines()]
+
+    def test_missing_directory_is_rejected(self):
+        writer = ResultsWriter(os.path.join(self.tmp, 'missing', 'stored_results.txt'))
+        self.assertFalse(writer.submit({'n': 1}))
+        self.assertIsNone(writer._thread)
+
+    def test_group_writes_on_flush_and_close(self):
+        writer = self.writer()
+        for n in range(3):
+            self.assertTrue(writer.submit({'n': n}))
+        self.assertTrue(writer.flush())
+        writer.submit({'n': 3})
+        writer.close()
+        self.assertEqual(self.stored(), [{'n': n} for n in range(4)])
+
+    def test_transient_failure_is_retried_without_duplicates(self):
+        writer = self.writer()
+        append = writer.sink
+        failures = [OSError(errno.ENOSPC, 'No space left on device')]
+
+        def sink(batch):
+            if failures:
+                raise failures.pop()
+            append(batch)
+
+        writer.sink = sink
+        writer.submit({'n': 0})
+        writer.submit({'n': 1})
+        with self.assertLogs('SEMRinterface.results_writer', 'WARNING'):
+            self.assertFalse(writer.flush())
+        self.assertEqual(len(writer._pending), 2)
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.stored(), [{'n': 0}, {'n': 1}])
+        self.assertEqual(writer.dropped, 0)
+
+    def test_partial_file_append_is_truncated(self):
+        writer = self.writer()
+        writer.submit({'n': 0})
+        writer.flush()
+        fsync = os.fsync
+        calls = []
+
+        def failing_fsync(fd):
+            calls.append(fd)
+            if len(calls) == 1:
+                raise OSError(errno.EIO, 'I/O error')
+            fsync(fd)
+
+        writer.submit({'n': 1})
+        os.fsync = failing_fsync
+        try:
+            with self.assertLogs('SEMRinterface.results_writer', 'WARNING'):
+                self.assertFalse(writer.flush())
+            self.assertEqual(self.stored(), [{'n': 0}])
+            self.assertTrue(writer.flush())
+        finally:
+            os.fsync = fsync
+        self.assertEqual(self.stored(), [{'n': 0}, {'n': 1}])
+
+    def test_bad_record_is_dead_lettered(self):
+        dead = []
+        writer = self.writer(dead_letter=lambda records, exc: dead.extend(records))
+        writer.submit({'n': 0})
+        writer.submit({'n': object()})
+        writer.submit({'n': 2})
+        self.assertFalse(writer.flush())
+        self.assertEqual(self.stored(), [{'n': 0}, {'n': 2}])
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(writer.dropped, 1)
+        self.assertEqual(writer._pending, [])
+
+    def test_pending_is_capped_and_drained_on_close(self):
+        dead = []
+
+        def sink(batch):
+            raise TransientWriteError('database is locked')
+
+        writer = ResultsWriter('results#test', sink=sink, max_batch=2, max_pending=3, flush_interval=60,
+                               retry_initial=60, dead_letter=lambda records, exc: dead.extend(records))
+        with self.assertLogs('SEMRinterface.results_writer', 'WARNING') as logs:
+            self.assertTrue(all(writer.submit({'n': n}) for n in range(3)))
+            self.assertFalse(writer.submit({'n': 3}))
+            writer.close()
+        self.assertIn('is full', '\n'.join(logs.output))
+        self.assertEqual(dead, [{'n': n} for n in range(3)])
+
+
+class ImportStorageTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write('s1/' + SNAPSHOT_FILENAME, jsoncodec.dumps({
+            'u1': {'name': 'One', 'cases_assigned': ['c1'], 'cases_completed': []},
+        }))
+        self.write('s1/stored_results.txt', b'{"user_id": "u1", "case_id": "c1", "selected_items": ["a"]}\n')
+        self.source = JsonStorageBackend(self.tmp)
+        self.target = SQLiteStorageBackend(os.path.join(self.tmp, 'semr.sqlite3'), {'durability': 'record'})
+
+    def test_existing_rows_in_any_table_block_import(self):
+        self.target.save_selected_items('s1', 'u9', 'c1', ['b'])
+        self.assertIsNone(self.target.get_user_details('s1'))
+        self.assertTrue(self.target.has_study('s1'))
+        with self.assertRaises(StudyExistsError):
+            import_json_study(self.source, self.target, 's1')
+        self.assertEqual(len(self.target.read_results('s1')[0]), 1)
+
+    def test_replace_runs_in_one_transaction(self):
+        import_json_study(self.source, self.target, 's1')
+        self.write('s1/stored_results.txt', b'{"user_id": "u1", "case_id": "c1", "selected_items": ["a"]}\n' * 2)
+        counts = import_json_study(self.source, self.target, 's1', replace=True)
+        self.assertEqual(counts['results'], 2)
+        self.assertEqual(len(self.target.read_results('s1')[0]), 2)
+
+        self.source.get_user_details = lambda study_id: {'u1': {'cases_assigned': object()}}
+        with self.assertRaises(TypeError):
+            import_json_study(self.source, self.target, 's1', replace=True)
+        self.assertEqual(len(self.target.read_results('s1')[0]), 2)
+        self.assertEqual(self.target.get_user_details('s1')['u1']['cases_assigned'], ['c1'])
+
+
+class ManifestTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        for case_id in ('c1', 'c2'):
+            self.write(f's1/cases_all/{case_id}/observations.json', jsoncodec.dumps({
+                'HR': {'numeric_lab_data': [{'name': 'HR', 'data': [[1000, 60], [2000, 70]]}]}}))
+
+    def test_index_is_not_built_on_read(self):
+        index = manifest.load_study_index(self.tmp, lambda path: None, refresh_interval=0)
+        self.assertEqual(index['studies'], {})
+        self.assertIsNone(index['built_at'])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 's1', manifest.MANIFEST_FILENAME)))
+
+    def test_only_changed_cases_are_reread(self):
+        manifest.refresh_manifests(self.tmp)
+        os.utime(os.path.join(self.tmp, 's1', 'cases_all', 'c2'), ns=(1, 1))
+        summarized = []
+        summarize_case = manifest.summarize_case
+
+        def spy(case_dir):
+            summarized.append(os.path.basename(case_dir))
+            return summarize_case(case_dir)
+
+        manifest.summarize_case = spy
+        try:
+            index = manifest.refresh_manifests(self.tmp)
+        finally:
+            manifest.summarize_case = summarize_case
+        self.assertEqual(summarized, ['c2'])
+        self.assertEqual(index['studies']['s1']['total_points'], 4)
+
+    def test_refresh_is_skipped_while_another_process_refreshes(self):
+        refresher = manifest.ManifestRefresher(self.tmp, 0)
+        with open(os.path.join(self.tmp, manifest.REFRESH_LOCK_FILENAME), 'ab') as lock:
+            with flocked(lock):
+                self.assertFalse(refresher.refresh())
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, manifest.INDEX_FILENAME)))
+        self.assertTrue(refresher.refresh())
+        with open(os.path.join(self.tmp, manifest.INDEX_FILENAME), 'rb') as file:
+            self.assertIn('s1', jsoncodec.loads(file.read())['studies'])
+
+
+class VariableIndexTests(TempDirMixin, SimpleTestCase):
+    STEPS = [{'min_t': 0, 'max_t': 10}, {'min_t': 0, 'max_t': 100}]
+
+    def case(self, *points):
+        return {'observations': {'LAC': {'numeric_lab_data': [{'name': 'LAC', 'data': [list(p) for p in points]}]}},
+                'medications': {}}
+
+    def build(self, cases):
+        stats = {case_id: case_variable_stats(files, self.STEPS) for case_id, files in cases.items()}
+        document, points = build_variable_index('s1', stats, {case_id: self.STEPS for case_id in cases})
+        path = variable_index_path(os.path.join(self.tmp, 's1'))
+        write_variable_index(path, document, points)
+        return path
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.build({
+            'c1': self.case((1, 0.5), (5, 1.0), (50, 9.0)),   # straddles 2..4 with no value inside
+            'c2': self.case((2, 3.0), (60, 3.5)),             # inside 2..4
+            'c3': self.case((70, 2.5), (3, 1.0), (80, 8.0)),  # straddles, 2.5 inside but only in step 1
+        })
+
+    def cases(self, *args, **kwargs):
+        index = get_variable_index(self.path, services.load_json)
+        rows, checked = index.query('LAC', *args, **kwargs)
+        return [row['case_id'] for row in rows], checked
+
+    def test_value_ranges(self):
+        self.assertEqual(self.cases(2, 4), (['c2', 'c3'], 2))
+        self.assertEqual(self.cases(None, 1.0), (['c1', 'c3'], 0))
+        self.assertEqual(self.cases(8.5, None), (['c1'], 0))
+        self.assertEqual(self.cases(), (['c1', 'c2', 'c3'], 0))
+        self.assertEqual(self.cases(20, 30), ([], 0))
+        index = get_variable_index(self.path, services.load_json)
+        self.assertEqual(index.query('missing', 0, 1), ([], 0))
+        self.assertEqual(index.variables()['LAC']['case_count'], 3)
+
+    def test_time_step_windows(self):
+        self.assertEqual(self.cases(2, 4, time_step=0), (['c2'], 0))
+        self.assertEqual(self.cases(2, 4, time_step=1), (['c2', 'c3'], 2))
+        self.assertEqual(self.cases(None, None, time_step=5), ([], 0))
+        index = get_variable_index(self.path, services.load_json)
+        row = index.query('LAC', 0, 1, time_step=0)[0][0]
+        self.assertEqual((row['case_id'], row['count'], row['max_v']), ('c1', 2, 1.0))
+
+    def test_replaced_index_is_closed(self):
+        old = get_variable_index(self.path, services.load_json)
+        self.assertIs(get_variable_index(self.path, services.load_json), old)
+        self.build({'c4': self.case((1, 3.0))})
+        new = get_variable_index(self.path, services.load_json)
+        self.assertIsNot(new, old)
+        self.assertTrue(old._mapped.closed)
+        with self.assertRaises(StaleIndexError):
+            old.query('LAC', 2, 4)
+        self.assertEqual(self.cases(2, 4), (['c4'], 0))
+        self.assertEqual(services.query_variable_index('s1', 'LAC', 2, 4, resources_dir=self.tmp)['case_count'], 1)
+
+    def test_close_waits_for_running_query(self):
+        index = get_variable_index(self.path, services.load_json)
+        has_value = index._has_value
+
+        def closing_has_value(*args):
+            index.close()
+            self.assertFalse(index._mapped.closed)
+            return has_value(*args)
+
+        index._has_value = closing_has_value
+        self.assertEqual([row['case_id'] for row in index.query('LAC', 2, 4)[0]], ['c2', 'c3'])
+        self.assertTrue(index._mapped.closed)
@@ -0,0 +1,389 @@
+"""
+Time-series helpers for case payloads.
+
+Case files store each observation and medication variable as a dict whose
+`numeric_lab_data`, `discrete_lab_data`, or `med_data` entry is a list of
+Highcharts series. Every series carries a `data` list of `[t, v]` pairs
+sorted by `t` (JavaScript epoch milliseconds), and may carry per-point
+lists such as `med_reason_tooltips` that run parallel to `data`.
+
+The helpers here never mutate their inputs: series dicts are shallow-copied
+and only the per-point lists are replaced, so they are safe to apply to
+objects shared through the service-layer cache. They accept the compact
+`CompactSeries`/`CompactVariable` forms the cache holds (see
+`SEMRinterface.series`) as well as plain dicts, and slice compact series
+without materializing their points.
+
+Downsampling uses Largest-Triangle-Three-Buckets (LTTB). When NumPy is
+installed, every series longer than its target is reduced with the buckets
+laid out as rows of a 2-D array, so each bucket's triangle areas and their
+argmax are a single vectorized row operation; otherwise an equivalent
+pure-Python implementation runs.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .series import PARALLEL_POINT_KEYS, SERIES_KEYS, CompactSeries
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+#: Series keys holding continuous values that may be downsampled.
+DOWNSAMPLE_KEYS = ('numeric_lab_data', 'med_data')
+
+#: Smallest `max_points` accepted by `downsample_*` (first, one bucket, last).
+MIN_DOWNSAMPLE_POINTS = 3
+
+#: Widest LTTB bucket for which the NumPy path scores every pair of points
+#: in neighbouring buckets at once; wider buckets are scored row by row.
+LTTB_PAIRWISE_MAX_WIDTH = 8
+
+#: Cells of the pairwise area array scored per chunk by the NumPy path.
+LTTB_PAIRWISE_CELLS = 1 << 16
+
+
+def _point_time(point: Sequence) -> float:
+    return point[0]
+
+
+def window_bounds(points: Sequence[Sequence], min_t: float, max_t: float) -> tuple:
+    """Return `(lo, hi)` such that `points[lo:hi]` lies in `[min_t, max_t]`.
+
+    Uses binary search, so `points` must be sorted by timestamp.
+    """
+    lo = bisect_left(points, min_t, key=_point_time)
+    hi = bisect_right(points, max_t, lo=lo, key=_point_time)
+    return lo, hi
+
+
+def series_bounds(series: Dict, lo_t: float, hi_t: float, include_lo: bool = True) -> tuple:
+    """Return `(lo, hi)` such that the points `[lo:hi]` of `series` lie in `[lo_t, hi_t]`.
+
+    With `include_lo` False the interval is `(lo_t, hi_t]`.
+    """
+    if isinstance(series, CompactSeries):
+        points, key = series.times, None
+    else:
+        points, key = series.get('data') or [], _point_time
+    lo = (bisect_left if include_lo else bisect_right)(points, lo_t, key=key)
+    hi = bisect_right(points, hi_t, lo=lo, key=key)
+    return lo, hi
+
+
+def slice_series(series: Dict, lo: int, hi: int) -> Dict:
+    """Return a copy of `series` with `data` (and parallel lists) cut to `[lo:hi]`."""
+    if isinstance(series, CompactSeries):
+        return series.slice(lo, hi)
+    data = series.get('data') or []
+    sliced = dict(series)
+    sliced['data'] = data[lo:hi]
+    for key in PARALLEL_POINT_KEYS:
+        values = series.get(key)
+        if isinstance(values, list) and len(values) == len(data):
+            sliced[key] = values[lo:hi]
+    return sliced
+
+
+def take_series(series: Dict, indices: Sequence[int]) -> Dict:
+    """Return a copy of `series` keeping only the points at sorted `indices`."""
+    if isinstance(series, CompactSeries):
+        return series.take(indices)
+    data = series.get('data') or []
+    taken = dict(series)
+    taken['data'] = [data[i] for i in indices]
+    for key in PARALLEL_POINT_KEYS:
+        values = series.get(key)
+        if isinstance(values, list) and len(values) == len(data):
+            taken[key] = [values[i] for i in indices]
+    return taken
+
+
+def window_series(series: Dict, min_t: float, max_t: float) -> Dict:
+    """Return a copy of `series` restricted to points within `[min_t, max_t]`."""
+    return slice_series(series, *series_bounds(series, min_t, max_t))
+
+
+def window_variables(variables: Dict, min_t: float, max_t: float) -> Dict:
+    """Apply `window_series` to every series of every variable in `variables`.
+
+    `variables` is the parsed content of `observations.json` or
+    `medications.json`. Variables are kept even when no points fall inside
+    the window so the client still knows they exist.
+    """
+    windowed = {}
+    for var_id, details in variables.items():
+        details = dict(details)
+        for key in SERIES_KEYS:
+            if key in details:
+                details[key] = [window_series(s, min_t, max_t) for s in details[key]]
+        windowed[var_id] = details
+    return windowed
+
+
+def _note_in_window(note: Dict, min_t: float, max_t: float) -> bool:
+    js_time = note.get('js_time')
+    return js_time is None or min_t <= js_time <= max_t
+
+
+def window_notes(notes, min_t: float, max_t: float):
+    """Filter `note_panel_data.json` content to notes with `js_time` in the window.
+
+    Accepts the grouped `{group: [note, ...]}` form as well as a flat list.
+    Notes without a `js_time` are kept.
+    """
+    if isinstance(notes, dict):
+        return {
+            group: [n for n in group_notes if _note_in_window(n, min_t, max_t)]
+            for group, group_notes in notes.items()
+        }
+    if isinstance(notes, list):
+        return [n for n in notes if _note_in_window(n, min_t, max_t)]
+    return notes
+
+
+def window_case_files(case_files: Dict, min_t: float, max_t: float) -> Dict:
+    """Return a copy of a `get_case_files` mapping trimmed to `[min_t, max_t]`."""
+    windowed = dict(case_files)
+    for key in ('observations', 'medications'):
+        if windowed.get(key):
+            windowed[key] = window_variables(windowed[key], min_t, max_t)
+    if windowed.get('notes'):
+        windowed['notes'] = window_notes(windowed['notes'], min_t, max_t)
+    return windowed
+
+
+def _has_points(details: Dict, lo_t: float, hi_t: float, include_lo: bool = True) -> bool:
+    """Return True if any series of a variable has a point within `series_bounds(..., lo_t, hi_t, include_lo)`."""
+    for key in SERIES_KEYS:
+        for series in details.get(key) or []:
+            lo, hi = series_bounds(series, lo_t, hi_t, include_lo)
+            if hi > lo:
+                return True
+    return False
+
+
+def delta_variables(variables: Dict, after_t: float, max_t: float) -> Dict:
+    """Return the variables with points in `(after_t, max_t]`, series cut to that interval.
+
+    Variables without new points are left out: the client already has them.
+    """
+    delta = {}
+    for var_id, details in variables.items():
+        if not _has_points(details, after_t, max_t, include_lo=False):
+            continue
+        details = dict(details)
+        for key in SERIES_KEYS:
+            if key in details:
+                details[key] = [slice_series(s, *series_bounds(s, after_t, max_t, include_lo=False))
+                                for s in details[key]]
+        delta[var_id] = details
+    return delta
+
+
+def delta_notes(notes, after_t: float, max_t: float):
+    """Filter notes to those with `js_time` in `(after_t, max_t]` (untimed notes were already sent)."""
+    def is_new(note: Dict) -> bool:
+        js_time = note.get('js_time')
+        return js_time is not None and after_t < js_time <= max_t
+
+    if isinstance(notes, dict):
+        return {group: [n for n in group_notes if is_new(n)] for group, group_notes in notes.items()}
+    if isinstance(notes, list):
+        return [n for n in notes if is_new(n)]
+    return notes
+
+
+def delta_case_files(case_files: Dict, min_t: float, after_t: float, max_t: float) -> Dict:
+    """Return what a `[min_t, max_t]` window adds to an earlier `[min_t, after_t]` one.
+
+    Observations and medications keep only variables with points in
+    `(after_t, max_t]`, trimmed to those points; notes keep those timed in
+    that interval, and demographics are dropped (None). `new_variables`
+    lists the returned variables that had no points in `[min_t, after_t]`.
+    """
+    delta = dict(case_files, demographics=None)
+    new_variables = []
+    for key in ('observations', 'medications'):
+        if delta.get(key):
+            delta[key] = delta_variables(delta[key], after_t, max_t)
+            new_variables.extend(var_id for var_id in delta[key]
+                                 if not _has_points(case_files[key][var_id], min_t, after_t))
+    if delta.get('notes'):
+        delta['notes'] = delta_notes(delta['notes'], after_t, max_t)
+    delta['new_variables'] = new_variables
+    return delta
+
+
+def select_case_variables(case_files: Dict, variables) -> Dict:
+    """Return a copy of a `get_case_files` mapping keeping only `variables`.
+
+    `variables` holds observation and medication keys; keys that a case
+    does not have are ignored. Demographics and notes are kept as is.
+    """
+    wanted = set(variables)
+    selected = dict(case_files)
+    for key in ('observations', 'medications'):
+        if selected.get(key):
+            selected[key] = {k: v for k, v in selected[key].items() if k in wanted}
+    return selected
+
+
+def normal_range(series: Dict) -> Optional[Tuple[float, float]]:
+    """Return the `(low, high)` normal range encoded in a series' Highcharts zones.
+
+    Lab series colour values with three zones: below the first zone's `value`
+    (low), up to the second zone's `value` (normal), and above (high). Series
+    without two zone thresholds have no range.
+    """
+    thresholds = [z['value'] for z in series.get('zones') or [] if 'value' in z]
+    if len(thresholds) < 2:
+        return None
+    return thresholds[0], thresholds[-1]
+
+
+def _lttb_python(times: Sequence[float], values: Sequence[float], n_out: int) -> List[int]:
+    n = len(times)
+    every = (n - 2) / (n_out - 2)
+    # Bucket i is `[bounds[i], bounds[i + 1])`; the last ends just before the last point.
+    bounds = [int(i * every) + 1 for i in range(n_out - 1)] + [n]
+    bounds[n_out - 2] = n - 1
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_start, next_end = end, bounds[i + 2]
+        span = next_end - next_start
+        avg_t = sum(times[next_start:next_end]) / span
+        avg_v = sum(values[next_start:next_end]) / span
+        at, av = times[a], values[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((at - avg_t) * (values[j] - av) - (at - times[j]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+def _lttb_numpy(times: Sequence[float], values: Sequence[float], n_out: int) -> List[int]:
+    t = np.asarray(times, dtype=np.float64)
+    v = np.asarray(values, dtype=np.float64)
+    n = len(t)
+    n_buckets = n_out - 2
+    bounds = (np.arange(n_out - 1) * ((n - 2) / n_buckets)).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    starts, ends = bounds[:-1], bounds[1:]
+    # Average point of each bucket (plus the last point), used as the third
+    # triangle vertex of the bucket before it.
+    counts = ends - starts
+    next_t = np.append(np.add.reduceat(t[:n - 1], starts) / counts, t[-1])[1:]
+    next_v = np.append(np.add.reduceat(v[:n - 1], starts) / counts, v[-1])[1:]
+    # One row per bucket; shorter buckets repeat their last point, which
+    # never wins over its first occurrence in `argmax`.
+    width = int(counts.max())
+    columns = np.minimum(starts[:, None] + np.arange(width), ends[:, None] - 1)
+    bucket_t, bucket_v = t[columns], v[columns]
+
+    if width > LTTB_PAIRWISE_MAX_WIDTH:
+        # Wide buckets: one vectorized row per bucket amortizes the call overhead.
+        next_t, next_v, starts = next_t.tolist(), next_v.tolist(), starts.tolist()
+        selected = [0]
+        a = 0
+        for i in range(n_buckets):
+            at, av = times[a], values[a]
+            areas = np.abs((at - next_t[i]) * (bucket_v[i] - av) - (at - bucket_t[i]) * (next_v[i] - av))
+            a = starts[i] + int(areas.argmax())
+            selected.append(a)
+        selected.append(n - 1)
+        return selected
+
+    # Narrow buckets: score every point of each bucket against every point
+    # of the previous bucket as its anchor, so that `best[i][c]` is bucket
+    # i's pick when bucket i - 1 picked its column c. Only following those
+    # picks from the first bucket is left sequential. Rows are scored in
+    # chunks to bound the size of the (rows, width, width) intermediates.
+    at, av = times[0], values[0]
+    first = np.abs((at - next_t[0]) * (bucket_v[0] - av) - (at - bucket_t[0]) * (next_v[0] - av)).argmax()
+    best = []
+    chunk = max(1, LTTB_PAIRWISE_CELLS // (width * width))
+    for lo in range(1, n_buckets, chunk):
+        hi = min(lo + chunk, n_buckets)
+        rows, prev = slice(lo, hi), slice(lo - 1, hi - 1)
+        at, av = bucket_t[prev, :, None], bucket_v[prev, :, None]
+        nt, nv = next_t[rows, None, None], next_v[rows, None, None]
+        areas = np.abs((at - nt) * (bucket_v[rows, None, :] - av) - (at - bucket_t[rows, None, :]) * (nv - av))
+        best.extend(areas.argmax(axis=2).tolist())
+    picks = [int(first)]
+    for row in best:
+        picks.append(row[picks[-1]])
+    return [0] + columns[np.arange(n_buckets), picks].tolist() + [n - 1]
+
+
+def lttb_indices(points: Sequence[Sequence], n_out: int) -> List[int]:
+    """Return the indices LTTB keeps when reducing `points` to `n_out` points.
+
+    The first and last points are always included. When `points` already has
+    `n_out` or fewer entries every index is returned.
+    """
+    return _lttb_indices([p[0] for p in points], [p[1] for p in points], n_out)
+
+
+def _lttb_indices(times: Sequence[float], values: Sequence[float], n_out: int) -> List[int]:
+    n = len(times)
+    if n <= n_out or n_out < MIN_DOWNSAMPLE_POINTS:
+        return list(range(n))
+    if np is not None:
+        return _lttb_numpy(times, values, n_out)
+    return _lttb_python(times, values, n_out)
+
+
+def downsample_series(series: Dict, max_points: int) -> Dict:
+    """Return a copy of `series` reduced to about `max_points` points with LTTB.
+
+    Points outside the series' normal range (see `normal_range`) are always
+    kept, and LTTB fills the remaining budget, so the result can exceed
+    `max_points` only when there are more out-of-range points than that.
+    """
+    if isinstance(series, CompactSeries):
+        times, values = series.times, series.values
+    else:
+        data = series.get('data') or []
+        times, values = [p[0] for p in data], [p[1] for p in data]
+    if len(times) <= max_points:
+        return series
+    keep = set()
+    bounds = normal_range(series)
+    if bounds is not None:
+        low, high = bounds
+        keep.update(i for i, v in enumerate(values) if v < low or v > high)
+    budget = max(MIN_DOWNSAMPLE_POINTS, max_points - len(keep))
+    keep.update(_lttb_indices(times, values, budget))
+    return take_series(series, sorted(keep))
+
+
+def downsample_variables(variables: Dict, max_points: int) -> Dict:
+    """Apply `downsample_series` to every continuous series in `variables`."""
+    downsampled = {}
+    for var_id, details in variables.items():
+        details = dict(details)
+        for key in DOWNSAMPLE_KEYS:
+            if key in details:
+                details[key] = [downsample_series(s, max_points) for s in details[key]]
+        downsampled[var_id] = details
+    return downsampled
+
+
+def downsample_case_files(case_files: Dict, max_points: int) -> Dict:
+    """Return a copy of a `get_case_files` mapping with dense series downsampled."""
+    if max_points < MIN_DOWNSAMPLE_POINTS:
+        raise ValueError(f"max_points must be at least {MIN_DOWNSAMPLE_POINTS}")
+    downsampled = dict(case_files)
+    for key in ('observations', 'medications'):
+        if downsampled.get(key):
+            downsampled[key] = downsample_variables(downsampled[key], max_points)
+    return downsampled
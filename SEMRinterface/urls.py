@@ -14,8 +14,16 @@ urlpatterns = [
     path('select/', views.unified_selection_view, name='unified_selection'),
     path('case_viewer/', views.case_viewer, name='case_viewer'),
     path('api/get_case_data/', views.get_case_data, name='get_case_data'),
+    path('api/get_case_data/batch/', views.get_case_data_batch, name='get_case_data_batch'),
+    path('api/async/get_case_data/', views.aget_case_data, name='aget_case_data'),
+    path('api/analytics/', views.results_analytics, name='results_analytics'),
+    path('api/variable_index/', views.variable_index, name='variable_index'),
     path('health/', health_check.health_check, name='health_check'),
     path('api/health/', health_check.health_check, name='api_health'),
+    path('health/live/', health_check.liveness, name='liveness'),
+    path('api/health/live/', health_check.liveness, name='api_liveness'),
+    path('api/health/ready/', health_check.health_check, name='api_readiness'),
+    path('api/metrics/', health_check.metrics, name='metrics'),
     path('api/info/', health_check.system_info, name='system_info'),
     path('api/quickstart/', health_check.quick_start, name='quick_start'),
 ]
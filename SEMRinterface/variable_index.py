@@ -0,0 +1,454 @@
+"""
+Per-study inverted index from variables to the cases that contain them.
+
+`manage.py compile_study` summarizes every observation and medication of
+each case it compiles (`case_variable_stats`) and writes the study's index
+next to the compiled stores, as two files:
+
+- `variable_index.json`, per variable its kind, totals, and columns
+  parallel to `case_ids`::
+
+    {"version": 1, "study_id": "...", "built_at": ..., "case_count": 2,
+     "time_steps": {"c1": [[min_t, max_t], ...], ...},
+     "variables": {"LAC": {"kind": "observation", "case_count": 2, "points": 9,
+                           "min_v": 0.8, "max_v": 6.1, "min_t": ..., "max_t": ...,
+                           "case_ids": ["c1", "c2"], "count": [4, 5],
+                           "min_v_by_case": [...], "max_v_by_case": [...],
+                           "min_t_by_case": [...], "max_t_by_case": [...],
+                           "offset_by_case": [0, 8],
+                           "steps": [[[2, 0.8, 1.9, t0, t1], null], ...]}}}
+
+  `steps` holds, for each case, one `[count, min_v, max_v, min_t, max_t]`
+  entry (or null when it has no points there) per time step of
+  `time_steps`, the case's `case_details.json` windows.
+- `variable_index.f64`, little-endian float64: for each case of each
+  variable, starting at its `offset_by_case`, the case's `count` values in
+  ascending order followed by their `count` timestamps.
+
+Only numeric points are indexed, and variables without any are left out.
+
+`VariableIndex` answers "which cases have a value of X in [lo, hi] (in time
+step k)". Cases are kept sorted by their maximum value, so a lower bound is
+a binary search, and a case certainly matches when its minimum or maximum
+lies in the range. Only cases whose values straddle the whole range are
+checked, by a binary search in their sorted values. The index reflects the
+case files as of the last `compile_study`.
+
+`get_variable_index` keeps one mapped index per file. When `compile_study`
+replaces the file, the previous index is closed: its mapping is released
+as soon as no query is using it, and later queries on it raise
+`StaleIndexError` so the caller can look the index up again.
+"""
+
+import mmap
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import jsoncodec
+from .series import CompactSeries, SERIES_KEYS
+
+INDEX_VERSION = 1
+
+#: Suffix of the sorted-points file, next to the index JSON.
+POINTS_SUFFIX = '.f64'
+
+#: Case-file key -> the `kind` recorded for its variables.
+VARIABLE_KINDS = {'observations': 'observation', 'medications': 'medication'}
+
+#: Per-case columns of a variable entry, in the order of a stats row.
+CASE_COLUMNS = ('count', 'min_v_by_case', 'max_v_by_case', 'min_t_by_case', 'max_t_by_case')
+
+
+class StaleIndexError(RuntimeError):
+    """Raised when querying a `VariableIndex` that was closed because its file was replaced."""
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def numeric_points(details) -> Iterator[Tuple[float, float]]:
+    """Yield the `(t, v)` numeric points of every series of a variable."""
+    for key in SERIES_KEYS:
+        for series in details.get(key) or []:
+            if isinstance(series, CompactSeries):
+                yield from zip(series.times, series.values)
+            elif hasattr(series, 'get'):
+                for point in series.get('data') or []:
+                    if (isinstance(point, list) and len(point) == 2
+                            and _is_number(point[0]) and _is_number(point[1])):
+                        yield point[0], point[1]
+
+
+def _summarize(points: List[Tuple[float, float]]) -> Optional[list]:
+    if not points:
+        return None
+    values = [v for _, v in points]
+    times = [t for t, _ in points]
+    return [len(points), min(values), max(values), min(times), max(times)]
+
+
+def case_variable_stats(case_files: Dict, steps: Optional[List[Dict]] = None) -> Dict[str, Dict]:
+    """Summarize the numeric points of each variable in one case.
+
+    Returns `{var_id: {"kind", "stats": [count, min_v, max_v, min_t, max_t],
+    "steps": [stats or None per time step], "values", "times"}}`, where
+    `values` and `times` are the points as `array('d')`s sorted by value.
+    Time-step windows are the `min_t`/`max_t` of `steps` (the case's
+    `case_details.json` entry), inclusive.
+    """
+    summary = {}
+    for file_key, kind in VARIABLE_KINDS.items():
+        variables = case_files.get(file_key)
+        if not isinstance(variables, dict):
+            continue
+        for var_id, details in variables.items():
+            if not hasattr(details, 'get'):
+                continue
+            points = sorted(numeric_points(details), key=lambda point: point[1])
+            if not points:
+                continue
+            summary[var_id] = {
+                'kind': kind,
+                'stats': _summarize(points),
+                'steps': [_summarize([p for p in points if step['min_t'] <= p[0] <= step['max_t']])
+                          for step in steps or []],
+                'values': array('d', (v for _, v in points)),
+                'times': array('d', (t for t, _ in points)),
+            }
+    return summary
+
+
+def build_variable_index(study_id: str, case_stats: Dict[str, Dict[str, Dict]],
+                         case_details: Optional[Dict] = None) -> Tuple[Dict, array]:
+    """Invert `{case_id: case_variable_stats(...)}` into the index document and points buffer.
+
+    `case_details` is the study's `case_details.json`, whose windows are
+    recorded for the indexed cases.
+    """
+    points = array('d')
+    variables: Dict[str, Dict] = {}
+    for case_id in sorted(case_stats):
+        for var_id, entry in case_stats[case_id].items():
+            column = variables.get(var_id)
+            if column is None:
+                column = variables[var_id] = {'kind': entry['kind'], 'case_ids': [], 'steps': [],
+                                              'offset_by_case': []}
+                column.update((name, []) for name in CASE_COLUMNS)
+            column['case_ids'].append(case_id)
+            column['steps'].append(entry['steps'])
+            for name, value in zip(CASE_COLUMNS, entry['stats']):
+                column[name].append(value)
+            column['offset_by_case'].append(len(points))
+            points.extend(entry['values'])
+            points.extend(entry['times'])
+    for column in variables.values():
+        column['case_count'] = len(column['case_ids'])
+        column['points'] = sum(column['count'])
+        column['min_v'] = min(column['min_v_by_case'])
+        column['max_v'] = max(column['max_v_by_case'])
+        column['min_t'] = min(column['min_t_by_case'])
+        column['max_t'] = max(column['max_t_by_case'])
+    document = {
+        'version': INDEX_VERSION,
+        'study_id': study_id,
+        'built_at': time.time(),
+        'case_count': len(case_stats),
+        'points_length': len(points),
+        'time_steps': {case_id: [[step['min_t'], step['max_t']] for step in (case_details or {}).get(case_id) or []]
+                       for case_id in sorted(case_stats)},
+        'variables': dict(sorted(variables.items())),
+    }
+    return document, points
+
+
+def points_path(path: str) -> str:
+    """Return the sorted-points file that goes with the index JSON at `path`."""
+    return os.path.splitext(path)[0] + POINTS_SUFFIX
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def write_variable_index(path: str, document: Dict, points: array) -> None:
+    """Write an index to `path` (see `case_store.variable_index_path`) and its points file.
+
+    The points are written first; readers check `points_length` against
+    the points file, so a half-replaced index is never used.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if sys.byteorder != 'little':
+        points = array('d', points)
+        points.byteswap()
+    _write_atomic(points_path(path), points.tobytes())
+    _write_atomic(path, jsoncodec.dumps(document))
+
+
+def _open_points(path: str, length: int) -> Optional[Tuple[Optional[mmap.mmap], memoryview]]:
+    """Map the points file for an index; None if it is missing or does not match `length`."""
+    try:
+        with open(points_path(path), 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size != length * 8:
+                return None
+            if size == 0:
+                return None, memoryview(array('d'))
+            if sys.byteorder != 'little':
+                points = array('d')
+                points.frombytes(file.read())
+                points.byteswap()
+                return None, memoryview(points)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError:
+        return None
+    return mapped, memoryview(mapped).cast('d')
+
+
+def read_case_stats(path: str) -> Dict[str, Dict[str, Dict]]:
+    """Return the `{case_id: case_variable_stats(...)}` the index at `path` was built from.
+
+    Lets `compile_study --case` replace some cases and keep the rest.
+    Returns an empty dict when there is no usable index.
+    """
+    try:
+        with open(path, 'rb') as file:
+            document = jsoncodec.loads(file.read())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(document, dict) or document.get('version') != INDEX_VERSION:
+        return {}
+    opened = _open_points(path, document.get('points_length', -1))
+    if opened is None:
+        return {}
+    mapped, points = opened
+    case_stats: Dict[str, Dict[str, Dict]] = {}
+    try:
+        for var_id, column in document['variables'].items():
+            for i, case_id in enumerate(column['case_ids']):
+                offset, count = column['offset_by_case'][i], column['count'][i]
+                case_stats.setdefault(case_id, {})[var_id] = {
+                    'kind': column['kind'],
+                    'stats': [column[name][i] for name in CASE_COLUMNS],
+                    'steps': column['steps'][i],
+                    'values': array('d', points[offset:offset + count]),
+                    'times': array('d', points[offset + count:offset + 2 * count]),
+                }
+    finally:
+        points.release()
+        if mapped is not None:
+            mapped.close()
+    return case_stats
+
+
+class _Posting:
+    """One case of a variable in one scope: its public row plus where its points are."""
+
+    __slots__ = ('row', 'offset', 'count', 'window')
+
+    def __init__(self, row: Dict, offset: int, count: int, window: Optional[list]):
+        self.row = row
+        self.offset = offset
+        self.count = count
+        self.window = window
+
+
+class _Postings:
+    """A variable's postings in one scope, sorted by maximum value."""
+
+    __slots__ = ('max_vs', 'items')
+
+    def __init__(self, items: List[_Posting]):
+        self.items = sorted(items, key=lambda item: item.row['max_v'])
+        self.max_vs = [item.row['max_v'] for item in self.items]
+
+
+def _row(case_id: str, stats: list) -> Dict:
+    return {'case_id': case_id, 'count': stats[0], 'min_v': stats[1], 'max_v': stats[2],
+            'min_t': stats[3], 'max_t': stats[4]}
+
+
+class VariableIndex:
+    """Query interface over a loaded index document and its mapped points."""
+
+    def __init__(self, document: Dict, points: memoryview, mapped: Optional[mmap.mmap] = None):
+        self.document = document
+        self._points = points
+        self._mapped = mapped
+        self._postings: Dict[Tuple[str, Optional[int]], _Postings] = {}
+        self._lock = threading.Lock()
+        self._users = 0
+        self._closed = False
+
+    @property
+    def built_at(self) -> Optional[float]:
+        return self.document.get('built_at')
+
+    def variables(self) -> Dict[str, Dict]:
+        """Return each variable's kind, case and point counts, and value/time ranges."""
+        return {var_id: {key: column[key] for key in
+                         ('kind', 'case_count', 'points', 'min_v', 'max_v', 'min_t', 'max_t')}
+                for var_id, column in self.document['variables'].items()}
+
+    def kind(self, var_id: str) -> Optional[str]:
+        column = self.document['variables'].get(var_id)
+        return column['kind'] if column else None
+
+    def _items(self, column: Dict, time_step: Optional[int]) -> Iterator[_Posting]:
+        time_steps = self.document.get('time_steps', {})
+        for i, case_id in enumerate(column['case_ids']):
+            offset, count = column['offset_by_case'][i], column['count'][i]
+            if time_step is None:
+                yield _Posting(_row(case_id, [column[name][i] for name in CASE_COLUMNS]), offset, count, None)
+                continue
+            steps = column['steps'][i]
+            windows = time_steps.get(case_id) or []
+            if 0 <= time_step < min(len(steps), len(windows)) and steps[time_step] is not None:
+                yield _Posting(_row(case_id, steps[time_step]), offset, count, windows[time_step])
+
+    def postings(self, var_id: str, time_step: Optional[int] = None) -> Optional[_Postings]:
+        """Return the sorted postings of `var_id` over whole cases or one time step."""
+        key = (var_id, time_step)
+        with self._lock:
+            postings = self._postings.get(key)
+        if postings is None:
+            column = self.document['variables'].get(var_id)
+            if column is None:
+                return None
+            postings = _Postings(list(self._items(column, time_step)))
+            with self._lock:
+                self._postings[key] = postings
+        return postings
+
+    def _has_value(self, item: _Posting, min_value: float, max_value: float) -> bool:
+        """Return True if the case has a point in `[min_value, max_value]` (within its window)."""
+        points, offset, count = self._points, item.offset, item.count
+        i = bisect_left(points, min_value, offset, offset + count)
+        while i < offset + count and points[i] <= max_value:
+            if item.window is None or item.window[0] <= points[i + count] <= item.window[1]:
+                return True
+            i += 1
+        return False
+
+    def close(self) -> None:
+        """Release the mapped points once no query is using them; later queries raise StaleIndexError."""
+        with self._lock:
+            self._closed = True
+            if self._users:
+                return  # the last running query releases them
+        self._unmap()
+
+    def _unmap(self) -> None:
+        self._points.release()
+        if self._mapped is not None:
+            self._mapped.close()
+
+    def query(self, var_id: str, min_value: Optional[float] = None, max_value: Optional[float] = None,
+              time_step: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Find the cases with a point of `var_id` whose value is in `[min_value, max_value]`.
+
+        Either bound may be None (unbounded); with `time_step` only points
+        in that time step count. Returns the matching rows in case-id order
+        and how many cases had to be checked against their sorted values.
+        Raises StaleIndexError if the index has been closed.
+        """
+        with self._lock:
+            if self._closed:
+                raise StaleIndexError("The variable index was replaced; look it up again")
+            self._users += 1
+        try:
+            return self._query(var_id, min_value, max_value, time_step)
+        finally:
+            with self._lock:
+                self._users -= 1
+                unmap = self._closed and not self._users
+            if unmap:
+                self._unmap()
+
+    def _query(self, var_id: str, min_value: Optional[float], max_value: Optional[float],
+               time_step: Optional[int]) -> Tuple[List[Dict], int]:
+        postings = self.postings(var_id, time_step)
+        if postings is None:
+            return [], 0
+        start = 0 if min_value is None else bisect_left(postings.max_vs, min_value)
+        matches, checked = [], 0
+        for item in postings.items[start:]:
+            row = item.row
+            if max_value is not None and row['min_v'] > max_value:
+                continue
+            if (min_value is None or max_value is None or row['min_v'] >= min_value
+                    or row['max_v'] <= max_value):
+                matches.append(row)
+            else:
+                checked += 1
+                if self._has_value(item, min_value, max_value):
+                    matches.append(row)
+        matches.sort(key=lambda row: row['case_id'])
+        return matches, checked
+
+
+_indexes: Dict[str, tuple] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_variable_index(path: str, load: Callable[[str], Optional[Dict]]) -> Optional[VariableIndex]:
+    """Return the cached `VariableIndex` stored at `path`, or None if it has not been built.
+
+    `load` reads a JSON path (normally the cached `services.load_json`, which
+    returns the same object while a file is unchanged, so staleness is an
+    identity check). An index whose file was replaced or removed is closed
+    (see `VariableIndex.close`).
+    """
+    document = load(path)
+    key = os.path.abspath(path)
+    if not document or document.get('version') != INDEX_VERSION:
+        _discard(key)
+        return None
+    with _indexes_lock:
+        cached = _indexes.get(key)
+    if cached is not None and cached[0] is document:
+        return cached[1]
+    opened = _open_points(path, document.get('points_length', -1))
+    if opened is None:
+        _discard(key)
+        return None
+    mapped, points = opened
+    index = VariableIndex(document, points, mapped)
+    with _indexes_lock:
+        previous = _indexes.get(key)
+        if previous is not None and previous[0] is document:
+            # Another thread mapped the same document first; keep its index.
+            index, stale = previous[1], index
+        else:
+            _indexes[key] = (document, index)
+            stale = previous[1] if previous is not None else None
+    if stale is not None:
+        stale.close()
+    return index
+
+
+def _discard(key: str) -> None:
+    with _indexes_lock:
+        previous = _indexes.pop(key, None)
+    if previous is not None:
+        previous[1].close()
+
+
+def _reset_after_fork() -> None:
+    # A lock held by another thread at fork time would never be released.
+    global _indexes_lock
+    _indexes_lock = threading.Lock()
+    for _, index in _indexes.values():
+        index._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
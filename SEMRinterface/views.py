@@ -6,25 +6,75 @@ flow for study, user, and case selection, plus the case viewer itself and
 an AJAX endpoint for case data. The heavy lifting for I/O is delegated to
 `SEMRinterface.services` so the views remain thin.
 """
-from django.http import JsonResponse, HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.http import JsonResponse as DjangoJsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.conf import settings
+import asyncio
 import logging
+import math
+import os
+from typing import Dict, Optional
 from .services import (
+    BATCH_MAX_CASES,
+    RESOURCES_DIR,
     get_study_ids,
     get_user_details,
     get_case_assignments,
     load_case_details,
-    get_case_files,
+    get_cached_case_payload,
+    get_case_payload,
+    aget_case_payload,
+    iter_passthrough_payload,
+    load_json,
+    prefetch_case_data,
+    iter_case_batch,
+    get_results_analytics,
+    get_study_variable_index,
+    query_variable_index,
 )
+from . import jsoncodec
+from .metrics import TEMPLATE_RENDER
+from .payloads import (
+    can_passthrough,
+    case_data_etag,
+    is_safe_id,
+    negotiate_encoding,
+)
+from .wireformats import CONTENT_TYPES, negotiate_format
 
 logger = logging.getLogger(__name__)
 
+CASE_DATA_MAX_AGE = getattr(settings, 'SEMR_CASE_DATA_MAX_AGE', 24 * 60 * 60)
+
+
+class JsonResponse(DjangoJsonResponse):
+    """`django.http.JsonResponse` serialized with `SEMRinterface.jsoncodec`.
+
+    Takes `data`, `safe`, and the usual `HttpResponse` keyword arguments;
+    `encoder` and `json_dumps_params` are not supported.
+    """
+
+    def __init__(self, data, safe: bool = True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault('content_type', 'application/json')
+        HttpResponse.__init__(self, content=jsoncodec.dumps(data), **kwargs)
+
+
+def _render(request: HttpRequest, template_name: str, context: Optional[Dict] = None) -> HttpResponse:
+    """`render`, with the rendering time recorded in the template metrics."""
+    with TEMPLATE_RENDER.time(template=template_name):
+        return render(request, template_name, context)
+
 
 def welcome_view(request: HttpRequest) -> HttpResponse:
     """Welcome page with tutorial and getting started information."""
-    return render(request, 'SEMRinterface/welcome.html')
+    return _render(request, 'SEMRinterface/welcome.html')
 
 
 @require_http_methods(["GET", "POST"])
@@ -44,7 +94,7 @@ def unified_selection_view(request: HttpRequest) -> HttpResponse:
     if request.method == 'GET':
         studies = get_study_ids()
         context = {'studies': studies}
-        return render(request, 'SEMRinterface/unified_selection_new.html', context)
+        return _render(request, 'SEMRinterface/unified_selection_new.html', context)
 
     if request.method == 'POST':
         request_type = request.POST.get('type')
@@ -70,28 +120,301 @@ def unified_selection_view(request: HttpRequest) -> HttpResponse:
 
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
+def _optional_int(request: HttpRequest, name: str) -> Optional[int]:
+    """Return query parameter `name` as an int, None if absent.
+
+    Raises ValueError with a client-facing message when it is not an integer.
+    """
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}') from None
+
+def _optional_float(request: HttpRequest, name: str) -> Optional[float]:
+    """Return query parameter `name` as a finite float, None if absent.
+
+    Raises ValueError with a client-facing message when it is not a number.
+    """
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name}') from None
+    if not math.isfinite(number):
+        raise ValueError(f'Invalid {name}')
+    return number
+
+def _case_data_options(request: HttpRequest) -> Dict:
+    """Return the payload-shaping query options for `get_case_data`."""
+    return {
+        'time_step': _optional_int(request, 'time_step'),
+        'max_points': _optional_int(request, 'max_points'),
+        'panels': True if request.GET.get('panels') in ('1', 'true') else None,
+        'since_step': _optional_int(request, 'since_step'),
+        'format': negotiate_format(request.GET.get('format'), request.headers.get('Accept', '')),
+    }
+
+def _not_modified(request: HttpRequest, etag: str) -> Optional[HttpResponse]:
+    """Return the 304 (or 412) response when `etag` satisfies the request's preconditions."""
+    response = get_conditional_response(request, etag=quote_etag(etag))
+    if response is not None:
+        response['ETag'] = quote_etag(etag)
+    return response
+
+def _case_data_request(request: HttpRequest) -> tuple:
+    """Validate a case-data request; returns `(study_id, case_id, options, error_response)`."""
+    study_id = request.GET.get('study_id')
+    case_id = request.GET.get('case_id')
+
+    if not all([study_id, case_id]):
+        return None, None, None, JsonResponse({'status': 'error', 'message': 'Missing required parameters'}, status=400)
+    if not (is_safe_id(study_id) and is_safe_id(case_id)):
+        return None, None, None, JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
+
+    try:
+        options = _case_data_options(request)
+    except ValueError as exc:
+        return None, None, None, JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+    return study_id, case_id, options, None
+
+def _finish_case_data_response(response: HttpResponse, encoding: str, etag: str) -> HttpResponse:
+    """Add the encoding, validator, and caching headers shared by the case-data views.
+
+    Only successful responses get here, so error responses never carry the
+    case's ETag.
+    """
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    response['ETag'] = quote_etag(etag)
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    patch_cache_control(response, private=True, max_age=CASE_DATA_MAX_AGE)
+    return response
+
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_case_data(request: HttpRequest) -> JsonResponse:
+def get_case_data(request: HttpRequest) -> HttpResponse:
     """Return case data payloads for the client via JSON.
 
+    Successful responses carry a strong ETag derived from the case files'
+    mtimes and sizes, computed once per request after the parameters are
+    validated, so revalidations are answered with 304 before any case data
+    is read. Bodies are served precompressed (gzip, or brotli when available)
+    from the in-memory payload cache (which `case_viewer` warms in the
+    background) or the payload cache on disk; see `SEMRinterface.payloads`.
+    Otherwise identity requests for compiled (validated) cases with no
+    options other than `panels` stream the raw case files without decoding
+    them.
+
     Query parameters
     ----------------
     study_id: str
     case_id: str
+    time_step: int, optional
+        Index into the case's `case_details.json` epochs; when given, series
+        points and notes outside that step's `min_t`/`max_t` are omitted.
+    max_points: int, optional
+        Downsample each numeric and medication series to about this many
+        points (LTTB); first, last, and out-of-range points are kept.
+    panels: '1' or 'true', optional
+        Add the viewer's grouped `physio_data`, `lab_data`, and `med_data`
+        panels, `instructions`, and `active_time_step` (the `time_step`
+        given, else the first); see `SEMRinterface.panels`.
+    since_step: int, optional
+        With `time_step`, return only what that step adds to `since_step`
+        (which it must extend): points and notes in `(since_step max_t,
+        time_step max_t]`, the variables that have them, and
+        `new_variables`, those with no points at `since_step`.
+    format: 'json', 'columnar', or 'binary', optional
+        Wire format of the series; see `SEMRinterface.wireformats`. Without
+        it, an `Accept` header naming `application/vnd.semr.columnar+json`
+        or `application/vnd.semr.binary` selects that format. Errors are
+        always JSON.
     """
-    study_id = request.GET.get('study_id')
-    case_id = request.GET.get('case_id')
+    study_id, case_id, options, error = _case_data_request(request)
+    if error is not None:
+        return error
 
-    if not all([study_id, case_id]):
-        return JsonResponse({'status': 'error', 'message': 'Missing required parameters'}, status=400)
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    study_dir = os.path.join(RESOURCES_DIR, study_id)
+    etag = case_data_etag(study_dir, case_id, options, encoding)
+    if etag is None:
+        return JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    body = get_cached_case_payload(study_id, case_id, options, encoding, etag=etag)
+    if body is None and encoding == 'identity' and can_passthrough(study_dir, case_id, options, load_json):
+        response = StreamingHttpResponse(iter_passthrough_payload(study_id, case_id, options),
+                                         content_type='application/json')
+    else:
+        if body is None:
+            try:
+                body = get_case_payload(study_id, case_id, options, encoding, etag=etag)
+            except FileNotFoundError as exc:
+                logger.info("Case data not found: %s", exc)
+                return JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
+            except ValueError as exc:
+                return JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+        response = HttpResponse(body, content_type=CONTENT_TYPES[options['format']])
+
+    return _finish_case_data_response(response, encoding, etag)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def aget_case_data(request: HttpRequest) -> HttpResponse:
+    """Async variant of `get_case_data` for ASGI deployments.
+
+    Takes the same query parameters and returns the same responses, but the
+    case files are read and decoded concurrently (see
+    `services.aget_case_files`) without holding a worker while waiting on
+    storage. Serve it with `SEMRproject.asgi`.
+    """
+    study_id, case_id, options, error = _case_data_request(request)
+    if error is not None:
+        return error
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    etag = await asyncio.to_thread(case_data_etag, os.path.join(RESOURCES_DIR, study_id), case_id, options, encoding)
+    if etag is None:
+        return JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
+    not_modified = _not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
 
     try:
-        case_data = get_case_files(study_id, case_id)
-        return JsonResponse({'status': 'success', 'case_data': case_data})
+        body = await aget_case_payload(study_id, case_id, options, encoding, etag=etag)
     except FileNotFoundError as exc:
         logger.info("Case data not found: %s", exc)
         return JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
+    except ValueError as exc:
+        return JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+    response = HttpResponse(body, content_type=CONTENT_TYPES[options['format']])
+    return _finish_case_data_response(response, encoding, etag)
+
+def _batch_entry(entry, defaults: Dict) -> Dict:
+    """Normalize one `cases` item of a batch request; raises ValueError if invalid."""
+    if isinstance(entry, str):
+        entry = {'case_id': entry}
+    if not isinstance(entry, dict) or not is_safe_id(entry.get('case_id')):
+        raise ValueError('Invalid case entry')
+    request = {'case_id': entry['case_id']}
+    for name in ('time_step', 'max_points', 'since_step'):
+        value = entry.get(name, defaults.get(name))
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError(f'Invalid {name}')
+        request[name] = value
+    panels = entry.get('panels', defaults.get('panels'))
+    if panels is not None and not isinstance(panels, bool):
+        raise ValueError('Invalid panels')
+    request['panels'] = panels or None
+    variables = entry.get('variables', defaults.get('variables'))
+    if variables is not None and (not isinstance(variables, list)
+                                  or not all(isinstance(v, str) for v in variables)):
+        raise ValueError('Invalid variables')
+    request['variables'] = variables
+    fmt = entry.get('format', defaults.get('format'))
+    if fmt not in (None, 'json', 'columnar'):
+        raise ValueError('Invalid format')
+    request['format'] = fmt
+    return request
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def get_case_data_batch(request: HttpRequest) -> HttpResponse:
+    """Stream case data for many cases of one study as newline-delimited JSON.
+
+    Expects a JSON body::
+
+        {"study_id": "...",
+         "cases": ["case_a", {"case_id": "case_b", "time_step": 1, "variables": ["HR"]}],
+         "time_step": null, "max_points": null, "variables": null, "panels": false}
+
+    Top-level `time_step`, `max_points`, `variables`, `panels`,
+    `since_step`, and `format` ('json' or 'columnar'; lines are JSON, so
+    'binary' is not available) are defaults for entries that do not set them. The response has one line per case, in
+    request order, each with its own `status`; see
+    `services.iter_case_batch`. Cases are loaded in parallel on a bounded
+    pool while earlier lines are being sent.
+    """
+    try:
+        body = jsoncodec.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+    if not isinstance(body, dict):
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+
+    study_id = body.get('study_id')
+    cases = body.get('cases')
+    if not study_id or not isinstance(cases, list) or not cases:
+        return JsonResponse({'status': 'error', 'message': 'Missing required parameters'}, status=400)
+    if not is_safe_id(study_id) or not os.path.isdir(os.path.join(RESOURCES_DIR, study_id)):
+        return JsonResponse({'status': 'error', 'message': 'Study not found'}, status=404)
+    if len(cases) > BATCH_MAX_CASES:
+        return JsonResponse({'status': 'error', 'message': f'At most {BATCH_MAX_CASES} cases per request'},
+                            status=400)
+    try:
+        requests = [_batch_entry(entry, body) for entry in cases]
+    except ValueError as exc:
+        return JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+
+    response = StreamingHttpResponse(iter_case_batch(study_id, requests), content_type='application/x-ndjson')
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@require_http_methods(["GET"])
+def results_analytics(request: HttpRequest) -> HttpResponse:
+    """Return selection analytics for a study as JSON.
+
+    Query parameters: `study_id`, and optionally one or more `case_id` to
+    limit the per-case section. Only results stored since the previous call
+    are parsed; see `services.get_results_analytics`.
+    """
+    study_id = request.GET.get('study_id')
+    if not study_id:
+        return JsonResponse({'status': 'error', 'message': 'Missing required parameters'}, status=400)
+    if not is_safe_id(study_id) or not os.path.isdir(os.path.join(RESOURCES_DIR, study_id)):
+        return JsonResponse({'status': 'error', 'message': 'Study not found'}, status=404)
+    case_ids = request.GET.getlist('case_id') or None
+    analytics = get_results_analytics(study_id, case_ids)
+    return JsonResponse({'status': 'success', 'analytics': analytics})
+
+@require_http_methods(["GET"])
+def variable_index(request: HttpRequest) -> HttpResponse:
+    """List a study's indexed variables, or the cases that have one in a value range.
+
+    Query parameters: `study_id`; optionally `variable` (an observation or
+    medication id) with `min_value`, `max_value` (inclusive), and
+    `time_step`. Without `variable` every indexed variable is listed with
+    its case and point counts and value and time ranges. Answered from the
+    index built by `manage.py compile_study`; see
+    `services.query_variable_index`.
+    """
+    study_id = request.GET.get('study_id')
+    if not study_id:
+        return JsonResponse({'status': 'error', 'message': 'Missing required parameters'}, status=400)
+    if not is_safe_id(study_id) or not os.path.isdir(os.path.join(RESOURCES_DIR, study_id)):
+        return JsonResponse({'status': 'error', 'message': 'Study not found'}, status=404)
+    index = get_study_variable_index(study_id)
+    if index is None:
+        return JsonResponse({'status': 'error', 'message': 'Variable index not built'}, status=404)
+    variable = request.GET.get('variable')
+    if not variable:
+        return JsonResponse({'status': 'success', 'study_id': study_id, 'built_at': index.built_at,
+                             'variables': index.variables()})
+    try:
+        result = query_variable_index(study_id, variable, _optional_float(request, 'min_value'),
+                                      _optional_float(request, 'max_value'), _optional_int(request, 'time_step'))
+    except FileNotFoundError:
+        return JsonResponse({'status': 'error', 'message': 'Variable index not built'}, status=404)
+    except ValueError as exc:
+        return JsonResponse({'status': 'error', 'message': str(exc)}, status=400)
+    return JsonResponse({'status': 'success', 'study_id': study_id, **result})
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -99,7 +422,9 @@ def case_viewer(request: HttpRequest) -> HttpResponse:
     """Render the case viewer for a given study, user, and case.
 
     Requires query string parameters `study_id`, `user_id`, and `case_id`.
-    The function loads summary case details and passes them to the template.
+    The function loads summary case details and passes them to the template,
+    and schedules a background prefetch of the case data the reviewer is
+    likely to request next.
     """
     study_id = request.GET.get('study_id')
     user_id = request.GET.get('user_id')
@@ -119,7 +444,10 @@ def case_viewer(request: HttpRequest) -> HttpResponse:
             'time_step': 0,
 
         }
-        return render(request, 'SEMRinterface/case_viewer_new.html', context)
+        if is_safe_id(study_id) and is_safe_id(case_id):
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+            prefetch_case_data(study_id, user_id, case_id, 0, encoding)
+        return _render(request, 'SEMRinterface/case_viewer_new.html', context)
     except FileNotFoundError as exc:
         logger.info("Case viewer missing data: %s", exc)
         return JsonResponse({'status': 'error', 'message': 'Case data not found'}, status=404)
\ No newline at end of file
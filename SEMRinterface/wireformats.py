@@ -0,0 +1,205 @@
+"""
+Alternative wire formats for `/api/get_case_data/` series.
+
+The default response writes every point as a JSON `[t, v]` pair. Clients
+can ask for one of two denser forms instead, with a `format` query
+parameter or by naming its media type in `Accept` (see `negotiate_format`):
+
+- `columnar` (`application/vnd.semr.columnar+json`): the same envelope, but
+  each numeric series carries parallel `t` and `v` arrays in place of
+  `data`. `t` is delta-encoded whole milliseconds: the first entry is the
+  first timestamp and each later entry is the difference from the one
+  before, so a running sum restores the timestamps.
+- `binary` (`application/vnd.semr.binary`): a frame holding the envelope as
+  JSON, with each numeric series' `data` replaced by an `offset`/`length`
+  pointer, followed by one buffer of little-endian float64 numbers. A
+  series' timestamps are `length` numbers starting at `offset` (counted in
+  numbers from the start of the buffer) and its values the `length`
+  numbers after them, the layout of the compiled store's `series.f64`.
+
+The frame is::
+
+    b'SEMR' | version (uint32 LE) | header length N (uint32 LE)
+    | N bytes of UTF-8 JSON, space-padded | float64 LE buffer
+
+`N` is padded so the buffer starts at a multiple of 8 bytes and can be
+wrapped in a `Float64Array` without copying. Series whose points are not
+numeric `[t, v]` pairs stay as they are in both formats.
+"""
+
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from . import jsoncodec
+from .series import CompactSeries, SERIES_KEYS
+
+#: Format name (None is the default JSON shape) -> response content type.
+CONTENT_TYPES = {
+    None: 'application/json',
+    'columnar': 'application/vnd.semr.columnar+json',
+    'binary': 'application/vnd.semr.binary',
+}
+
+#: Format name -> extension of its stored payload files.
+FILE_EXTENSIONS = {None: 'json', 'columnar': 'json', 'binary': 'bin'}
+
+#: Case-data keys whose variables hold series.
+SERIES_FILE_KEYS = ('observations', 'medications')
+
+FRAME_MAGIC = b'SEMR'
+FRAME_VERSION = 1
+_FRAME_PREFIX = struct.Struct('<4sII')
+
+
+def negotiate_format(param: Optional[str], accept: str) -> Optional[str]:
+    """Pick the wire format from the `format` parameter, else the `Accept` header.
+
+    Returns None for the default JSON shape. Raises ValueError for an
+    unknown `format` value; unknown media types in `Accept` are ignored.
+    """
+    if param not in (None, ''):
+        if param == 'json':
+            return None
+        if param not in CONTENT_TYPES:
+            raise ValueError('Invalid format')
+        return param
+    by_type = {content_type: name for name, content_type in CONTENT_TYPES.items()}
+    best, best_quality = None, 0.0
+    for token in (accept or '').split(','):
+        parts = token.strip().split(';')
+        media_type = parts[0].strip().lower()
+        if media_type not in by_type:
+            continue
+        quality = 1.0
+        for field in parts[1:]:
+            name, _, value = field.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = by_type[media_type], quality
+    return best
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _columns(series) -> Optional[Tuple[list, list]]:
+    """Return a series' `(times, values)`, or None if its points are irregular."""
+    if isinstance(series, CompactSeries):
+        return series.columns()
+    data = series.get('data') or []
+    if not all(isinstance(p, list) and len(p) == 2 and _is_number(p[0]) and _is_number(p[1]) for p in data):
+        return None
+    return [p[0] for p in data], [p[1] for p in data]
+
+
+def _delta_times(times: list) -> List[int]:
+    deltas, previous = [], 0
+    for t in times:
+        ms = round(t)
+        deltas.append(ms - previous)
+        previous = ms
+    return deltas
+
+
+def _columnar_series(series):
+    columns = _columns(series)
+    if columns is None:
+        return series
+    times, values = columns
+    record = {}
+    for key in series:
+        if key == 'data':
+            record['t'] = _delta_times(times)
+            record['v'] = values
+        else:
+            record[key] = series[key]
+    return record
+
+
+def _binary_series(series, buffer: array):
+    if isinstance(series, CompactSeries):
+        times, values = series.times, series.values
+    else:
+        columns = _columns(series)
+        if columns is None:
+            return series
+        times, values = columns
+    record = {}
+    for key in series:
+        if key == 'data':
+            record['offset'] = len(buffer)
+            record['length'] = len(times)
+        else:
+            record[key] = series[key]
+    buffer.extend(times)
+    buffer.extend(values)
+    return record
+
+
+def _map_series(case_data: Dict, convert) -> Dict:
+    """Return `case_data` with every series of its variables passed through `convert`."""
+    mapped = dict(case_data)
+    for file_key in SERIES_FILE_KEYS:
+        variables = case_data.get(file_key)
+        if not isinstance(variables, dict):
+            continue
+        converted = {}
+        for var_id, details in variables.items():
+            if hasattr(details, 'keys'):
+                details = {key: details[key] for key in details}
+                for key in SERIES_KEYS:
+                    if isinstance(details.get(key), list):
+                        details[key] = [convert(s) if hasattr(s, 'keys') else s for s in details[key]]
+            converted[var_id] = details
+        mapped[file_key] = converted
+    return mapped
+
+
+def columnar_case_data(case_data: Dict) -> Dict:
+    """Return `case_data` with numeric series as delta-encoded `t` and `v` columns."""
+    return _map_series(case_data, _columnar_series)
+
+
+def serialize_columnar(envelope: Dict) -> bytes:
+    """Serialize a response envelope in the columnar JSON format."""
+    return jsoncodec.dumps(dict(envelope, case_data=columnar_case_data(envelope['case_data'])))
+
+
+def serialize_binary(envelope: Dict) -> bytes:
+    """Serialize a response envelope as a binary frame (see the module docstring)."""
+    buffer = array('d')
+    header = jsoncodec.dumps(dict(envelope, case_data=_map_series(
+        envelope['case_data'], lambda series: _binary_series(series, buffer))))
+    header += b' ' * (-(_FRAME_PREFIX.size + len(header)) % 8)
+    if sys.byteorder != 'little':
+        buffer.byteswap()
+    return _FRAME_PREFIX.pack(FRAME_MAGIC, FRAME_VERSION, len(header)) + header + buffer.tobytes()
+
+
+def parse_binary(frame: bytes) -> Tuple[Dict, memoryview]:
+    """Split a binary frame into its decoded header and its float64 buffer.
+
+    The buffer is a native-order `memoryview` of the frame on little-endian
+    hosts. Raises ValueError if `frame` is not a frame of this version.
+    """
+    if len(frame) < _FRAME_PREFIX.size:
+        raise ValueError('Truncated frame')
+    magic, version, header_length = _FRAME_PREFIX.unpack_from(frame)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f'Not a version {FRAME_VERSION} SEMR frame')
+    start = _FRAME_PREFIX.size + header_length
+    header = jsoncodec.loads(bytes(frame[_FRAME_PREFIX.size:start]))
+    body = frame[start:]
+    if sys.byteorder != 'little':
+        swapped = array('d')
+        swapped.frombytes(body)
+        swapped.byteswap()
+        return header, memoryview(swapped)
+    return header, memoryview(body).cast('d')
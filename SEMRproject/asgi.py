@@ -0,0 +1,23 @@
+"""
+ASGI config for SEMRproject project.
+
+This module contains the ASGI application used by ASGI servers such as
+uvicorn, daphne, or hypercorn. It exposes a module-level variable named
+``application``, which the ``ASGI_APPLICATION`` setting points at.
+
+Under ASGI the async case-data endpoint (``/api/async/get_case_data/``) runs
+on the event loop and loads a case's files concurrently, so one worker can
+keep many case loads in flight; synchronous views keep working unchanged.
+For example:
+
+    uvicorn SEMRproject.asgi:application --workers 4
+
+"""
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SEMRproject.settings")
+
+# This application object is used by any ASGI server configured to use this
+# file.
+from django.core.asgi import get_asgi_application
+application = get_asgi_application()
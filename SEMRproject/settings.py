@@ -118,6 +118,7 @@ SECRET_KEY = '$$$$$ENTER SECRET KEY$$$$$'
 
 
 MIDDLEWARE = (
+    'SEMRinterface.metrics.MetricsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -131,6 +132,7 @@ ROOT_URLCONF = 'SEMRproject.urls'
 
 # Python dotted path to the WSGI application used by Django's runserver.
 WSGI_APPLICATION = 'SEMRproject.wsgi.application'
+ASGI_APPLICATION = 'SEMRproject.asgi.application'
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -195,3 +197,94 @@ LOGGING = {
         },
     }
 }
+
+# Byte budget for the in-process cache of parsed study and case JSON files
+# (see SEMRinterface/cache.py). Entries are evicted least-recently-used first
+# and are invalidated whenever the file's mtime or size changes. The budget
+# counts each file's size on disk; parsed objects typically use several times
+# that much memory.
+SEMR_JSON_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Folder holding one subfolder per study. `manage.py benchmark` points it at a
+# temporary directory for its own process.
+# SEMR_RESOURCES_DIR = os.path.join(BASE_DIR, 'resources')
+
+# Cache-Control max-age (seconds) for /api/get_case_data/ responses. Case
+# payloads also carry strong ETags, so clients revalidate cheaply afterwards.
+SEMR_CASE_DATA_MAX_AGE = 24 * 60 * 60
+
+# Assignment journal (SEMRinterface/journal.py): seconds between batched
+# fsyncs of user_details.journal (0 = fsync every event), and the number of
+# events after which the journal is compacted into user_details.json.
+SEMR_JOURNAL_FSYNC_INTERVAL = 0.1
+SEMR_JOURNAL_COMPACT_EVENTS = 500
+
+# stored_results.txt writer (SEMRinterface/results_writer.py). 'group' queues
+# selections and writes them in batches of up to SEMR_RESULTS_BATCH_SIZE or
+# every SEMR_RESULTS_FLUSH_INTERVAL seconds; 'record' writes and fsyncs each
+# selection before the request returns. While writes fail with retryable
+# errors at most SEMR_RESULTS_MAX_PENDING selections are queued; further
+# selections are rejected.
+SEMR_RESULTS_DURABILITY = 'group'
+SEMR_RESULTS_BATCH_SIZE = 100
+SEMR_RESULTS_FLUSH_INTERVAL = 0.5
+SEMR_RESULTS_MAX_PENDING = 10000
+
+# Storage for user assignments, case selections, and selection results
+# (SEMRinterface/storage.py): 'json' keeps them in each study's files, 'sqlite'
+# in an indexed WAL-mode SQLite database at SEMR_SQLITE_PATH. Existing studies
+# can be copied over with `python manage.py import_storage <study_id>`.
+SEMR_STORAGE_BACKEND = 'json'
+SEMR_SQLITE_PATH = DATABASES['default']['NAME']
+
+# Seconds between background checks of resources/ for added, removed, or
+# edited studies, whose manifests (SEMRinterface/manifest.py) are then rebuilt.
+# One worker process performs each check. Requests only read the manifests and
+# see no studies until the first check (made at startup) has built them. 0
+# disables the periodic check; run `python manage.py build_manifest` after
+# changing studies instead.
+SEMR_MANIFEST_REFRESH_INTERVAL = 30
+
+# In-memory cache of encoded /api/get_case_data/ bodies (bytes). When a case
+# is opened, SEMR_PREFETCH_WORKERS background threads build the reviewer's
+# next uncompleted case and the current case's next time step into it; at most
+# SEMR_PREFETCH_MAX_PENDING prefetches are queued. 0 workers disables prefetch.
+SEMR_CASE_PAYLOAD_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SEMR_PREFETCH_WORKERS = 2
+SEMR_PREFETCH_MAX_PENDING = 8
+
+# /api/analytics/ checkpoint (SEMRinterface/analytics.py): rewritten once this
+# many new results were folded, or this many seconds passed, since the last
+# write. Results after the checkpoint are read again on restart.
+SEMR_ANALYTICS_CHECKPOINT_RECORDS = 1000
+SEMR_ANALYTICS_CHECKPOINT_INTERVAL = 60
+
+# POST /api/get_case_data/batch/: threads loading cases, shared by all batch
+# requests (each keeps at most twice this many cases in flight), and the
+# maximum number of cases a request may ask for.
+SEMR_BATCH_WORKERS = 4
+SEMR_BATCH_MAX_CASES = 200
+
+# Text shown in the case viewer for each case_details.json `instruction_set`
+# when case data is requested with panels (SEMRinterface/panels.py). Defaults
+# to texts for the 'familiar' and 'select' sets used by the bundled studies.
+# SEMR_INSTRUCTION_SETS = {'familiar': '...', 'select': '...'}
+
+# Request latency, file I/O, JSON decode, and cache metrics
+# (SEMRinterface/metrics.py), served in Prometheus text format at /api/metrics/.
+# Set to False to skip per-request recording.
+SEMR_METRICS_ENABLED = True
+
+# Seconds between background runs of each health check (SEMRinterface/health.py);
+# /health/ and /api/health/ serve the latest results. Unlisted checks keep
+# their defaults.
+# SEMR_HEALTH_CHECK_INTERVALS = {'database': 10, 'resources': 30, 'disk_space': 60, 'memory': 15}
+
+# JSON codec for data files and JSON responses (SEMRinterface/jsoncodec.py):
+# 'auto' uses orjson when installed (pip install orjson) and the standard
+# library otherwise; 'orjson' requires it; 'json' forces the standard library.
+# SEMR_JSON_CODEC = 'auto'
+
+# Memory budget, in bytes of source files, for case observations and
+# medications kept in the compact array-backed form (SEMRinterface/series.py).
+# SEMR_SERIES_CACHE_MAX_BYTES = 128 * 1024 * 1024